@@ -7,6 +7,13 @@ import numpy as numpy
 import scipy as scipy
 import scipy.integrate
 
+try:
+    from ..contact_graph import to_contact_graph
+except ImportError:
+    from contact_graph import to_contact_graph
+from .ssa_engines import SSA_ENGINES, NodeStateIndex, TransmissionTerms
+from .recorders import TimeSeriesRecorder, XseriesLog, NodeGroupCounts, DataSeriesColumn
+
 
 ########################################################
 #@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@#
@@ -502,7 +509,7 @@ class SEIRSNetworkModel():
     A class to simulate the SEIRS Stochastic Network Model
     ======================================================
     Params: 
-            G               Network adjacency matrix (numpy array) or Networkx graph object.
+            G               Network adjacency matrix (numpy array), Networkx graph object or ContactGraph.
             beta            Rate of transmission (global interactions)
             beta_local      Rate(s) of transmission between adjacent individuals (optional)
             sigma           Rate of progression to infectious state (inverse of latent period)             
@@ -513,7 +520,7 @@ class SEIRSNetworkModel():
             nu              Rate of baseline birth                        
             p               Probability of individuals interacting with global population            
             
-            G_Q             Quarantine adjacency matrix (numpy array) or Networkx graph object.
+            G_Q             Quarantine adjacency matrix (numpy array), Networkx graph object or ContactGraph.
             beta_Q          Rate of transmission for isolated individuals (global interactions)
             beta_Q_local    Rate(s) of transmission (exposure) for adjacent isolated individuals (optional)              
             sigma_Q         Rate of progression to infectious state for isolated individuals               
@@ -538,19 +545,47 @@ class SEIRSNetworkModel():
             initQ_I         Initial number of isolated infectious individuals
             initQ_R         Initial number of isolated recovered individuals
                             (all remaining nodes initialized susceptible)   
+
+            engine          Stochastic simulation algorithm: 'direct' (Gillespie direct method, propensities rebuilt every event),
+                            'incremental' (direct method over a propensity sum tree updated only around the transitioned node),
+                            'next_reaction' (Gibson-Bruck next reaction method with an indexed priority queue),
+                            'rejection' (rejection-based SSA with propensity bounds)
+                            or 'tau_leaping' (approximate, many transitions per leap of adaptive size, see TauLeapingEngine);
+                            all but 'direct' need exponential_rates mode
+            engine_params   Dict of keyword arguments for the engine (e.g. {'epsilon': 0.03} for 'tau_leaping')
+
+            record_every    Record the data series only at every k-th event (1 records every event)
+            record_dt       Record the data series only at the first event past each multiple of this time step
+                            (None records every event, or every record_every-th); the final state is always recorded
+            series_chunk_size  Number of events per storage chunk of the data series (see TimeSeriesRecorder)
+
+    Data series (tseries, numS, numE, numI, numR, numF, numQ_E, numQ_I, N, numTested, numPositive) are exported once,
+    at the end of a run, as plain arrays that can be modified or reassigned. Reading them while a run is in progress
+    gives read-only views of the rows recorded so far; every read after new rows have been recorded first copies
+    those rows into the shared export (all rows when it has to grow), so such reads are not free.
     """
+
+    # Data series recorded at each event, readable as model attributes (e.g. model.numI). finalize_data_series exports
+    # them once at the end of a run as plain arrays; while a run is in progress, reading one returns a read-only view
+    # of the recorded rows, and the first read after new rows were recorded copies those rows (see data_series):
+    seriesNames = ['tseries', 'numS', 'numE', 'numI', 'numR', 'numF', 'numQ_E', 'numQ_I', 'N', 'numTested', 'numPositive']
+
     def __init__(self, G, beta, sigma, gamma,
                     mu_I=0, alpha=1.0, xi=0, mu_0=0, nu=0, f=0, p=0,  
                     beta_local=None, beta_pairwise_mode='infected', delta=None, delta_pairwise_mode=None,
                     G_Q=None, beta_Q=None, beta_Q_local=None, sigma_Q=None, gamma_Q=None, mu_Q=None, alpha_Q=None, delta_Q=None,
                     theta_E=0, theta_I=0, phi_E=0, phi_I=0, psi_E=1, psi_I=1, q=0, isolation_time=14,
                     initE=0, initI=0, initR=0, initF=0, initQ_E=0, initQ_I=0, 
-                    transition_mode='exponential_rates', node_groups=None, store_Xseries=False, seed=None):
+                    transition_mode='exponential_rates', node_groups=None, store_Xseries=False, seed=None, engine='direct', engine_params=None,
+                    record_every=1, record_dt=None, series_chunk_size=4096):
 
         if(seed is not None):
             numpy.random.seed(seed)
             self.seed = seed
 
+        assert(engine == 'direct' or engine in SSA_ENGINES), "Unknown engine "+str(engine)+" (expected 'direct' or one of "+str(list(SSA_ENGINES))+")."
+        assert(engine == 'direct' or transition_mode == 'exponential_rates'), "The "+str(engine)+" engine supports only the exponential_rates transition mode."
+
         #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
         # Model Parameters:
         #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
@@ -567,44 +602,21 @@ class SEIRSNetworkModel():
                             'initQ_E':initQ_E, 'initQ_I':initQ_I }
         self.update_parameters()
 
-        #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-        # Each node can undergo 4-6 transitions (sans vitality/re-susceptibility returns to S state),
-        # so there are ~numNodes*6 events/timesteps expected; initialize numNodes*6 timestep slots to start 
-        # (will be expanded during run if needed for some reason)
-        self.tseries    = numpy.zeros(6*self.numNodes)
-        self.numS       = numpy.zeros(6*self.numNodes)
-        self.numE       = numpy.zeros(6*self.numNodes)
-        self.numI       = numpy.zeros(6*self.numNodes)
-        self.numR       = numpy.zeros(6*self.numNodes)
-        self.numF       = numpy.zeros(6*self.numNodes)
-        self.numQ_E     = numpy.zeros(6*self.numNodes)
-        self.numQ_I     = numpy.zeros(6*self.numNodes)
-        self.N          = numpy.zeros(6*self.numNodes)
-
         #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
         # Initialize Timekeeping:
         #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
         self.t          = 0
         self.tmax       = 0 # will be set when run() is called
-        self.tidx       = 0
-        self.tseries[0] = 0
 
-        # Vectors holding the time that each node has been in a given state or in isolation:
-        self.timer_state     = numpy.zeros((self.numNodes,1))
+        # Vectors holding the time each node entered its current state (see timer_state) and the time spent in isolation:
+        self.stateEntryTime  = numpy.zeros((self.numNodes,1))
         self.timer_isolation = numpy.zeros(self.numNodes)
         self.isolationTime   = isolation_time
         
         #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
         # Initialize Counts of inidividuals with each state:
         #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-        self.numE[0]        = int(initE)
-        self.numI[0]        = int(initI)
-        self.numR[0]        = int(initR)
-        self.numF[0]        = int(initF)
-        self.numQ_E[0]      = int(initQ_E)
-        self.numQ_I[0]      = int(initQ_I)
-        self.numS[0]        = (self.numNodes - self.numE[0] - self.numI[0] - self.numR[0] - self.numQ_E[0] - self.numQ_I[0] - self.numF[0])
-        self.N[0]           = self.numNodes - self.numF[0]
+        initS = self.numNodes - int(initE) - int(initI) - int(initR) - int(initQ_E) - int(initQ_I) - int(initF)
 
         #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
         # Node states:
@@ -617,16 +629,19 @@ class SEIRSNetworkModel():
         self.Q_E        = 6
         self.Q_I        = 7
         
-        self.X = numpy.array( [self.S]*int(self.numS[0]) + [self.E]*int(self.numE[0]) + [self.I]*int(self.numI[0]) 
-                               + [self.R]*int(self.numR[0]) + [self.F]*int(self.numF[0])
-                               + [self.Q_E]*int(self.numQ_E[0]) + [self.Q_I]*int(self.numQ_I[0])
+        self.X = numpy.array( [self.S]*int(initS) + [self.E]*int(initE) + [self.I]*int(initI) 
+                               + [self.R]*int(initR) + [self.F]*int(initF)
+                               + [self.Q_E]*int(initQ_E) + [self.Q_I]*int(initQ_I)
                             ).reshape((self.numNodes,1))
         numpy.random.shuffle(self.X)
 
+        # Index of the nodes in each state and the compartment counts, updated on every state change (see set_node_state):
+        self.stateIndex = NodeStateIndex(self.X, numStates=self.Q_I+1)
+
         self.store_Xseries = store_Xseries
         if(store_Xseries):
-            self.Xseries        = numpy.zeros(shape=(6*self.numNodes, self.numNodes), dtype='uint8')
-            self.Xseries[0,:]   = self.X.T
+            # State history as a change log (see XseriesLog); Xseries[tidx] gives the states at data series row tidx:
+            self.Xseries = XseriesLog(self.X)
 
         self.transitions =  { 
                                 'StoE': {'currentState':self.S, 'newState':self.E},
@@ -643,14 +658,17 @@ class SEIRSNetworkModel():
                             }
 
         self.transition_mode = transition_mode
+        self.engine          = engine
+        self.engineParams    = engine_params if engine_params is not None else {}
 
         #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
         # Initialize other node metadata:
         #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
         self.tested      = numpy.array([False]*self.numNodes).reshape((self.numNodes,1))
         self.positive    = numpy.array([False]*self.numNodes).reshape((self.numNodes,1))
-        self.numTested   = numpy.zeros(6*self.numNodes) 
-        self.numPositive = numpy.zeros(6*self.numNodes) 
+        # Current numbers of tested/positive nodes, updated by set_tested/set_positive:
+        self.numTestedNodes   = 0
+        self.numPositiveNodes = 0
 
         self.testedInCurrentState = numpy.array([False]*self.numNodes).reshape((self.numNodes,1))
 
@@ -659,31 +677,27 @@ class SEIRSNetworkModel():
         #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
         # Initialize node subgroup data series:
         #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-        self.nodeGroupData = None
+        self.nodeGroupData   = None
+        self.nodeGroupCounts = None
         if(node_groups):
             self.nodeGroupData = {}
             for groupName, nodeList in node_groups.items():
                 self.nodeGroupData[groupName] = {'nodes':   numpy.array(nodeList),
                                                  'mask':    numpy.isin(range(self.numNodes), nodeList).reshape((self.numNodes,1))}
-                self.nodeGroupData[groupName]['numS']           = numpy.zeros(6*self.numNodes)
-                self.nodeGroupData[groupName]['numE']           = numpy.zeros(6*self.numNodes)
-                self.nodeGroupData[groupName]['numI']           = numpy.zeros(6*self.numNodes)
-                self.nodeGroupData[groupName]['numR']           = numpy.zeros(6*self.numNodes)
-                self.nodeGroupData[groupName]['numF']           = numpy.zeros(6*self.numNodes)
-                self.nodeGroupData[groupName]['numQ_E']         = numpy.zeros(6*self.numNodes)
-                self.nodeGroupData[groupName]['numQ_I']         = numpy.zeros(6*self.numNodes)
-                self.nodeGroupData[groupName]['N']              = numpy.zeros(6*self.numNodes)
-                self.nodeGroupData[groupName]['numPositive']    = numpy.zeros(6*self.numNodes)
-                self.nodeGroupData[groupName]['numTested']      = numpy.zeros(6*self.numNodes)
-                self.nodeGroupData[groupName]['numS'][0]        = numpy.count_nonzero(self.nodeGroupData[groupName]['mask']*self.X==self.S)
-                self.nodeGroupData[groupName]['numE'][0]        = numpy.count_nonzero(self.nodeGroupData[groupName]['mask']*self.X==self.E)
-                self.nodeGroupData[groupName]['numI'][0]        = numpy.count_nonzero(self.nodeGroupData[groupName]['mask']*self.X==self.I)
-                self.nodeGroupData[groupName]['numR'][0]        = numpy.count_nonzero(self.nodeGroupData[groupName]['mask']*self.X==self.R)
-                self.nodeGroupData[groupName]['numF'][0]        = numpy.count_nonzero(self.nodeGroupData[groupName]['mask']*self.X==self.F)
-                self.nodeGroupData[groupName]['numQ_E'][0]      = numpy.count_nonzero(self.nodeGroupData[groupName]['mask']*self.X==self.Q_E)
-                self.nodeGroupData[groupName]['numQ_I'][0]      = numpy.count_nonzero(self.nodeGroupData[groupName]['mask']*self.X==self.Q_I)
-                self.nodeGroupData[groupName]['N'][0]           = self.numNodes - self.numF[0]
+                # Number of group members that are alive at the start:
+                self.nodeGroupData[groupName]['numNodes']       = numpy.count_nonzero(self.nodeGroupData[groupName]['mask'] & (self.X!=self.F))
+            # Group labels and per-group counts, updated on every state change (see set_node_state):
+            self.nodeGroupCounts = NodeGroupCounts(node_groups, self.X, numStates=self.Q_I+1)
 
+        #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+        # Initialize data series storage (see data_series):
+        #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+        seriesFields = [(name, float) for name in self.seriesNames]
+        if(self.nodeGroupData):
+            numGroups     = self.nodeGroupCounts.numGroups
+            seriesFields += [('nodeGroupStateCounts', float, (numGroups, self.Q_I+1)), ('nodeGroupNumTested', float, (numGroups,)), ('nodeGroupNumPositive', float, (numGroups,))]
+        self.timeSeries = TimeSeriesRecorder(seriesFields, chunk_size=series_chunk_size, record_every=record_every, record_dt=record_dt)
+        self.record_data_series()
          
 #^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
 #^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
@@ -697,12 +711,17 @@ class SEIRSNetworkModel():
         # Adjacency matrix:
         if type(self.G)==numpy.ndarray:
             self.A = scipy.sparse.csr_matrix(self.G)
-        elif type(self.G)==networkx.classes.graph.Graph:
-            self.A = networkx.adj_matrix(self.G) # adj_matrix gives scipy.sparse csr_matrix
+            contacts = None
+        elif type(self.G)==networkx.classes.graph.Graph or hasattr(self.G, 'adj_matrix'):
+            contacts = to_contact_graph(self.G) # networkx graphs go through the ContactGraph cache: CSR adjacency and degrees are built once and shared between models
+            self.A = contacts.adj_matrix
         else:
-            raise BaseException("Input an adjacency matrix or networkx object only.")
+            raise BaseException("Input an adjacency matrix, networkx object or ContactGraph only.")
         self.numNodes   = int(self.A.shape[1])
-        self.degree     = numpy.asarray(self.node_degrees(self.A)).astype(float)
+        if contacts is not None:
+            self.degree = contacts.degree.reshape(self.numNodes, 1)
+        else:
+            self.degree = numpy.asarray(self.node_degrees(self.A)).astype(float)
         #----------------------------------------
         if(self.parameters['G_Q'] is None):
             self.G_Q = self.G # If no Q graph is provided, use G in its place
@@ -711,12 +730,17 @@ class SEIRSNetworkModel():
         # Quarantine Adjacency matrix:
         if type(self.G_Q)==numpy.ndarray:
             self.A_Q = scipy.sparse.csr_matrix(self.G_Q)
-        elif type(self.G_Q)==networkx.classes.graph.Graph:
-            self.A_Q = networkx.adj_matrix(self.G_Q) # adj_matrix gives scipy.sparse csr_matrix
+            contacts = None
+        elif type(self.G_Q)==networkx.classes.graph.Graph or hasattr(self.G_Q, 'adj_matrix'):
+            contacts = to_contact_graph(self.G_Q) # networkx graphs go through the ContactGraph cache: CSR adjacency and degrees are built once and shared between models
+            self.A_Q = contacts.adj_matrix
         else:
-            raise BaseException("Input an adjacency matrix or networkx object only.")
+            raise BaseException("Input an adjacency matrix, networkx object or ContactGraph only.")
         self.numNodes_Q   = int(self.A_Q.shape[1])
-        self.degree_Q     = numpy.asarray(self.node_degrees(self.A_Q)).astype(float)
+        if contacts is not None:
+            self.degree_Q = contacts.degree.reshape(self.numNodes_Q, 1)
+        else:
+            self.degree_Q = numpy.asarray(self.node_degrees(self.A_Q)).astype(float)
         #----------------------------------------
         assert(self.numNodes == self.numNodes_Q), "The normal and quarantine adjacency graphs must be of the same size."
 
@@ -898,6 +922,13 @@ class SEIRSNetworkModel():
         #----------------------------------------
         self.A_deltabeta          = scipy.sparse.csr_matrix.multiply(self.A_delta_pairwise, self.A_beta_pairwise)
         self.A_Q_deltabeta_Q      = scipy.sparse.csr_matrix.multiply(self.A_Q_delta_Q_pairwise, self.A_Q_beta_Q_pairwise)
+
+        #----------------------------------------
+        # The SSA engine (if any) and the cached transmission terms depend on the parameters above;
+        # they are rebuilt on the next iteration:
+        #----------------------------------------
+        self.ssaEngine         = None
+        self.transmissionTerms = None
     
 
 #^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
@@ -907,6 +938,27 @@ class SEIRSNetworkModel():
         return Amat.sum(axis=0).reshape(self.numNodes,1)   # sums of adj matrix cols
 
 
+#^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+#^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+    @property
+    def timer_state(self):
+        # Time each node has spent in its current state; only entry times are stored, 
+        # so advancing the clock does not touch every node:
+        return self.t - self.stateEntryTime
+
+    @timer_state.setter
+    def timer_state(self, timer_state):
+        self.stateEntryTime = self.t - numpy.asarray(timer_state, dtype=float).reshape((self.numNodes,1))
+
+#^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+    def update_ssa_engine(self, nodes):
+        # Let the SSA engine (if one is in use) catch up with changes to these nodes' states/flags:
+        if(self.ssaEngine is not None):
+            self.ssaEngine.update_nodes(nodes)
+
+
 #^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
 #^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
 
@@ -967,128 +1019,161 @@ class SEIRSNetworkModel():
         # and check to see if their computation is necessary before doing the multiplication
         #------------------------------------
 
-        self.transmissionTerms_I = numpy.zeros(shape=(self.numNodes,1))      
-        if(numpy.any(self.numI[self.tidx])):
-            self.transmissionTerms_I = numpy.asarray(scipy.sparse.csr_matrix.dot(self.A_deltabeta, self.X==self.I))
-
-        #------------------------------------
-
-        self.transmissionTerms_Q = numpy.zeros(shape=(self.numNodes,1))
-        if(numpy.any(self.numQ_I[self.tidx])):
-            self.transmissionTerms_Q = numpy.asarray(scipy.sparse.csr_matrix.dot(self.A_Q_deltabeta_Q, self.X==self.Q_I))
+        # The transmission terms A_deltabeta.(X==I) and A_Q_deltabeta_Q.(X==Q_I) are cached and updated
+        # as nodes enter or leave I and Q_I (see set_node_state):
+        if(self.transmissionTerms is None):
+            self.transmissionTerms = TransmissionTerms(self.X, {'I': (self.A_deltabeta, [self.I]),
+                                                                'Q': (self.A_Q_deltabeta_Q, [self.Q_I])}, numStates=self.Q_I+1)
+        self.transmissionTerms_I = self.transmissionTerms['I']
+        self.transmissionTerms_Q = self.transmissionTerms['Q']
 
         #------------------------------------
 
         numContacts_Q = numpy.zeros(shape=(self.numNodes,1))
-        if(numpy.any(self.positive) and (numpy.any(self.phi_E) or numpy.any(self.phi_I))):
+        if(self.numPositiveNodes > 0 and (numpy.any(self.phi_E) or numpy.any(self.phi_I))):
             numContacts_Q = numpy.asarray(scipy.sparse.csr_matrix.dot(self.A, ((self.positive)&(self.X!=self.R)&(self.X!=self.F))))
 
         #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-
-        propensities_StoE       = (self.alpha *
-                                    (self.p*((self.beta_global*self.numI[self.tidx] + self.q*self.beta_Q_global*self.numQ_I[self.tidx])/self.N[self.tidx])
-                                     + (1-self.p)*(numpy.divide(self.transmissionTerms_I, self.degree, out=numpy.zeros_like(self.degree), where=self.degree!=0)
-                                                  +numpy.divide(self.transmissionTerms_Q, self.degree_Q, out=numpy.zeros_like(self.degree_Q), where=self.degree_Q!=0)))
-                                  )*(self.X==self.S)
-
+        # Each propensity is nonzero only for the nodes in the transition's source state;
+        # fill in just those rows, taken from the state index, instead of masking all N nodes:
         #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-        if(self.transition_mode == 'time_in_state'):
+        propensities = numpy.zeros(shape=(self.numNodes, 11))
 
-            propensities_EtoI     = 1e5 * ((self.X==self.E) & numpy.greater(self.timer_state, 1/self.sigma))
+        numI      = self.stateIndex.count(self.I)
+        numQ_I    = self.stateIndex.count(self.Q_I)
+        N         = self.numNodes - self.stateIndex.count(self.F)
 
-            propensities_ItoR     = 1e5 * ((self.X==self.I) & numpy.greater(self.timer_state, 1/self.gamma) & numpy.greater_equal(self.rand_f, self.f))
+        nodes_S   = self.stateIndex.nodes(self.S)
+        nodes_E   = self.stateIndex.nodes(self.E)
+        nodes_I   = self.stateIndex.nodes(self.I)
+        nodes_R   = self.stateIndex.nodes(self.R)
+        nodes_Q_E = self.stateIndex.nodes(self.Q_E)
+        nodes_Q_I = self.stateIndex.nodes(self.Q_I)
 
-            propensities_ItoF     = 1e5 * ((self.X==self.I) & numpy.greater(self.timer_state, 1/self.mu_I) & numpy.less(self.rand_f, self.f))
+        fatal_I   = numpy.less(self.rand_f[nodes_I], self.f[nodes_I])
+        fatal_Q_I = numpy.less(self.rand_f[nodes_Q_I], self.f[nodes_Q_I])
 
-            propensities_EtoQE    = numpy.zeros_like(propensities_StoE)
+        #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-            propensities_ItoQI    = numpy.zeros_like(propensities_StoE)
+        if(nodes_S.shape[0] > 0):
+            degree_S   = self.degree[nodes_S]
+            degree_Q_S = self.degree_Q[nodes_S]
+            propensities[nodes_S, 0:1] = (self.alpha[nodes_S] *
+                                            (self.p[nodes_S]*((self.beta_global[nodes_S]*numI + self.q[nodes_S]*self.beta_Q_global[nodes_S]*numQ_I)/N)
+                                             + (1-self.p[nodes_S])*(numpy.divide(self.transmissionTerms_I[nodes_S], degree_S, out=numpy.zeros_like(degree_S), where=degree_S!=0)
+                                                                   +numpy.divide(self.transmissionTerms_Q[nodes_S], degree_Q_S, out=numpy.zeros_like(degree_Q_S), where=degree_Q_S!=0)))
+                                         )
 
-            propensities_QEtoQI   = 1e5 * ((self.X==self.Q_E) & numpy.greater(self.timer_state, 1/self.sigma_Q))
+        #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-            propensities_QItoR    = 1e5 * ((self.X==self.Q_I) & numpy.greater(self.timer_state, 1/self.gamma_Q) & numpy.greater_equal(self.rand_f, self.f))
+        if(self.transition_mode == 'time_in_state'):
 
-            propensities_QItoF    = 1e5 * ((self.X==self.Q_I) & numpy.greater(self.timer_state, 1/self.mu_Q) & numpy.less(self.rand_f, self.f))
+            timer_state = self.timer_state
 
-            propensities_RtoS     = 1e5 * ((self.X==self.R) & numpy.greater(self.timer_state, 1/self.xi))
+            propensities[nodes_E, 1:2]     = 1e5 * numpy.greater(timer_state[nodes_E], 1/self.sigma[nodes_E])
 
-            propensities__toS     = 1e5 * ((self.X!=self.F) & numpy.greater(self.timer_state, 1/self.nu))            
+            propensities[nodes_I, 2:3]     = 1e5 * (numpy.greater(timer_state[nodes_I], 1/self.gamma[nodes_I]) & ~fatal_I)
 
-        #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+            propensities[nodes_I, 3:4]     = 1e5 * (numpy.greater(timer_state[nodes_I], 1/self.mu_I[nodes_I]) & fatal_I)
 
-        else: # exponential_rates
+            # (no EtoQE and ItoQI transitions in this mode)
 
-            propensities_EtoI        = self.sigma * (self.X==self.E)
+            propensities[nodes_Q_E, 6:7]   = 1e5 * numpy.greater(timer_state[nodes_Q_E], 1/self.sigma_Q[nodes_Q_E])
 
-            propensities_ItoR        = self.gamma * ((self.X==self.I) & (numpy.greater_equal(self.rand_f, self.f)))
+            propensities[nodes_Q_I, 7:8]   = 1e5 * (numpy.greater(timer_state[nodes_Q_I], 1/self.gamma_Q[nodes_Q_I]) & ~fatal_Q_I)
 
-            propensities_ItoF        = self.mu_I * ((self.X==self.I) & (numpy.less(self.rand_f, self.f)))
+            propensities[nodes_Q_I, 8:9]   = 1e5 * (numpy.greater(timer_state[nodes_Q_I], 1/self.mu_Q[nodes_Q_I]) & fatal_Q_I)
 
-            propensities_EtoQE       = (self.theta_E + self.phi_E*numContacts_Q)*self.psi_E * (self.X==self.E)
+            propensities[nodes_R, 9:10]    = 1e5 * numpy.greater(timer_state[nodes_R], 1/self.xi[nodes_R])
 
-            propensities_ItoQI       = (self.theta_I + self.phi_I*numContacts_Q)*self.psi_I * (self.X==self.I)
+            propensities[:, 10:11]         = 1e5 * ((self.X!=self.F) & numpy.greater(timer_state, 1/self.nu))
 
-            propensities_QEtoQI      = self.sigma_Q * (self.X==self.Q_E)
+        #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-            propensities_QItoR       = self.gamma_Q * ((self.X==self.Q_I) & (numpy.greater_equal(self.rand_f, self.f)))
+        else: # exponential_rates
 
-            propensities_QItoF       = self.mu_Q * ((self.X==self.Q_I) & (numpy.less(self.rand_f, self.f)))
+            propensities[nodes_E, 1:2]     = self.sigma[nodes_E]
 
-            propensities_RtoS        = self.xi * (self.X==self.R)
+            propensities[nodes_I, 2:3]     = self.gamma[nodes_I] * ~fatal_I
 
-            propensities__toS        = self.nu * (self.X!=self.F)
+            propensities[nodes_I, 3:4]     = self.mu_I[nodes_I] * fatal_I
 
-        
+            propensities[nodes_E, 4:5]     = (self.theta_E[nodes_E] + self.phi_E[nodes_E]*numContacts_Q[nodes_E])*self.psi_E[nodes_E]
 
+            propensities[nodes_I, 5:6]     = (self.theta_I[nodes_I] + self.phi_I[nodes_I]*numContacts_Q[nodes_I])*self.psi_I[nodes_I]
 
+            propensities[nodes_Q_E, 6:7]   = self.sigma_Q[nodes_Q_E]
 
+            propensities[nodes_Q_I, 7:8]   = self.gamma_Q[nodes_Q_I] * ~fatal_Q_I
 
+            propensities[nodes_Q_I, 8:9]   = self.mu_Q[nodes_Q_I] * fatal_Q_I
 
+            propensities[nodes_R, 9:10]    = self.xi[nodes_R]
 
-            
+            if(numpy.any(self.nu)):
+                propensities[:, 10:11]     = self.nu * (self.X!=self.F)
 
         #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-        propensities = numpy.hstack([propensities_StoE, propensities_EtoI, 
-                                     propensities_ItoR, propensities_ItoF, 
-                                     propensities_EtoQE, propensities_ItoQI, propensities_QEtoQI, 
-                                     propensities_QItoR, propensities_QItoF,
-                                     propensities_RtoS, propensities__toS])
-
         columns = ['StoE', 'EtoI', 'ItoR', 'ItoF', 'EtoQE', 'ItoQI', 'QEtoQI', 'QItoR', 'QItoF', 'RtoS', '_toS']
 
         return propensities, columns
 
 
 #^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+#^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+    def set_node_state(self, node, state):
+        # All changes of node states go through here to keep the state index and counts in step with X:
+        if(self.store_Xseries):
+            self.Xseries.log(self.t, node, state)
+        oldState = self.X[node,0]
+        if(self.nodeGroupCounts is not None):
+            self.nodeGroupCounts.move(node, oldState, state)
+        self.X[node] = state
+        self.stateIndex.move(node, state)
+        if(self.transmissionTerms is not None):
+            self.transmissionTerms.move(node, oldState, state, self.X)
+
 #^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
 
     def set_isolation(self, node, isolate):
         # Move this node in/out of the appropriate isolation state:
         if(isolate == True):
             if(self.X[node] == self.E):
-                self.X[node] = self.Q_E
+                self.set_node_state(node, self.Q_E)
             elif(self.X[node] == self.I):
-                self.X[node] = self.Q_I
+                self.set_node_state(node, self.Q_I)
         elif(isolate == False):
             if(self.X[node] == self.Q_E):
-                self.X[node] = self.E
+                self.set_node_state(node, self.E)
             elif(self.X[node] == self.Q_I):
-                self.X[node] = self.I
+                self.set_node_state(node, self.I)
         # Reset the isolation timer:
         self.timer_isolation[node] = 0
+        self.update_ssa_engine(node)
 
 #^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
 
     def set_tested(self, node, tested):
+        delta = int(bool(tested)) - int(bool(self.tested[node]))
+        self.numTestedNodes += delta
+        if(self.nodeGroupCounts is not None):
+            self.nodeGroupCounts.update_tested(node, delta)
         self.tested[node] = tested
         self.testedInCurrentState[node] = tested
+        self.update_ssa_engine(node)
 
 #^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
 
     def set_positive(self, node, positive):
+        delta = int(bool(positive)) - int(bool(self.positive[node]))
+        self.numPositiveNodes += delta
+        if(self.nodeGroupCounts is not None):
+            self.nodeGroupCounts.update_positive(node, delta)
         self.positive[node] = positive
+        self.update_ssa_engine(node)
 
 #^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
 
@@ -1096,90 +1181,105 @@ class SEIRSNetworkModel():
         exposedNodes = numpy.random.choice(range(self.numNodes), size=num_new_exposures, replace=False)
         for exposedNode in exposedNodes:
             if(self.X[exposedNode]==self.S):
-                self.X[exposedNode] = self.E
+                self.set_node_state(exposedNode, self.E)
+        self.update_ssa_engine(exposedNodes)
 
 
 #^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
 #^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^   
 
-    def increase_data_series_length(self):
-        self.tseries     = numpy.pad(self.tseries, [(0, 6*self.numNodes)], mode='constant', constant_values=0)
-        self.numS        = numpy.pad(self.numS, [(0, 6*self.numNodes)], mode='constant', constant_values=0)
-        self.numE        = numpy.pad(self.numE, [(0, 6*self.numNodes)], mode='constant', constant_values=0)
-        self.numI        = numpy.pad(self.numI, [(0, 6*self.numNodes)], mode='constant', constant_values=0)
-        self.numR        = numpy.pad(self.numR, [(0, 6*self.numNodes)], mode='constant', constant_values=0)
-        self.numF        = numpy.pad(self.numF, [(0, 6*self.numNodes)], mode='constant', constant_values=0)
-        self.numQ_E      = numpy.pad(self.numQ_E, [(0, 6*self.numNodes)], mode='constant', constant_values=0)
-        self.numQ_I      = numpy.pad(self.numQ_I, [(0, 6*self.numNodes)], mode='constant', constant_values=0)
-        self.N           = numpy.pad(self.N, [(0, 6*self.numNodes)], mode='constant', constant_values=0)
-        self.numTested   = numpy.pad(self.numTested, [(0, 6*self.numNodes)], mode='constant', constant_values=0)
-        self.numPositive = numpy.pad(self.numPositive, [(0, 6*self.numNodes)], mode='constant', constant_values=0)
+    def record_data_series(self):
+        # Append the current counts (and node group counts, if any) as a new row of the data series:
+        stateCounts = self.stateIndex.counts
+        row = { 'tseries':      self.t,
+                'numS':         stateCounts[self.S],
+                'numE':         stateCounts[self.E],
+                'numI':         stateCounts[self.I],
+                'numR':         stateCounts[self.R],
+                'numF':         stateCounts[self.F],
+                'numQ_E':       stateCounts[self.Q_E],
+                'numQ_I':       stateCounts[self.Q_I],
+                'N':            numpy.clip((self.numNodes - stateCounts[self.F]), a_min=0, a_max=self.numNodes),
+                'numTested':    self.numTestedNodes,
+                'numPositive':  self.numPositiveNodes }
 
         if(self.store_Xseries):
-            self.Xseries = numpy.pad(self.Xseries, [(0, 6*self.numNodes), (0,0)], mode='constant', constant_values=0)
+            self.Xseries.mark()
 
         if(self.nodeGroupData):
-            for groupName in self.nodeGroupData:
-                self.nodeGroupData[groupName]['numS']        = numpy.pad(self.nodeGroupData[groupName]['numS'], [(0, 6*self.numNodes)], mode='constant', constant_values=0)
-                self.nodeGroupData[groupName]['numE']        = numpy.pad(self.nodeGroupData[groupName]['numE'], [(0, 6*self.numNodes)], mode='constant', constant_values=0)
-                self.nodeGroupData[groupName]['numI']        = numpy.pad(self.nodeGroupData[groupName]['numI'], [(0, 6*self.numNodes)], mode='constant', constant_values=0)
-                self.nodeGroupData[groupName]['numR']        = numpy.pad(self.nodeGroupData[groupName]['numR'], [(0, 6*self.numNodes)], mode='constant', constant_values=0)
-                self.nodeGroupData[groupName]['numF']        = numpy.pad(self.nodeGroupData[groupName]['numF'], [(0, 6*self.numNodes)], mode='constant', constant_values=0)
-                self.nodeGroupData[groupName]['numQ_E']      = numpy.pad(self.nodeGroupData[groupName]['numQ_E'], [(0, 6*self.numNodes)], mode='constant', constant_values=0)
-                self.nodeGroupData[groupName]['numQ_I']      = numpy.pad(self.nodeGroupData[groupName]['numQ_I'], [(0, 6*self.numNodes)], mode='constant', constant_values=0)
-                self.nodeGroupData[groupName]['N']           = numpy.pad(self.nodeGroupData[groupName]['N'], [(0, 6*self.numNodes)], mode='constant', constant_values=0)
-                self.nodeGroupData[groupName]['numTested']   = numpy.pad(self.nodeGroupData[groupName]['numTested'], [(0, 6*self.numNodes)], mode='constant', constant_values=0)
-                self.nodeGroupData[groupName]['numPositive'] = numpy.pad(self.nodeGroupData[groupName]['numPositive'], [(0, 6*self.numNodes)], mode='constant', constant_values=0)
-
-        return None
+            numGroups = self.nodeGroupCounts.numGroups
+            row['nodeGroupStateCounts'] = self.nodeGroupCounts.stateCounts[:numGroups]
+            row['nodeGroupNumTested']   = self.nodeGroupCounts.numTested[:numGroups]
+            row['nodeGroupNumPositive'] = self.nodeGroupCounts.numPositive[:numGroups]
+
+        self.timeSeries.record(row)
+
+#^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+    def data_series(self):
+        """
+        All recorded rows as one structured array with a column per series ('tseries', 'numS', ..., and for node groups
+        'nodeGroupStateCounts' (groups x states), 'nodeGroupNumTested' and 'nodeGroupNumPositive'). While a run is in
+        progress the model attributes tseries, numS, ... are views of its columns; the array is read-only (it is shared
+        by all readers).
+        """
+        return self.timeSeries.to_array()
+
+    def export_node_group_series(self):
+        # Fill the per-group series in nodeGroupData (read-only views of the node group columns of the data series):
+        series = self.data_series()
+        for groupIdx, groupName in enumerate(self.nodeGroupCounts.groupNames):
+            groupData   = self.nodeGroupData[groupName]
+            stateCounts = series['nodeGroupStateCounts'][:, groupIdx]
+            groupData['numS']           = stateCounts[:, self.S]
+            groupData['numE']           = stateCounts[:, self.E]
+            groupData['numI']           = stateCounts[:, self.I]
+            groupData['numR']           = stateCounts[:, self.R]
+            groupData['numF']           = stateCounts[:, self.F]
+            groupData['numQ_E']         = stateCounts[:, self.Q_E]
+            groupData['numQ_I']         = stateCounts[:, self.Q_I]
+            groupData['N']              = numpy.full(series.shape[0], groupData['numNodes'], dtype=float)
+            groupData['numTested']      = series['nodeGroupNumTested'][:, groupIdx]
+            groupData['numPositive']    = series['nodeGroupNumPositive'][:, groupIdx]
+
+    tseries     = DataSeriesColumn('tseries')
+    numS        = DataSeriesColumn('numS')
+    numE        = DataSeriesColumn('numE')
+    numI        = DataSeriesColumn('numI')
+    numR        = DataSeriesColumn('numR')
+    numF        = DataSeriesColumn('numF')
+    numQ_E      = DataSeriesColumn('numQ_E')
+    numQ_I      = DataSeriesColumn('numQ_I')
+    N           = DataSeriesColumn('N')
+    numTested   = DataSeriesColumn('numTested')
+    numPositive = DataSeriesColumn('numPositive')
+
+    @property
+    def tidx(self):
+        # Index of the latest recorded row of the data series:
+        return len(self.timeSeries)-1
 
 #^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^ 
 
     def finalize_data_series(self):
-        self.tseries     = numpy.array(self.tseries, dtype=float)[:self.tidx+1]
-        self.numS        = numpy.array(self.numS, dtype=float)[:self.tidx+1]
-        self.numE        = numpy.array(self.numE, dtype=float)[:self.tidx+1]
-        self.numI        = numpy.array(self.numI, dtype=float)[:self.tidx+1]
-        self.numR        = numpy.array(self.numR, dtype=float)[:self.tidx+1]
-        self.numF        = numpy.array(self.numF, dtype=float)[:self.tidx+1]
-        self.numQ_E      = numpy.array(self.numQ_E, dtype=float)[:self.tidx+1]
-        self.numQ_I      = numpy.array(self.numQ_I, dtype=float)[:self.tidx+1]
-        self.N           = numpy.array(self.N, dtype=float)[:self.tidx+1]
-        self.numTested   = numpy.array(self.numTested, dtype=float)[:self.tidx+1]
-        self.numPositive = numpy.array(self.numPositive, dtype=float)[:self.tidx+1]
-
-        if(self.store_Xseries):
-            self.Xseries = self.Xseries[:self.tidx+1, :]
-
+        # Make sure the final state is recorded even if thinning skipped the last event, and export the series
+        # once per run: tseries, numS, ... become plain (writable) instance attributes, and the node group series
+        # in nodeGroupData are filled:
+        if(self.timeSeries.last('tseries') != self.t):
+            self.record_data_series()
+        series = self.data_series()
+        for name in self.seriesNames:
+            setattr(self, name, series[name].copy())
         if(self.nodeGroupData):
-            for groupName in self.nodeGroupData:
-                self.nodeGroupData[groupName]['numS']        = numpy.array(self.nodeGroupData[groupName]['numS'], dtype=float)[:self.tidx+1]
-                self.nodeGroupData[groupName]['numE']        = numpy.array(self.nodeGroupData[groupName]['numE'], dtype=float)[:self.tidx+1]
-                self.nodeGroupData[groupName]['numI']        = numpy.array(self.nodeGroupData[groupName]['numI'], dtype=float)[:self.tidx+1]
-                self.nodeGroupData[groupName]['numR']        = numpy.array(self.nodeGroupData[groupName]['numR'], dtype=float)[:self.tidx+1]
-                self.nodeGroupData[groupName]['numF']        = numpy.array(self.nodeGroupData[groupName]['numF'], dtype=float)[:self.tidx+1]
-                self.nodeGroupData[groupName]['numQ_E']      = numpy.array(self.nodeGroupData[groupName]['numQ_E'], dtype=float)[:self.tidx+1]
-                self.nodeGroupData[groupName]['numQ_I']      = numpy.array(self.nodeGroupData[groupName]['numQ_I'], dtype=float)[:self.tidx+1]
-                self.nodeGroupData[groupName]['N']           = numpy.array(self.nodeGroupData[groupName]['N'], dtype=float)[:self.tidx+1]
-                self.nodeGroupData[groupName]['numTested']   = numpy.array(self.nodeGroupData[groupName]['numTested'], dtype=float)[:self.tidx+1]
-                self.nodeGroupData[groupName]['numPositive'] = numpy.array(self.nodeGroupData[groupName]['numPositive'], dtype=float)[:self.tidx+1]
-
+            self.export_node_group_series()
         return None
 
 #^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
 #^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^     
 
-    def run_iteration(self):
-
-        if(self.tidx >= len(self.tseries)-1):
-            # Room has run out in the timeseries storage arrays; double the size of these arrays:
-            self.increase_data_series_length()
-
-        #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-        # Generate 2 random numbers uniformly distributed in (0,1)
-        #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-        r1 = numpy.random.rand()
-        r2 = numpy.random.rand()
+    def select_transition(self, r1, r2):
+        # Gillespie direct method: rebuild all propensities and pick the event by a cumulative sum over them.
+        # Returns (tau, transitionNode, transitionType), or None if no transition is possible.
 
         #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
         # Calculate propensities
@@ -1199,8 +1299,6 @@ class SEIRSNetworkModel():
             # Compute the time until the next event takes place
             #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
             tau = (1/alpha)*numpy.log(float(1/r1))
-            self.t += tau
-            self.timer_state += tau
 
             #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
             # Compute which event takes place
@@ -1209,94 +1307,115 @@ class SEIRSNetworkModel():
             transitionNode  = transitionIdx % self.numNodes
             transitionType  = transitionTypes[ int(transitionIdx/self.numNodes) ]
 
-            #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-            # Perform updates triggered by rate propensities:
-            #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-            assert(self.X[transitionNode] == self.transitions[transitionType]['currentState'] and self.X[transitionNode]!=self.F), "Assertion error: Node "+str(transitionNode)+" has unexpected current state "+str(self.X[transitionNode])+" given the intended transition of "+str(transitionType)+"."
-            self.X[transitionNode] = self.transitions[transitionType]['newState']
+            return tau, transitionNode, transitionType
 
-            self.testedInCurrentState[transitionNode] = False
+        return None
 
-            self.timer_state[transitionNode] = 0.0
+#^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
 
-            #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def apply_transition(self, transitionNode, transitionType):
+        # Move the node to the new state of the given transition and update the associated node metadata.
 
-            # Save information about infection events when they occur:
-            if(transitionType == 'StoE'):
-                transitionNode_GNbrs  = list(self.G[transitionNode])
-                transitionNode_GQNbrs = list(self.G_Q[transitionNode])
-                self.infectionsLog.append({ 't':                            self.t,
-                                            'infected_node':                transitionNode,
-                                            'infection_type':               transitionType,
-                                            'infected_node_degree':         self.degree[transitionNode],
-                                            'local_contact_nodes':          transitionNode_GNbrs,
-                                            'local_contact_node_states':    self.X[transitionNode_GNbrs].flatten(),
-                                            'isolation_contact_nodes':      transitionNode_GQNbrs,
-                                            'isolation_contact_node_states':self.X[transitionNode_GQNbrs].flatten() })
+        #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+        # Perform updates triggered by rate propensities:
+        #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+        assert(self.X[transitionNode] == self.transitions[transitionType]['currentState'] and self.X[transitionNode]!=self.F), "Assertion error: Node "+str(transitionNode)+" has unexpected current state "+str(self.X[transitionNode])+" given the intended transition of "+str(transitionType)+"."
+        self.set_node_state(transitionNode, self.transitions[transitionType]['newState'])
 
-            #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+        self.testedInCurrentState[transitionNode] = False
+
+        self.stateEntryTime[transitionNode] = self.t
+
+        #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+        # Save information about infection events when they occur:
+        if(transitionType == 'StoE'):
+            transitionNode_GNbrs  = list(self.G[transitionNode])
+            transitionNode_GQNbrs = list(self.G_Q[transitionNode])
+            self.infectionsLog.append({ 't':                            self.t,
+                                        'infected_node':                transitionNode,
+                                        'infection_type':               transitionType,
+                                        'infected_node_degree':         self.degree[transitionNode],
+                                        'local_contact_nodes':          transitionNode_GNbrs,
+                                        'local_contact_node_states':    self.X[transitionNode_GNbrs].flatten(),
+                                        'isolation_contact_nodes':      transitionNode_GQNbrs,
+                                        'isolation_contact_node_states':self.X[transitionNode_GQNbrs].flatten() })
+
+        #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+        if(transitionType in ['EtoQE', 'ItoQI'] and not self.positive[transitionNode]):
+            self.positive[transitionNode] = True
+            self.numPositiveNodes += 1
+            if(self.nodeGroupCounts is not None):
+                self.nodeGroupCounts.update_positive(transitionNode, 1)
+
+        self.update_ssa_engine(transitionNode)
 
-            if(transitionType in ['EtoQE', 'ItoQI']):
-                self.set_positive(node=transitionNode, positive=True)
+
+#^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+#^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+    def run_iteration(self):
 
         #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+        # Generate 2 random numbers uniformly distributed in (0,1)
+        #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+        r1 = numpy.random.rand()
+        r2 = numpy.random.rand()
 
+        #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+        # Select the next transition
+        #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+        if(self.engine == 'direct'):
+            transition = self.select_transition(r1, r2)
         else:
+            if(self.ssaEngine is None):
+                self.ssaEngine = SSA_ENGINES[self.engine](self, **self.engineParams)
+            transition = self.ssaEngine.select_transition(r1, r2)
 
-            tau = 0.01
+        if(transition is not None):
+
+            # One transition, or all transitions fired in one leap by the tau-leaping engine:
+            tau, transitionNodes, transitionTypes = transition
             self.t += tau
-            self.timer_state += tau
+
+            for transitionNode, transitionType in zip(numpy.atleast_1d(transitionNodes), numpy.atleast_1d(transitionTypes)):
+                self.apply_transition(transitionNode, str(transitionType))
 
         #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-        self.tidx += 1
-        
-        self.tseries[self.tidx]     = self.t
-        self.numS[self.tidx]        = numpy.clip(numpy.count_nonzero(self.X==self.S), a_min=0, a_max=self.numNodes)
-        self.numE[self.tidx]        = numpy.clip(numpy.count_nonzero(self.X==self.E), a_min=0, a_max=self.numNodes)
-        self.numI[self.tidx]        = numpy.clip(numpy.count_nonzero(self.X==self.I), a_min=0, a_max=self.numNodes)
-        self.numF[self.tidx]        = numpy.clip(numpy.count_nonzero(self.X==self.F), a_min=0, a_max=self.numNodes)
-        self.numQ_E[self.tidx]      = numpy.clip(numpy.count_nonzero(self.X==self.Q_E), a_min=0, a_max=self.numNodes)
-        self.numQ_I[self.tidx]      = numpy.clip(numpy.count_nonzero(self.X==self.Q_I), a_min=0, a_max=self.numNodes)
-        self.numTested[self.tidx]   = numpy.clip(numpy.count_nonzero(self.tested), a_min=0, a_max=self.numNodes)
-        self.numPositive[self.tidx] = numpy.clip(numpy.count_nonzero(self.positive), a_min=0, a_max=self.numNodes)
-        
-        self.N[self.tidx]           = numpy.clip((self.numNodes - self.numF[self.tidx]), a_min=0, a_max=self.numNodes)
+        else:
+
+            tau = 0.01
+            self.t += tau
+
+        #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
         #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
         # Update testing and isolation statuses
         #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-        isolatedNodes = numpy.argwhere((self.X==self.Q_E)|(self.X==self.Q_I))[:,0].flatten()
+        # (a copy, the index is reordered as nodes exit isolation below)
+        isolatedNodes = numpy.concatenate((self.stateIndex.nodes(self.Q_E), self.stateIndex.nodes(self.Q_I)))
         self.timer_isolation[isolatedNodes] = self.timer_isolation[isolatedNodes] + tau
 
-        nodesExitingIsolation = numpy.argwhere(self.timer_isolation >= self.isolationTime)
+        nodesExitingIsolation = isolatedNodes[self.timer_isolation[isolatedNodes] >= self.isolationTime]
         for isoNode in nodesExitingIsolation:
             self.set_isolation(node=isoNode, isolate=False)
 
         #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
         # Store system states
         #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-        if(self.store_Xseries):
-            self.Xseries[self.tidx,:] = self.X.T
-
-        if(self.nodeGroupData):
-            for groupName in self.nodeGroupData:
-                self.nodeGroupData[groupName]['numS'][self.tidx]        = numpy.count_nonzero(self.nodeGroupData[groupName]['mask']*self.X==self.S)
-                self.nodeGroupData[groupName]['numE'][self.tidx]        = numpy.count_nonzero(self.nodeGroupData[groupName]['mask']*self.X==self.E)
-                self.nodeGroupData[groupName]['numI'][self.tidx]        = numpy.count_nonzero(self.nodeGroupData[groupName]['mask']*self.X==self.I)
-                self.nodeGroupData[groupName]['numR'][self.tidx]        = numpy.count_nonzero(self.nodeGroupData[groupName]['mask']*self.X==self.R)
-                self.nodeGroupData[groupName]['numF'][self.tidx]        = numpy.count_nonzero(self.nodeGroupData[groupName]['mask']*self.X==self.F)
-                self.nodeGroupData[groupName]['numQ_E'][self.tidx]      = numpy.count_nonzero(self.nodeGroupData[groupName]['mask']*self.X==self.Q_E)
-                self.nodeGroupData[groupName]['numQ_I'][self.tidx]      = numpy.count_nonzero(self.nodeGroupData[groupName]['mask']*self.X==self.Q_I)
-                self.nodeGroupData[groupName]['N'][self.tidx]           = numpy.clip((self.nodeGroupData[groupName]['numS'][0] + self.nodeGroupData[groupName]['numE'][0] + self.nodeGroupData[groupName]['numI'][0] + self.nodeGroupData[groupName]['numQ_E'][0] + self.nodeGroupData[groupName]['numQ_I'][0] + self.nodeGroupData[groupName]['numR'][0]), a_min=0, a_max=self.numNodes)
-                self.nodeGroupData[groupName]['numTested'][self.tidx]   = numpy.count_nonzero(self.nodeGroupData[groupName]['mask']*self.tested)
-                self.nodeGroupData[groupName]['numPositive'][self.tidx] = numpy.count_nonzero(self.nodeGroupData[groupName]['mask']*self.positive)
+        if(self.timeSeries.due(self.t)):
+            self.record_data_series()
 
         #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
         # Terminate if tmax reached or num infections is 0:
         #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-        if(self.t >= self.tmax or (self.total_num_infected(self.tidx) < 1 and self.total_num_isolated(self.tidx) < 1)):
+        stateCounts = self.stateIndex.counts
+        numInfected = stateCounts[self.E] + stateCounts[self.I] + stateCounts[self.Q_E] + stateCounts[self.Q_I]
+        numIsolated = stateCounts[self.Q_E] + stateCounts[self.Q_I]
+        if(self.t >= self.tmax or (numInfected < 1 and numIsolated < 1)):
             self.finalize_data_series()
             return False
 
@@ -1314,6 +1433,10 @@ class SEIRSNetworkModel():
         else:
             return False
 
+        # Read the data series live again until this run is finalized (drops the arrays exported by the last run):
+        for name in self.seriesNames:
+            self.__dict__.pop(name, None)
+
         #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
         # Pre-process checkpoint values:
         #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
@@ -1366,13 +1489,13 @@ class SEIRSNetworkModel():
                         print("t = %.2f" % self.t)
                     if(verbose==True):
                         print("t = %.2f" % self.t)
-                        print("\t S      = " + str(self.numS[self.tidx]))
-                        print("\t E      = " + str(self.numE[self.tidx]))
-                        print("\t I  = " + str(self.numI[self.tidx]))
-                        print("\t R      = " + str(self.numR[self.tidx]))
-                        print("\t F      = " + str(self.numF[self.tidx]))
-                        print("\t Q_E    = " + str(self.numQ_E[self.tidx]))
-                        print("\t Q_I  = " + str(self.numQ_I[self.tidx]))
+                        print("\t S      = " + str(self.stateIndex.count(self.S)))
+                        print("\t E      = " + str(self.stateIndex.count(self.E)))
+                        print("\t I  = " + str(self.stateIndex.count(self.I)))
+                        print("\t R      = " + str(self.stateIndex.count(self.R)))
+                        print("\t F      = " + str(self.stateIndex.count(self.F)))
+                        print("\t Q_E    = " + str(self.stateIndex.count(self.Q_E)))
+                        print("\t Q_I  = " + str(self.stateIndex.count(self.Q_I)))
                     print_reset = False
                 elif(not print_reset and (int(self.t) % 10 != 0)):
                     print_reset = True
@@ -1644,7 +1767,7 @@ class ExtSEIRSNetworkModel():
     A class to simulate the Extended SEIRS Stochastic Network Model
     ===================================================
     Params: 
-            G               Network adjacency matrix (numpy array) or Networkx graph object.
+            G               Network adjacency matrix (numpy array), Networkx graph object or ContactGraph.
             beta            Rate of transmission (global interactions)
             beta_local      Rate(s) of transmission between adjacent individuals (optional)
             beta_asym       Rate of transmission (global interactions)
@@ -1664,7 +1787,7 @@ class ExtSEIRSNetworkModel():
             f               Probability of death for hospitalized individuals (case fatality rate)                         
             p               Probability of individuals interacting with global population              
             
-            G_Q             Quarantine adjacency matrix (numpy array) or Networkx graph object.
+            G_Q             Quarantine adjacency matrix (numpy array), Networkx graph object or ContactGraph.
             beta_Q          Rate of transmission for isolated individuals (global interactions)
             beta_Q_local    Rate(s) of transmission (exposure) for adjacent isolated individuals (optional)              
             sigma_Q         Rate of progression to infectious state for isolated individuals           
@@ -1701,6 +1824,11 @@ class ExtSEIRSNetworkModel():
             initQ_asym      Initial number of isolated infectious asymptomatic individuals
             initQ_R         Initial number of isolated recovered individuals
                             (all remaining nodes initialized susceptible)   
+
+            engine          Stochastic simulation algorithm: 'direct' (Gillespie direct method, propensities rebuilt every event)
+                            or 'tau_leaping' (approximate, many transitions per leap of adaptive size, see TauLeapingEngine;
+                            needs exponential_rates mode)
+            engine_params   Dict of keyword arguments for the engine (e.g. {'epsilon': 0.03} for 'tau_leaping')
     """
     def __init__(self, G, beta, sigma, lamda, gamma, 
                     gamma_asym=None, eta=0, gamma_H=None, mu_H=0, alpha=1.0, xi=0, mu_0=0, nu=0, a=0, h=0, f=0, p=0,             
@@ -1711,12 +1839,15 @@ class ExtSEIRSNetworkModel():
                     initE=0, initI_pre=0, initI_sym=0, initI_asym=0, initH=0, initR=0, initF=0,        
                     initQ_S=0, initQ_E=0, initQ_pre=0, initQ_sym=0, initQ_asym=0, initQ_R=0,
                     o=0, prevalence_ext=0,
-                    transition_mode='exponential_rates', node_groups=None, store_Xseries=False, seed=None):
+                    transition_mode='exponential_rates', node_groups=None, store_Xseries=False, seed=None, engine='direct', engine_params=None):
 
         if(seed is not None):
             numpy.random.seed(seed)
             self.seed = seed
 
+        assert(engine in ['direct', 'tau_leaping']), "Unknown engine "+str(engine)+" (expected 'direct' or 'tau_leaping')."
+        assert(engine == 'direct' or transition_mode == 'exponential_rates'), "The "+str(engine)+" engine supports only the exponential_rates transition mode."
+
         #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
         # Model Parameters:
         #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
@@ -1821,8 +1952,9 @@ class ExtSEIRSNetworkModel():
 
         self.store_Xseries = store_Xseries
         if(store_Xseries):
-            self.Xseries        = numpy.zeros(shape=(6*self.numNodes, self.numNodes), dtype='uint8')
-            self.Xseries[0,:]   = self.X.T
+            # State history as a change log (see XseriesLog); Xseries[tidx] gives the states at tseries[tidx]:
+            self.Xseries = XseriesLog(self.X)
+            self.Xseries.mark()
 
         self.transitions =  { 
                                 'StoE':         {'currentState':self.S,       'newState':self.E},
@@ -1851,6 +1983,9 @@ class ExtSEIRSNetworkModel():
                             }
 
         self.transition_mode = transition_mode
+        self.engine          = engine
+        self.engineParams    = engine_params if engine_params is not None else {}
+        self.ssaEngine       = None
 
         #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
         # Initialize other node metadata:
@@ -1867,7 +2002,8 @@ class ExtSEIRSNetworkModel():
         #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
         # Initialize node subgroup data series:
         #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-        self.nodeGroupData = None
+        self.nodeGroupData   = None
+        self.nodeGroupCounts = None
         if(node_groups):
             self.nodeGroupData = {}
             for groupName, nodeList in node_groups.items():
@@ -1890,21 +2026,11 @@ class ExtSEIRSNetworkModel():
                 self.nodeGroupData[groupName]['N']              = numpy.zeros(6*self.numNodes)
                 self.nodeGroupData[groupName]['numPositive']    = numpy.zeros(6*self.numNodes)
                 self.nodeGroupData[groupName]['numTested']      = numpy.zeros(6*self.numNodes)
-                self.nodeGroupData[groupName]['numS'][0]        = numpy.count_nonzero(self.nodeGroupData[groupName]['mask']*self.X==self.S)
-                self.nodeGroupData[groupName]['numE'][0]        = numpy.count_nonzero(self.nodeGroupData[groupName]['mask']*self.X==self.E)
-                self.nodeGroupData[groupName]['numI_pre'][0]    = numpy.count_nonzero(self.nodeGroupData[groupName]['mask']*self.X==self.I_pre)
-                self.nodeGroupData[groupName]['numI_sym'][0]    = numpy.count_nonzero(self.nodeGroupData[groupName]['mask']*self.X==self.I_sym)
-                self.nodeGroupData[groupName]['numI_asym'][0]   = numpy.count_nonzero(self.nodeGroupData[groupName]['mask']*self.X==self.I_asym)
-                self.nodeGroupData[groupName]['numH'][0]        = numpy.count_nonzero(self.nodeGroupData[groupName]['mask']*self.X==self.H)
-                self.nodeGroupData[groupName]['numR'][0]        = numpy.count_nonzero(self.nodeGroupData[groupName]['mask']*self.X==self.R)
-                self.nodeGroupData[groupName]['numF'][0]        = numpy.count_nonzero(self.nodeGroupData[groupName]['mask']*self.X==self.F)
-                self.nodeGroupData[groupName]['numQ_S'][0]      = numpy.count_nonzero(self.nodeGroupData[groupName]['mask']*self.X==self.Q_E)
-                self.nodeGroupData[groupName]['numQ_E'][0]      = numpy.count_nonzero(self.nodeGroupData[groupName]['mask']*self.X==self.Q_E)
-                self.nodeGroupData[groupName]['numQ_pre'][0]    = numpy.count_nonzero(self.nodeGroupData[groupName]['mask']*self.X==self.Q_pre)
-                self.nodeGroupData[groupName]['numQ_I_sym'][0]  = numpy.count_nonzero(self.nodeGroupData[groupName]['mask']*self.X==self.Q_I_sym)
-                self.nodeGroupData[groupName]['numQ_I_asym'][0] = numpy.count_nonzero(self.nodeGroupData[groupName]['mask']*self.X==self.Q_I_asym)
-                self.nodeGroupData[groupName]['numQ_R'][0]      = numpy.count_nonzero(self.nodeGroupData[groupName]['mask']*self.X==self.Q_E)
-                self.nodeGroupData[groupName]['N'][0]           = self.numNodes - self.numF[0]
+                # Number of group members that are alive at the start:
+                self.nodeGroupData[groupName]['numNodes']       = numpy.count_nonzero(self.nodeGroupData[groupName]['mask'] & (self.X!=self.F))
+            # Group labels and per-group counts, updated on every state change (see set_node_state):
+            self.nodeGroupCounts = NodeGroupCounts(node_groups, self.X, numStates=self.Q_R+1)
+            self.record_node_group_data()
 
          
 #^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
@@ -1919,12 +2045,17 @@ class ExtSEIRSNetworkModel():
         # Adjacency matrix:
         if type(self.G)==numpy.ndarray:
             self.A = scipy.sparse.csr_matrix(self.G)
-        elif type(self.G)==networkx.classes.graph.Graph:
-            self.A = networkx.adj_matrix(self.G) # adj_matrix gives scipy.sparse csr_matrix
+            contacts = None
+        elif type(self.G)==networkx.classes.graph.Graph or hasattr(self.G, 'adj_matrix'):
+            contacts = to_contact_graph(self.G) # networkx graphs go through the ContactGraph cache: CSR adjacency and degrees are built once and shared between models
+            self.A = contacts.adj_matrix
         else:
-            raise BaseException("Input an adjacency matrix or networkx object only.")
+            raise BaseException("Input an adjacency matrix, networkx object or ContactGraph only.")
         self.numNodes   = int(self.A.shape[1])
-        self.degree     = numpy.asarray(self.node_degrees(self.A)).astype(float)
+        if contacts is not None:
+            self.degree = contacts.degree.reshape(self.numNodes, 1)
+        else:
+            self.degree = numpy.asarray(self.node_degrees(self.A)).astype(float)
         #----------------------------------------
         if(self.parameters['G_Q'] is None):
             self.G_Q = self.G # If no Q graph is provided, use G in its place
@@ -1933,12 +2064,17 @@ class ExtSEIRSNetworkModel():
         # Quarantine Adjacency matrix:
         if type(self.G_Q)==numpy.ndarray:
             self.A_Q = scipy.sparse.csr_matrix(self.G_Q)
-        elif type(self.G_Q)==networkx.classes.graph.Graph:
-            self.A_Q = networkx.adj_matrix(self.G_Q) # adj_matrix gives scipy.sparse csr_matrix
+            contacts = None
+        elif type(self.G_Q)==networkx.classes.graph.Graph or hasattr(self.G_Q, 'adj_matrix'):
+            contacts = to_contact_graph(self.G_Q) # networkx graphs go through the ContactGraph cache: CSR adjacency and degrees are built once and shared between models
+            self.A_Q = contacts.adj_matrix
         else:
-            raise BaseException("Input an adjacency matrix or networkx object only.")
+            raise BaseException("Input an adjacency matrix, networkx object or ContactGraph only.")
         self.numNodes_Q   = int(self.A_Q.shape[1])
-        self.degree_Q     = numpy.asarray(self.node_degrees(self.A_Q)).astype(float)
+        if contacts is not None:
+            self.degree_Q = contacts.degree.reshape(self.numNodes_Q, 1)
+        else:
+            self.degree_Q = numpy.asarray(self.node_degrees(self.A_Q)).astype(float)
         #----------------------------------------
         assert(self.numNodes == self.numNodes_Q), "The normal and quarantine adjacency graphs must be of the same size."
 
@@ -2180,6 +2316,11 @@ class ExtSEIRSNetworkModel():
             self.A_deltabeta_asym = scipy.sparse.csr_matrix.multiply(self.A_delta_pairwise, self.A_beta_asym_pairwise)
         else:
             self.A_deltabeta_asym = None
+
+        #----------------------------------------
+        # The cached transmission terms depend on the parameters above; they are rebuilt on the next iteration:
+        #----------------------------------------
+        self.transmissionTerms = None
     
 
 #^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
@@ -2251,26 +2392,31 @@ class ExtSEIRSNetworkModel():
         # and check to see if their computation is necessary before doing the multiplication
         #------------------------------------
 
-        self.transmissionTerms_I = numpy.zeros(shape=(self.numNodes,1))      
-        if(numpy.any(self.numI_sym[self.tidx]) or numpy.any(self.numI_asym[self.tidx]) or numpy.any(self.numI_pre[self.tidx])):
+        # The transmission terms are cached and updated as nodes enter or leave the infectious states (see set_node_state):
+        if(self.transmissionTerms is None):
+            terms = {'Q':  (self.A_Q_deltabeta_Q, [self.Q_pre, self.Q_sym, self.Q_asym]),
+                     'IQ': (self.A_Q_deltabeta_Q, [self.I_pre, self.I_sym, self.I_asym])}
             if(self.A_deltabeta_asym is not None):
-                self.transmissionTerms_sym  = numpy.asarray(scipy.sparse.csr_matrix.dot(self.A_deltabeta, self.X==self.I_sym))
-                self.transmissionTerms_asym = numpy.asarray(scipy.sparse.csr_matrix.dot(self.A_deltabeta_asym, ((self.X==self.I_pre)|(self.X==self.I_asym))))
-                self.transmissionTerms_I    = self.transmissionTerms_sym+self.transmissionTerms_asym
+                terms['sym']  = (self.A_deltabeta, [self.I_sym])
+                terms['asym'] = (self.A_deltabeta_asym, [self.I_pre, self.I_asym])
             else:
-                self.transmissionTerms_I    = numpy.asarray(scipy.sparse.csr_matrix.dot(self.A_deltabeta, ((self.X==self.I_sym)|(self.X==self.I_pre)|(self.X==self.I_asym))))
+                terms['I']    = (self.A_deltabeta, [self.I_pre, self.I_sym, self.I_asym])
+            self.transmissionTerms = TransmissionTerms(self.X, terms, numStates=self.Q_R+1)
+
+        if(self.A_deltabeta_asym is not None):
+            self.transmissionTerms_sym  = self.transmissionTerms['sym']
+            self.transmissionTerms_asym = self.transmissionTerms['asym']
+            self.transmissionTerms_I    = self.transmissionTerms_sym+self.transmissionTerms_asym
+        else:
+            self.transmissionTerms_I    = self.transmissionTerms['I']
 
         #------------------------------------
 
-        self.transmissionTerms_Q = numpy.zeros(shape=(self.numNodes,1))
-        if(numpy.any(self.numQ_pre[self.tidx]) or numpy.any(self.numQ_sym[self.tidx]) or numpy.any(self.numQ_asym[self.tidx])):
-            self.transmissionTerms_Q = numpy.asarray(scipy.sparse.csr_matrix.dot(self.A_Q_deltabeta_Q, ((self.X==self.Q_pre)|(self.X==self.Q_sym)|(self.X==self.Q_asym))))
+        self.transmissionTerms_Q  = self.transmissionTerms['Q']
 
         #------------------------------------
 
-        self.transmissionTerms_IQ = numpy.zeros(shape=(self.numNodes,1))      
-        if(numpy.any(self.numQ_S[self.tidx]) and (numpy.any(self.numI_sym[self.tidx]) or numpy.any(self.numI_asym[self.tidx]) or numpy.any(self.numI_pre[self.tidx]))):
-            self.transmissionTerms_IQ = numpy.asarray(scipy.sparse.csr_matrix.dot(self.A_Q_deltabeta_Q, ((self.X==self.I_sym)|(self.X==self.I_pre)|(self.X==self.I_asym))))
+        self.transmissionTerms_IQ = self.transmissionTerms['IQ']
 
         #------------------------------------
 
@@ -2409,48 +2555,65 @@ class ExtSEIRSNetworkModel():
 
 
 #^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+#^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+    def set_node_state(self, node, state):
+        # All changes of node states go through here (to log them in Xseries if stored):
+        if(self.store_Xseries):
+            self.Xseries.log(self.t, node, state)
+        oldState = self.X[node,0]
+        if(self.nodeGroupCounts is not None):
+            self.nodeGroupCounts.move(node, oldState, state)
+        self.X[node] = state
+        if(self.transmissionTerms is not None):
+            self.transmissionTerms.move(node, oldState, state, self.X)
+
 #^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
 
     def set_isolation(self, node, isolate):
         # Move this node in/out of the appropriate isolation state:
         if(isolate == True):
             if(self.X[node] == self.S):
-                self.X[node] = self.Q_S
+                self.set_node_state(node, self.Q_S)
             elif(self.X[node] == self.E):
-                self.X[node] = self.Q_E
+                self.set_node_state(node, self.Q_E)
             elif(self.X[node] == self.I_pre):
-                self.X[node] = self.Q_pre
+                self.set_node_state(node, self.Q_pre)
             elif(self.X[node] == self.I_sym):
-                self.X[node] = self.Q_sym
+                self.set_node_state(node, self.Q_sym)
             elif(self.X[node] == self.I_asym):
-                self.X[node] = self.Q_asym
+                self.set_node_state(node, self.Q_asym)
             elif(self.X[node] == self.R):
-                self.X[node] = self.Q_R
+                self.set_node_state(node, self.Q_R)
         elif(isolate == False):
             if(self.X[node] == self.Q_S):
-                self.X[node] = self.S
+                self.set_node_state(node, self.S)
             elif(self.X[node] == self.Q_E):
-                self.X[node] = self.E
+                self.set_node_state(node, self.E)
             elif(self.X[node] == self.Q_pre):
-                self.X[node] = self.I_pre
+                self.set_node_state(node, self.I_pre)
             elif(self.X[node] == self.Q_sym):
-                self.X[node] = self.I_sym
+                self.set_node_state(node, self.I_sym)
             elif(self.X[node] == self.Q_asym):
-                self.X[node] = self.I_asym
+                self.set_node_state(node, self.I_asym)
             elif(self.X[node] == self.Q_R):
-                self.X[node] = self.R
+                self.set_node_state(node, self.R)
         # Reset the isolation timer:
         self.timer_isolation[node] = 0
 
 #^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
 
     def set_tested(self, node, tested):
+        if(self.nodeGroupCounts is not None):
+            self.nodeGroupCounts.update_tested(node, int(bool(tested)) - int(bool(self.tested[node])))
         self.tested[node] = tested
         self.testedInCurrentState[node] = tested
 
 #^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
 
     def set_positive(self, node, positive):
+        if(self.nodeGroupCounts is not None):
+            self.nodeGroupCounts.update_positive(node, int(bool(positive)) - int(bool(self.positive[node])))
         self.positive[node] = positive
 
 #^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
@@ -2459,14 +2622,39 @@ class ExtSEIRSNetworkModel():
         exposedNodes = numpy.random.choice(range(self.numNodes), size=num_new_exposures, replace=False)
         for exposedNode in exposedNodes:
             if(self.X[exposedNode]==self.S):
-                self.X[exposedNode] = self.E
+                self.set_node_state(exposedNode, self.E)
             elif(self.X[exposedNode]==self.Q_S):
-                self.X[exposedNode] = self.Q_E
+                self.set_node_state(exposedNode, self.Q_E)
 
 
 #^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
 #^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^   
 
+    def record_node_group_data(self):
+        # Copy the running per-group counts into the node group data series at tidx:
+        for groupIdx, groupName in enumerate(self.nodeGroupCounts.groupNames):
+            groupData   = self.nodeGroupData[groupName]
+            stateCounts = self.nodeGroupCounts.stateCounts[groupIdx]
+            groupData['numS'][self.tidx]        = stateCounts[self.S]
+            groupData['numE'][self.tidx]        = stateCounts[self.E]
+            groupData['numI_pre'][self.tidx]    = stateCounts[self.I_pre]
+            groupData['numI_sym'][self.tidx]    = stateCounts[self.I_sym]
+            groupData['numI_asym'][self.tidx]   = stateCounts[self.I_asym]
+            groupData['numH'][self.tidx]        = stateCounts[self.H]
+            groupData['numR'][self.tidx]        = stateCounts[self.R]
+            groupData['numF'][self.tidx]        = stateCounts[self.F]
+            groupData['numQ_S'][self.tidx]      = stateCounts[self.Q_S]
+            groupData['numQ_E'][self.tidx]      = stateCounts[self.Q_E]
+            groupData['numQ_pre'][self.tidx]    = stateCounts[self.Q_pre]
+            groupData['numQ_sym'][self.tidx]    = stateCounts[self.Q_sym]
+            groupData['numQ_asym'][self.tidx]   = stateCounts[self.Q_asym]
+            groupData['numQ_R'][self.tidx]      = stateCounts[self.Q_R]
+            groupData['N'][self.tidx]           = groupData['numNodes']
+            groupData['numTested'][self.tidx]   = self.nodeGroupCounts.numTested[groupIdx]
+            groupData['numPositive'][self.tidx] = self.nodeGroupCounts.numPositive[groupIdx]
+
+#^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
     def increase_data_series_length(self):
         self.tseries     = numpy.pad(self.tseries, [(0, 6*self.numNodes)], mode='constant', constant_values=0)
         self.numS        = numpy.pad(self.numS, [(0, 6*self.numNodes)], mode='constant', constant_values=0)
@@ -2487,9 +2675,6 @@ class ExtSEIRSNetworkModel():
         self.numTested   = numpy.pad(self.numTested, [(0, 6*self.numNodes)], mode='constant', constant_values=0)
         self.numPositive = numpy.pad(self.numPositive, [(0, 6*self.numNodes)], mode='constant', constant_values=0)
 
-        if(self.store_Xseries):
-            self.Xseries = numpy.pad(self.Xseries, [(0, 6*self.numNodes), (0,0)], mode='constant', constant_values=0)
-
         if(self.nodeGroupData):
             for groupName in self.nodeGroupData:
                 self.nodeGroupData[groupName]['numS']        = numpy.pad(self.nodeGroupData[groupName]['numS'], [(0, 6*self.numNodes)], mode='constant', constant_values=0)
@@ -2534,9 +2719,6 @@ class ExtSEIRSNetworkModel():
         self.numTested   = numpy.array(self.numTested, dtype=float)[:self.tidx+1]
         self.numPositive = numpy.array(self.numPositive, dtype=float)[:self.tidx+1]
 
-        if(self.store_Xseries):
-            self.Xseries = self.Xseries[:self.tidx+1, :]
-
         if(self.nodeGroupData):
             for groupName in self.nodeGroupData:
                 self.nodeGroupData[groupName]['numS']        = numpy.array(self.nodeGroupData[groupName]['numS'], dtype=float)[:self.tidx+1]
@@ -2561,17 +2743,9 @@ class ExtSEIRSNetworkModel():
 #^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
 #^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^     
 
-    def run_iteration(self):
-
-        if(self.tidx >= len(self.tseries)-1):
-            # Room has run out in the timeseries storage arrays; double the size of these arrays:
-            self.increase_data_series_length()
-
-        #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-        # Generate 2 random numbers uniformly distributed in (0,1)
-        #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-        r1 = numpy.random.rand()
-        r2 = numpy.random.rand()
+    def select_transition(self, r1, r2):
+        # Gillespie direct method: rebuild all propensities and pick the event by a cumulative sum over them.
+        # Returns (tau, transitionNode, transitionType), or None if no transition is possible.
 
         #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
         # Calculate propensities
@@ -2591,8 +2765,6 @@ class ExtSEIRSNetworkModel():
             # Compute the time until the next event takes place
             #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
             tau = (1/alpha)*numpy.log(float(1/r1))
-            self.t += tau
-            self.timer_state += tau
 
             #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
             # Compute which event takes place
@@ -2601,35 +2773,79 @@ class ExtSEIRSNetworkModel():
             transitionNode  = transitionIdx % self.numNodes
             transitionType  = transitionTypes[ int(transitionIdx/self.numNodes) ]
 
-            #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-            # Perform updates triggered by rate propensities:
-            #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-            assert(self.X[transitionNode] == self.transitions[transitionType]['currentState'] and self.X[transitionNode]!=self.F), "Assertion error: Node "+str(transitionNode)+" has unexpected current state "+str(self.X[transitionNode])+" given the intended transition of "+str(transitionType)+"."
-            self.X[transitionNode] = self.transitions[transitionType]['newState']
+            return tau, transitionNode, transitionType
 
-            self.testedInCurrentState[transitionNode] = False
+        return None
+
+#^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
 
-            self.timer_state[transitionNode] = 0.0
+    def apply_transition(self, transitionNode, transitionType):
+        # Move the node to the new state of the given transition and update the associated node metadata.
 
-            #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+        #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+        # Perform updates triggered by rate propensities:
+        #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+        assert(self.X[transitionNode] == self.transitions[transitionType]['currentState'] and self.X[transitionNode]!=self.F), "Assertion error: Node "+str(transitionNode)+" has unexpected current state "+str(self.X[transitionNode])+" given the intended transition of "+str(transitionType)+"."
+        self.set_node_state(transitionNode, self.transitions[transitionType]['newState'])
 
-            # Save information about infection events when they occur:
-            if(transitionType == 'StoE' or transitionType == 'QStoQE'):
-                transitionNode_GNbrs  = list(self.G[transitionNode].keys())
-                transitionNode_GQNbrs = list(self.G_Q[transitionNode].keys())
-                self.infectionsLog.append({ 't':                            self.t,
-                                            'infected_node':                transitionNode,
-                                            'infection_type':               transitionType,
-                                            'infected_node_degree':         self.degree[transitionNode],
-                                            'local_contact_nodes':          transitionNode_GNbrs,
-                                            'local_contact_node_states':    self.X[transitionNode_GNbrs].flatten(),
-                                            'isolation_contact_nodes':      transitionNode_GQNbrs,
-                                            'isolation_contact_node_states':self.X[transitionNode_GQNbrs].flatten() })
+        self.testedInCurrentState[transitionNode] = False
 
-            #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+        self.timer_state[transitionNode] = 0.0
+
+        #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-            if(transitionType in ['EtoQE', 'IPREtoQPRE', 'ISYMtoQSYM', 'IASYMtoQASYM', 'ISYMtoH']):
-                self.set_positive(node=transitionNode, positive=True)
+        # Save information about infection events when they occur:
+        if(transitionType == 'StoE' or transitionType == 'QStoQE'):
+            transitionNode_GNbrs  = list(self.G[transitionNode].keys())
+            transitionNode_GQNbrs = list(self.G_Q[transitionNode].keys())
+            self.infectionsLog.append({ 't':                            self.t,
+                                        'infected_node':                transitionNode,
+                                        'infection_type':               transitionType,
+                                        'infected_node_degree':         self.degree[transitionNode],
+                                        'local_contact_nodes':          transitionNode_GNbrs,
+                                        'local_contact_node_states':    self.X[transitionNode_GNbrs].flatten(),
+                                        'isolation_contact_nodes':      transitionNode_GQNbrs,
+                                        'isolation_contact_node_states':self.X[transitionNode_GQNbrs].flatten() })
+
+        #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+        if(transitionType in ['EtoQE', 'IPREtoQPRE', 'ISYMtoQSYM', 'IASYMtoQASYM', 'ISYMtoH']):
+            self.set_positive(node=transitionNode, positive=True)
+
+#^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+#^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+    def run_iteration(self):
+
+        if(self.tidx >= len(self.tseries)-1):
+            # Room has run out in the timeseries storage arrays; double the size of these arrays:
+            self.increase_data_series_length()
+
+        #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+        # Generate 2 random numbers uniformly distributed in (0,1)
+        #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+        r1 = numpy.random.rand()
+        r2 = numpy.random.rand()
+
+        #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+        # Select the next transition
+        #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+        if(self.engine == 'direct'):
+            transition = self.select_transition(r1, r2)
+        else:
+            if(self.ssaEngine is None):
+                self.ssaEngine = SSA_ENGINES[self.engine](self, **self.engineParams)
+            transition = self.ssaEngine.select_transition(r1, r2)
+
+        if(transition is not None):
+
+            # One transition, or all transitions fired in one leap by the tau-leaping engine:
+            tau, transitionNodes, transitionTypes = transition
+            self.t += tau
+            self.timer_state += tau
+
+            for transitionNode, transitionType in zip(numpy.atleast_1d(transitionNodes), numpy.atleast_1d(transitionTypes)):
+                self.apply_transition(transitionNode, str(transitionType))
 
         #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
@@ -2678,27 +2894,10 @@ class ExtSEIRSNetworkModel():
         # Store system states
         #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
         if(self.store_Xseries):
-            self.Xseries[self.tidx,:] = self.X.T
+            self.Xseries.mark()
 
         if(self.nodeGroupData):
-            for groupName in self.nodeGroupData:
-                self.nodeGroupData[groupName]['numS'][self.tidx]        = numpy.count_nonzero(self.nodeGroupData[groupName]['mask']*self.X==self.S)
-                self.nodeGroupData[groupName]['numE'][self.tidx]        = numpy.count_nonzero(self.nodeGroupData[groupName]['mask']*self.X==self.E)
-                self.nodeGroupData[groupName]['numI_pre'][self.tidx]    = numpy.count_nonzero(self.nodeGroupData[groupName]['mask']*self.X==self.I_pre)
-                self.nodeGroupData[groupName]['numI_sym'][self.tidx]    = numpy.count_nonzero(self.nodeGroupData[groupName]['mask']*self.X==self.I_sym)
-                self.nodeGroupData[groupName]['numI_asym'][self.tidx]   = numpy.count_nonzero(self.nodeGroupData[groupName]['mask']*self.X==self.I_asym)
-                self.nodeGroupData[groupName]['numH'][self.tidx]        = numpy.count_nonzero(self.nodeGroupData[groupName]['mask']*self.X==self.H)
-                self.nodeGroupData[groupName]['numR'][self.tidx]        = numpy.count_nonzero(self.nodeGroupData[groupName]['mask']*self.X==self.R)
-                self.nodeGroupData[groupName]['numF'][self.tidx]        = numpy.count_nonzero(self.nodeGroupData[groupName]['mask']*self.X==self.F)
-                self.nodeGroupData[groupName]['numQ_S'][self.tidx]      = numpy.count_nonzero(self.nodeGroupData[groupName]['mask']*self.X==self.Q_S)
-                self.nodeGroupData[groupName]['numQ_E'][self.tidx]      = numpy.count_nonzero(self.nodeGroupData[groupName]['mask']*self.X==self.Q_E)
-                self.nodeGroupData[groupName]['numQ_pre'][self.tidx]    = numpy.count_nonzero(self.nodeGroupData[groupName]['mask']*self.X==self.Q_pre)
-                self.nodeGroupData[groupName]['numQ_sym'][self.tidx]    = numpy.count_nonzero(self.nodeGroupData[groupName]['mask']*self.X==self.Q_sym)
-                self.nodeGroupData[groupName]['numQ_asym'][self.tidx]   = numpy.count_nonzero(self.nodeGroupData[groupName]['mask']*self.X==self.Q_asym)
-                self.nodeGroupData[groupName]['numQ_R'][self.tidx]      = numpy.count_nonzero(self.nodeGroupData[groupName]['mask']*self.X==self.Q_R)
-                self.nodeGroupData[groupName]['N'][self.tidx]           = numpy.clip((self.nodeGroupData[groupName]['numS'][0] + self.nodeGroupData[groupName]['numE'][0] + self.nodeGroupData[groupName]['numI'][0] + self.nodeGroupData[groupName]['numQ_E'][0] + self.nodeGroupData[groupName]['numQ_I'][0] + self.nodeGroupData[groupName]['numR'][0]), a_min=0, a_max=self.numNodes)
-                self.nodeGroupData[groupName]['numTested'][self.tidx]   = numpy.count_nonzero(self.nodeGroupData[groupName]['mask']*self.tested)
-                self.nodeGroupData[groupName]['numPositive'][self.tidx] = numpy.count_nonzero(self.nodeGroupData[groupName]['mask']*self.positive)
+            self.record_node_group_data()
 
         #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
         # Terminate if tmax reached or num infections is 0:
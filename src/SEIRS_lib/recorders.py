@@ -0,0 +1,258 @@
+from __future__ import division
+
+import numpy as numpy
+
+
+########################################################
+#@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@#
+#@                                                    @#
+#@  DATA SERIES RECORDERS                             @#
+#@                                                    @#
+#@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@#
+########################################################
+
+class TimeSeriesRecorder():
+    """
+    Columnar time series storage for the network models.
+    ====================================================
+    Every field (e.g. 'tseries', 'numS', ...) is stored in its own array inside fixed-size chunks; when a chunk
+    is full a new one is allocated, so the rows recorded so far are never copied while the simulation runs.
+    to_array() exports all rows as one contiguous structured array with a column per field. The export is kept
+    between calls and only the rows recorded since the previous call are copied into it (its capacity doubles
+    when full), so reading the series after every event costs amortized O(1) per row. The exported array is
+    shared by all readers and is therefore read-only.
+
+    Thinning: with record_every=k only every k-th call of due() asks for a row to be recorded, and with
+    record_dt=dt only the first event at or past each multiple of dt (a snapshot at the event's own time);
+    by default every event is recorded.
+
+    Params:
+            fields          List of (name, dtype) or (name, dtype, shape) tuples, as for numpy.dtype
+            chunk_size      Number of rows in one chunk
+            record_every    Record only every k-th event
+            record_dt       Record only the first event past each multiple of this time step
+    """
+    def __init__(self, fields, chunk_size=4096, record_every=1, record_dt=None):
+        self.dtype          = numpy.dtype(fields)
+        self.chunkSize      = int(chunk_size)
+        self.recordEvery    = max(int(record_every), 1)
+        self.recordDt       = record_dt
+        self.chunks         = []
+        self.numRows        = 0
+        self.numEvents      = 0
+        self.nextRecordTime = record_dt if record_dt is not None else 0 # (the first row is the initial state at t=0)
+        self.exported       = numpy.empty(0, dtype=self.dtype)
+        self.numExported    = 0
+
+    def __len__(self):
+        return self.numRows
+
+    #^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+    def due(self, t):
+        # Whether the event at time t is to be recorded under the thinning settings:
+        self.numEvents += 1
+        if(self.recordDt is not None):
+            if(t < self.nextRecordTime):
+                return False
+            self.nextRecordTime = (numpy.floor(t/self.recordDt)+1)*self.recordDt
+            return True
+        return (self.numEvents % self.recordEvery == 0)
+
+    #^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+    def record(self, values):
+        # Append one row given as a dict {field name: value} (fields left out are recorded as 0):
+        row = self.numRows % self.chunkSize
+        if(row == 0):
+            self.chunks.append({name: numpy.zeros((self.chunkSize,)+self.dtype[name].shape, dtype=self.dtype[name].base) for name in self.dtype.names})
+        chunk = self.chunks[-1]
+        for name, value in values.items():
+            chunk[name][row] = value
+        self.numRows  += 1
+
+    #^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+    def last(self, name):
+        # Most recently recorded value of a field:
+        return self.chunks[-1][name][(self.numRows-1) % self.chunkSize]
+
+    #^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+    def to_array(self):
+        if(self.numExported < self.numRows):
+            if(self.exported.shape[0] < self.numRows):
+                # Grow the export (rows exported so far are copied once per doubling):
+                exported = numpy.empty(max(self.numRows, 2*self.exported.shape[0]), dtype=self.dtype)
+                exported[:self.numExported] = self.exported[:self.numExported]
+                self.exported = exported
+            # Copy only the rows recorded since the last export:
+            for i in range(self.numExported//self.chunkSize, len(self.chunks)):
+                start = max(i*self.chunkSize, self.numExported)
+                end   = min((i+1)*self.chunkSize, self.numRows)
+                for name in self.dtype.names:
+                    self.exported[name][start:end] = self.chunks[i][name][start-i*self.chunkSize:end-i*self.chunkSize]
+            self.numExported = self.numRows
+        exported = self.exported[:self.numRows]
+        exported.setflags(write=False)
+        return exported
+
+
+#^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+#^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+class DataSeriesColumn():
+    """
+    Model attribute that reads one column of the model's data series (model.data_series()[name]) while it is
+    being recorded. It only defines __get__, so a plain instance attribute of the same name takes precedence:
+    finalize_data_series stores the exported columns that way, and the attribute can be assigned as usual.
+    """
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, model, owner=None):
+        if(model is None):
+            return self
+        return model.data_series()[self.name]
+
+
+#^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+#^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+class XseriesLog():
+    """
+    Node state history stored as a change log.
+    ==========================================
+    Instead of a full N-length state vector per recorded event, the log keeps the initial states, one
+    (t, node, old, new) entry per state change (in TimeSeriesRecorder chunks) and a keyframe (full copy of
+    the states) every keyframe_interval changes, so memory grows with the number of changes rather than
+    events*N. The states at any point are rebuilt from the nearest earlier keyframe by replaying at most
+    keyframe_interval changes.
+
+    mark() is called whenever the model records a row of its data series; log[i] then gives the states as
+    of row i (so model.Xseries[tidx] keeps its meaning), numpy.array(log) the full (rows, N) matrix, and
+    state_at(t) the states at an arbitrary time t.
+
+    Params:
+            X                   Initial node states
+            keyframe_interval   Number of changes between keyframes (default: number of nodes)
+            chunk_size          Number of changes per storage chunk
+    """
+    def __init__(self, X, keyframe_interval=None, chunk_size=4096):
+        self.current            = numpy.array(X, dtype='uint8').ravel()
+        self.numNodes           = self.current.shape[0]
+        self.keyframeInterval   = int(keyframe_interval) if keyframe_interval is not None else max(self.numNodes, 1)
+        self.changes            = TimeSeriesRecorder([('t', float), ('node', numpy.int64), ('old', 'uint8'), ('new', 'uint8')], chunk_size=chunk_size)
+        self.marks              = TimeSeriesRecorder([('numChanges', numpy.int64)], chunk_size=chunk_size)
+        self.keyframes          = [self.current.copy()]
+
+    #^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+    @property
+    def numChanges(self):
+        return len(self.changes)
+
+    def __len__(self):
+        return len(self.marks)
+
+    @property
+    def shape(self):
+        return (len(self), self.numNodes)
+
+    #^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+    def log(self, t, node, newState):
+        # node may also come as a 1-element array (e.g. a row of numpy.argwhere):
+        node, newState = int(numpy.ravel(node)[0]), int(numpy.ravel(newState)[0])
+        oldState = self.current[node]
+        if(oldState == newState):
+            return
+        self.changes.record({'t': t, 'node': node, 'old': oldState, 'new': newState})
+        self.current[node] = newState
+        if(self.numChanges % self.keyframeInterval == 0):
+            self.keyframes.append(self.current.copy())
+
+    def mark(self):
+        self.marks.record({'numChanges': self.numChanges})
+
+    #^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+    @staticmethod
+    def apply_changes(states, changes):
+        if(changes.shape[0] > 0):
+            # A node may change several times, the latest change wins:
+            nodes, lastIdx = numpy.unique(changes['node'][::-1], return_index=True)
+            states[nodes]  = changes['new'][::-1][lastIdx]
+        return states
+
+    def state_after(self, numChanges):
+        # Node states after the first numChanges changes:
+        keyframeIdx = min(numChanges//self.keyframeInterval, len(self.keyframes)-1)
+        changes     = self.changes.to_array()[keyframeIdx*self.keyframeInterval:numChanges]
+        return self.apply_changes(self.keyframes[keyframeIdx].copy(), changes)
+
+    def state_at(self, t):
+        # Node states after all changes at times up to and including t:
+        return self.state_after(int(numpy.searchsorted(self.changes.to_array()['t'], t, side='right')))
+
+    #^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+    def __getitem__(self, idx):
+        marks = self.marks.to_array()['numChanges']
+        if(isinstance(idx, (int, numpy.integer))):
+            return self.state_after(int(marks[idx]))
+        marks  = numpy.atleast_1d(marks[idx])
+        states = numpy.empty((marks.shape[0], self.numNodes), dtype='uint8')
+        if(marks.shape[0] > 0 and numpy.all(marks[1:] >= marks[:-1])):
+            # Rows in order: replay the changes forward from one row to the next
+            changes   = self.changes.to_array()
+            states[0] = self.state_after(int(marks[0]))
+            for i in range(1, marks.shape[0]):
+                states[i] = self.apply_changes(states[i-1].copy(), changes[marks[i-1]:marks[i]])
+        else:
+            for i, numChanges in enumerate(marks):
+                states[i] = self.state_after(int(numChanges))
+        return states
+
+    def __array__(self, dtype=None, copy=None):
+        states = self[:]
+        return states.astype(dtype) if dtype is not None else states
+
+
+#^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+#^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+class NodeGroupCounts():
+    """
+    Per-group compartment counts for models with node_groups.
+    =========================================================
+    Group membership is stored as an integer label per node (nodes outside every group get the extra label
+    numGroups), and the number of members of each group in each state as a (numGroups+1, numStates) matrix,
+    next to the numbers of tested and positive members. The model updates them in O(1) on every state or flag
+    change, so recording the group series costs O(numGroups) per event instead of O(numGroups*N).
+    Groups must not overlap.
+    """
+    def __init__(self, node_groups, X, numStates):
+        X               = numpy.asarray(X, dtype=numpy.int64).ravel()
+        self.groupNames = list(node_groups)
+        self.numGroups  = len(self.groupNames)
+        self.labels     = numpy.full(X.shape[0], self.numGroups, dtype=numpy.int64)
+        for groupIdx, groupName in enumerate(self.groupNames):
+            nodes = numpy.asarray(node_groups[groupName], dtype=numpy.int64)
+            assert(numpy.all(self.labels[nodes] == self.numGroups)), "Node group "+str(groupName)+" overlaps with another node group."
+            self.labels[nodes] = groupIdx
+        self.stateCounts = numpy.zeros((self.numGroups+1, numStates), dtype=numpy.int64)
+        numpy.add.at(self.stateCounts, (self.labels, X), 1)
+        self.numTested   = numpy.zeros(self.numGroups+1, dtype=numpy.int64)
+        self.numPositive = numpy.zeros(self.numGroups+1, dtype=numpy.int64)
+
+    def move(self, node, oldState, newState):
+        label = self.labels[node]
+        self.stateCounts[label, oldState] -= 1
+        self.stateCounts[label, newState] += 1
+
+    def update_tested(self, node, delta):
+        self.numTested[self.labels[node]] += delta
+
+    def update_positive(self, node, delta):
+        self.numPositive[self.labels[node]] += delta
@@ -416,3 +416,37 @@ def run_tti_sim(model, T,
 
 #%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
 #%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+
+
+def benchmark_engines(model_class, engines=('direct', 'incremental', 'next_reaction', 'rejection', 'tau_leaping'), num_events=2000, seed=None, **model_params):
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    # Simulation speed (events per second of wall time) of each stochastic simulation engine
+    # on the same model, e.g. benchmark_engines(SEIRSNetworkModel, G=G, beta=0.3, sigma=0.5, gamma=0.2, initI=100).
+    # The first iteration (which builds the engine's data structures) is not timed.
+    # A tau-leaping iteration fires many transitions at once (at most one per node), so for it the events
+    # are the nodes that changed state rather than the iterations.
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    eventsPerSecond = {}
+    for engine in engines:
+
+        model       = model_class(engine=engine, seed=seed, **model_params)
+        model.tmax  = numpy.inf
+        running     = model.run_iteration()
+
+        numEvents   = 0
+        startTime   = time.perf_counter()
+        while running and numEvents < num_events:
+            if(engine == 'tau_leaping'):
+                prevX      = model.X.copy()
+                running    = model.run_iteration()
+                numEvents += numpy.count_nonzero(model.X != prevX)
+            else:
+                running    = model.run_iteration()
+                numEvents += 1
+
+        eventsPerSecond[engine] = numEvents/(time.perf_counter()-startTime)
+        print("%-14s %10.1f events/s (%d events)" % (engine, eventsPerSecond[engine], numEvents))
+
+    return eventsPerSecond
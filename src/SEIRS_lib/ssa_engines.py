@@ -0,0 +1,730 @@
+from __future__ import division
+
+import numpy as numpy
+import scipy as scipy
+import scipy.sparse
+
+
+########################################################
+#@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@#
+#@                                                    @#
+#@  STOCHASTIC SIMULATION ENGINES                     @#
+#@                                                    @#
+#@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@#
+########################################################
+
+class PropensityTree():
+    """
+    Binary sum tree over non-negative leaf values (one leaf per node).
+    Updating a batch of leaves recomputes only their ancestors, level by level,
+    and sampling a leaf proportionally to its value takes one root-to-leaf descent.
+    Parent sums are always recomputed from their children (never adjusted by deltas),
+    so no rounding error accumulates over millions of updates.
+    """
+    def __init__(self, values):
+        values          = numpy.asarray(values, dtype=float).ravel()
+        self.numLeaves  = values.shape[0]
+        self.size       = 1 << max(0, int(self.numLeaves-1).bit_length())
+        self.tree       = numpy.zeros(2*self.size)
+        self.tree[self.size:self.size+self.numLeaves] = values
+        level = self.size
+        while(level > 1):
+            self.tree[level//2:level] = self.tree[level:2*level:2] + self.tree[level+1:2*level:2]
+            level //= 2
+
+    @property
+    def total(self):
+        return self.tree[1]
+
+    def get(self, idx):
+        return self.tree[self.size+idx]
+
+    def update(self, idx, values):
+        idx = numpy.asarray(idx, dtype=numpy.int64).ravel()
+        if(idx.shape[0] == 0):
+            return
+        values = numpy.broadcast_to(numpy.asarray(values, dtype=float).ravel(), idx.shape)
+        if(idx.shape[0] > 1):
+            order  = numpy.argsort(idx, kind='stable')
+            idx    = idx[order]
+            values = values[order]
+        tree = self.tree
+        tree[self.size+idx] = values
+        pos = (idx + self.size) >> 1
+        # Whole levels at once while the updated leaves have distinct ancestors:
+        while(pos.shape[0] > 1 and pos[0] >= 1):
+            pos = pos[numpy.concatenate(([True], pos[1:] != pos[:-1]))]
+            tree[pos] = tree[2*pos] + tree[2*pos+1]
+            pos >>= 1
+        # A single path up to the root:
+        i = int(pos[0])
+        while(i >= 1):
+            tree[i] = tree[2*i] + tree[2*i+1]
+            i >>= 1
+
+    def find(self, u):
+        """
+        Returns the leaf i with prefix(i) <= u < prefix(i+1) together with the residual u - prefix(i).
+        Descends only into subtrees with positive mass, so rounding never lands on an empty leaf.
+        """
+        tree = self.tree
+        i    = 1
+        while(i < self.size):
+            left = tree[2*i]
+            if(u < left or tree[2*i+1] <= 0):
+                i = 2*i
+            else:
+                u -= left
+                i = 2*i+1
+        return i-self.size, u
+
+
+#^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+#^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+class NodeStateIndex():
+    """
+    Membership index of the nodes in each state, kept up to date as nodes change state.
+    All nodes are held in one permutation array ordered by state, so the members of a state are the
+    contiguous slice order[start[s]:start[s+1]] (returned as a view, no copy) and the per-state counts are
+    the block sizes. Moving a node swaps it across the block boundaries between its old and new state,
+    which costs O(numStates) regardless of the number of nodes.
+    """
+    def __init__(self, X, numStates):
+        X               = numpy.asarray(X, dtype=numpy.int64).ravel()
+        self.state      = X.copy()
+        self.order      = numpy.argsort(X, kind='stable')
+        self.position   = numpy.empty_like(self.order)
+        self.position[self.order] = numpy.arange(X.shape[0])
+        self.start      = numpy.concatenate(([0], numpy.cumsum(numpy.bincount(X, minlength=numStates)))).astype(numpy.int64)
+
+    @property
+    def counts(self):
+        return numpy.diff(self.start)
+
+    def count(self, state):
+        return int(self.start[state+1] - self.start[state])
+
+    def nodes(self, state):
+        return self.order[self.start[state]:self.start[state+1]]
+
+    def swap(self, pos1, pos2):
+        order, position = self.order, self.position
+        node1, node2    = order[pos1], order[pos2]
+        order[pos1], order[pos2]        = node2, node1
+        position[node2], position[node1] = pos1, pos2
+
+    def move(self, node, newState):
+        s = int(self.state[node])
+        if(newState > s):
+            # Hand the node over to the next block at the end of each block in between:
+            while(s < newState):
+                self.swap(self.position[node], self.start[s+1]-1)
+                self.start[s+1] -= 1
+                s += 1
+        elif(newState < s):
+            # ... or to the previous block at the start of each block in between:
+            while(s > newState):
+                self.swap(self.position[node], self.start[s])
+                self.start[s] += 1
+                s -= 1
+        self.state[node] = newState
+
+
+#^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+#^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+class TransmissionTerms():
+    """
+    Cached transmission terms matrix.dot(X in infectiousStates), kept up to date as nodes change state.
+    Each term is given as name: (matrix, infectiousStates); when a node enters or leaves the infectious states
+    of a term, the node's column of the matrix is added to or subtracted from that term, so a state change
+    costs O(degree) instead of O(nnz(matrix)). The number of infectious nonzero entries per row is counted
+    alongside, so terms with no infectious contacts left are exactly 0 rather than a rounding residue, and
+    all terms are recomputed from scratch every rebuild_interval changes (default 10*N) so the rounding never
+    accumulates. The terms are (N,1) arrays, read as terms[name].
+    """
+    def __init__(self, X, terms, numStates, rebuild_interval=None):
+        self.matrices   = {}
+        self.infectious = {}
+        for name, (matrix, infectiousStates) in terms.items():
+            self.matrices[name]   = scipy.sparse.csc_matrix(matrix)
+            self.infectious[name] = numpy.zeros(numStates, dtype=bool)
+            self.infectious[name][list(infectiousStates)] = True
+        self.numNodes        = numpy.asarray(X).shape[0]
+        self.rebuildInterval = rebuild_interval if rebuild_interval is not None else 10*self.numNodes
+        self.rebuild(X)
+
+    def rebuild(self, X):
+        X = numpy.asarray(X, dtype=numpy.int64).ravel()
+        self.values     = {}
+        self.numSources = {}
+        for name, matrix in self.matrices.items():
+            infectious            = self.infectious[name][X].astype(float)
+            self.values[name]     = numpy.asarray(matrix.dot(infectious)).reshape((self.numNodes,1))
+            self.numSources[name] = numpy.asarray(scipy.sparse.csc_matrix((numpy.ones_like(matrix.data), matrix.indices, matrix.indptr), shape=matrix.shape).dot(infectious)).round().astype(numpy.int64)
+        self.numUpdates = 0
+
+    def __getitem__(self, name):
+        return self.values[name]
+
+    def move(self, node, oldState, newState, X):
+        # Called after X[node] has been set to newState (X is used for the periodic rebuild);
+        # node may also come as a 1-element array (e.g. a row of numpy.argwhere):
+        node, oldState, newState = int(numpy.ravel(node)[0]), int(numpy.ravel(oldState)[0]), int(numpy.ravel(newState)[0])
+        for name, matrix in self.matrices.items():
+            delta = int(self.infectious[name][newState]) - int(self.infectious[name][oldState])
+            if(delta == 0):
+                continue
+            start, end = matrix.indptr[node], matrix.indptr[node+1]
+            rows = matrix.indices[start:end]
+            self.values[name][rows,0]  += delta*matrix.data[start:end]
+            self.numSources[name][rows] += delta
+            self.values[name][rows[self.numSources[name][rows]==0],0] = 0
+            self.numUpdates += 1
+        if(self.numUpdates >= self.rebuildInterval):
+            self.rebuild(X)
+
+
+#^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+#^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+class ReactionQueue():
+    """
+    Indexed priority queue of putative reaction times: a binary min-tree over the reactions,
+    so changing the times of any set of reactions and finding the earliest one both take O(log N)
+    (batched updates recompute one level of ancestors at a time, as in PropensityTree).
+    """
+    def __init__(self, times):
+        times           = numpy.asarray(times, dtype=float).ravel()
+        self.numLeaves  = times.shape[0]
+        self.size       = 1 << max(0, int(self.numLeaves-1).bit_length())
+        self.tree       = numpy.full(2*self.size, numpy.inf)
+        self.tree[self.size:self.size+self.numLeaves] = times
+        level = self.size
+        while(level > 1):
+            self.tree[level//2:level] = numpy.minimum(self.tree[level:2*level:2], self.tree[level+1:2*level:2])
+            level //= 2
+
+    @property
+    def times(self):
+        return self.tree[self.size:self.size+self.numLeaves]
+
+    def update(self, idx, times):
+        idx = numpy.asarray(idx, dtype=numpy.int64).ravel()
+        if(idx.shape[0] == 0):
+            return
+        times = numpy.broadcast_to(numpy.asarray(times, dtype=float).ravel(), idx.shape)
+        if(idx.shape[0] > 1):
+            order = numpy.argsort(idx, kind='stable')
+            idx   = idx[order]
+            times = times[order]
+        tree = self.tree
+        tree[self.size+idx] = times
+        pos = (idx + self.size) >> 1
+        while(pos.shape[0] > 1 and pos[0] >= 1):
+            pos = pos[numpy.concatenate(([True], pos[1:] != pos[:-1]))]
+            tree[pos] = numpy.minimum(tree[2*pos], tree[2*pos+1])
+            pos >>= 1
+        i = int(pos[0])
+        while(i >= 1):
+            tree[i] = min(tree[2*i], tree[2*i+1])
+            i >>= 1
+
+    def top(self):
+        # The earliest reaction and its time (follow the child holding the parent's minimum):
+        tree = self.tree
+        i    = 1
+        while(i < self.size):
+            i = 2*i if tree[2*i] == tree[i] else 2*i+1
+        return i-self.size, tree[1]
+
+
+#^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+#^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+class IncrementalDirectEngine():
+    """
+    Gillespie direct method for SEIRSNetworkModel (exponential_rates mode) without per-event propensity rebuilds.
+    ==========================================================================================================
+    Per-node propensities of the 11 transition types are kept in an (N, 11) matrix in the column order of
+    SEIRSNetworkModel.calc_propensities, and their row sums in a PropensityTree. The global (well-mixed) part
+    of StoE depends on the network-wide numI, numQ_I and N, so it is kept as two more trees over susceptible
+    nodes holding alpha*p*beta_global and alpha*p*q*beta_Q_global; their totals are scaled by numI/N and numQ_I/N
+    when an event is drawn, and no per-node entries have to change when these counts change.
+
+    After a node changes state (or its positive/tested flag changes) only the node itself and its neighbours
+    are touched: transmissionTerms_I/_Q and numContacts_Q are shifted by the node's column of the corresponding
+    matrix, the affected rows are recomputed and their tree leaves updated, so one event costs O(deg*log N)
+    instead of O(N).
+
+    The engine observes the model through update_nodes(); SEIRSNetworkModel calls it after every transition and
+    from set_isolation/set_tested/set_positive/introduce_exposures, and drops the engine (to be rebuilt from
+    scratch) in update_parameters.
+    """
+
+    transitionTypes = ['StoE', 'EtoI', 'ItoR', 'ItoF', 'EtoQE', 'ItoQI', 'QEtoQI', 'QItoR', 'QItoF', 'RtoS', '_toS']
+
+    def __init__(self, model, rebuild_interval=None):
+        self.model = model
+        # Incremental updates of the transmission terms are exact up to rounding;
+        # a periodic full rebuild keeps the rounding from ever accumulating:
+        self.rebuildInterval = rebuild_interval if rebuild_interval is not None else 10*model.numNodes
+        self.rebuild()
+
+    #^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+    def rebuild(self):
+        model = self.model
+
+        self.A_deltabeta_csc     = scipy.sparse.csc_matrix(model.A_deltabeta)
+        self.A_Q_deltabeta_Q_csc = scipy.sparse.csc_matrix(model.A_Q_deltabeta_Q)
+        self.A_csc               = scipy.sparse.csc_matrix(model.A)
+        self.trackContacts_Q     = bool(numpy.any(model.phi_E) or numpy.any(model.phi_I))
+
+        #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+        # Snapshot of the node attributes the propensities depend on:
+        #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+        self.X        = model.X.ravel().copy()
+        self.positive = model.positive.ravel().copy()
+        self.tested   = model.tested.ravel().copy()
+
+        self.stateCounts = numpy.bincount(self.X, minlength=model.Q_I+1)
+
+        self.transmissionTerms_I = numpy.asarray(self.A_deltabeta_csc.dot((self.X==model.I).astype(float))).ravel()
+        self.transmissionTerms_Q = numpy.asarray(self.A_Q_deltabeta_Q_csc.dot((self.X==model.Q_I).astype(float))).ravel()
+        self.numContacts_Q       = numpy.zeros(model.numNodes)
+        if(self.trackContacts_Q):
+            self.numContacts_Q   = numpy.asarray(self.A_csc.dot(self.contact_indicator(numpy.arange(model.numNodes)))).ravel()
+
+        #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+        # Node-wise rate coefficients: the propensity of transition k for node i is
+        # (rateCoefs[i,k] + contactCoefs[i,k]*numContacts_Q[i]) if X[i] is the source state of k, else 0
+        # (the local StoE propensity is handled separately):
+        #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+        fatal = numpy.less(model.rand_f, model.f).ravel()
+        self.rateCoefs = numpy.zeros((model.numNodes, len(self.transitionTypes)))
+        self.rateCoefs[:,1]  = model.sigma.ravel()
+        self.rateCoefs[:,2]  = model.gamma.ravel()*~fatal
+        self.rateCoefs[:,3]  = model.mu_I.ravel()*fatal
+        self.rateCoefs[:,4]  = (model.theta_E*model.psi_E).ravel()
+        self.rateCoefs[:,5]  = (model.theta_I*model.psi_I).ravel()
+        self.rateCoefs[:,6]  = model.sigma_Q.ravel()
+        self.rateCoefs[:,7]  = model.gamma_Q.ravel()*~fatal
+        self.rateCoefs[:,8]  = model.mu_Q.ravel()*fatal
+        self.rateCoefs[:,9]  = model.xi.ravel()
+        self.rateCoefs[:,10] = model.nu.ravel()
+        self.contactCoefs = numpy.zeros_like(self.rateCoefs)
+        self.contactCoefs[:,4] = (model.phi_E*model.psi_E).ravel()
+        self.contactCoefs[:,5] = (model.phi_I*model.psi_I).ravel()
+
+        # Which transitions are open to a node in each state:
+        self.stateMask = numpy.zeros((max(model.transitions[transitionType]['newState'] for transitionType in self.transitionTypes)+1, len(self.transitionTypes)), dtype=bool)
+        for k, transitionType in enumerate(self.transitionTypes[1:-1], start=1):
+            self.stateMask[model.transitions[transitionType]['currentState'], k] = True
+        self.stateMask[:, -1] = True
+        self.stateMask[model.F, -1] = False
+
+        self.localWeight    = (model.alpha*(1-model.p)).ravel()
+        self.invDegree      = numpy.divide(1, model.degree, out=numpy.zeros_like(model.degree), where=model.degree!=0).ravel()
+        self.invDegree_Q    = numpy.divide(1, model.degree_Q, out=numpy.zeros_like(model.degree_Q), where=model.degree_Q!=0).ravel()
+        self.globalWeight_I = (model.alpha*model.p*model.beta_global).ravel()
+        self.globalWeight_Q = (model.alpha*model.p*model.q*model.beta_Q_global).ravel()
+
+        self.propensities = self.node_propensities(numpy.arange(model.numNodes))
+        susceptible       = (self.X==model.S)
+        self.globalTree_I = PropensityTree(self.globalWeight_I*susceptible)
+        self.globalTree_Q = PropensityTree(self.globalWeight_Q*susceptible)
+        self.build_local()
+
+        self.numUpdates = 0
+
+    #^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+    def build_local(self):
+        # Sampling structure over the nodes' (local) propensity row sums:
+        self.localTree = PropensityTree(self.propensities.sum(axis=1))
+
+    def update_local(self, rows):
+        self.localTree.update(rows, self.propensities[rows].sum(axis=1))
+
+    def update_global(self, nodes):
+        susceptible = (self.X[nodes]==self.model.S)
+        self.globalTree_I.update(nodes, self.globalWeight_I[nodes]*susceptible)
+        self.globalTree_Q.update(nodes, self.globalWeight_Q[nodes]*susceptible)
+
+    #^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+    def contact_indicator(self, nodes):
+        # A node counts towards its contacts' numContacts_Q while it is positive and not recovered/dead:
+        return (self.positive[nodes] & (self.X[nodes]!=self.model.R) & (self.X[nodes]!=self.model.F)).astype(float)
+
+    #^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+    def node_propensities(self, nodes):
+        """
+        Rows of the propensity matrix for the given nodes, equal to the exponential_rates branch of
+        SEIRSNetworkModel.calc_propensities (the StoE column holds only the local, network part).
+        """
+        X = self.X[nodes]
+        propensities = self.rateCoefs[nodes]
+        if(self.trackContacts_Q):
+            propensities += self.contactCoefs[nodes]*self.numContacts_Q[nodes,None]
+        propensities *= self.stateMask[X]
+        propensities[:,0] = self.localWeight[nodes]*numpy.maximum(self.transmissionTerms_I[nodes]*self.invDegree[nodes]
+                                                                  + self.transmissionTerms_Q[nodes]*self.invDegree_Q[nodes], 0)*(X==self.model.S)
+        return propensities
+
+    #^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+    def shift_terms(self, terms, matrix_csc, nodes, deltas, affected):
+        # terms += matrix[:, nodes] . deltas, touching only the nonzero rows of those columns:
+        for node, delta in zip(nodes, deltas):
+            start, end = matrix_csc.indptr[node], matrix_csc.indptr[node+1]
+            rows = matrix_csc.indices[start:end]
+            terms[rows] += delta*matrix_csc.data[start:end]
+            affected.append(rows)
+
+    #^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+    def update_nodes(self, nodes):
+        model = self.model
+        nodes = numpy.unique(numpy.asarray(nodes, dtype=numpy.int64).ravel())
+
+        newX        = model.X[nodes,0]
+        newPositive = model.positive[nodes,0]
+        newTested   = model.tested[nodes,0]
+        changed     = (newX!=self.X[nodes]) | (newPositive!=self.positive[nodes]) | (newTested!=self.tested[nodes])
+        if(not numpy.any(changed)):
+            return
+        nodes, newX, newPositive, newTested = nodes[changed], newX[changed], newPositive[changed], newTested[changed]
+        oldX = self.X[nodes]
+
+        #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+        # Counters:
+        #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+        numpy.subtract.at(self.stateCounts, oldX, 1)
+        numpy.add.at(self.stateCounts, newX, 1)
+
+        #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+        # Shift the neighbours' transmission terms and contact counts:
+        #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+        affected = [nodes]
+
+        delta_I = (newX==model.I).astype(float) - (oldX==model.I)
+        self.shift_terms(self.transmissionTerms_I, self.A_deltabeta_csc, nodes[delta_I!=0], delta_I[delta_I!=0], affected)
+
+        delta_Q = (newX==model.Q_I).astype(float) - (oldX==model.Q_I)
+        self.shift_terms(self.transmissionTerms_Q, self.A_Q_deltabeta_Q_csc, nodes[delta_Q!=0], delta_Q[delta_Q!=0], affected)
+
+        if(self.trackContacts_Q):
+            oldContacts = self.contact_indicator(nodes)
+            self.X[nodes], self.positive[nodes] = newX, newPositive
+            delta_C = self.contact_indicator(nodes) - oldContacts
+            self.shift_terms(self.numContacts_Q, self.A_csc, nodes[delta_C!=0], delta_C[delta_C!=0], affected)
+
+        self.X[nodes]        = newX
+        self.positive[nodes] = newPositive
+        self.tested[nodes]   = newTested
+
+        #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+        # Recompute the affected propensity rows and tree leaves:
+        #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+        rows = numpy.unique(numpy.concatenate(affected)) if len(affected) > 1 else nodes
+        self.propensities[rows] = self.node_propensities(rows)
+        self.update_local(rows)
+        self.update_global(nodes)
+
+        self.numUpdates += 1
+        if(self.numUpdates >= self.rebuildInterval):
+            self.rebuild()
+
+    #^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+    def global_rates(self):
+        model = self.model
+        N = model.numNodes - self.stateCounts[model.F]
+        if(N <= 0):
+            return 0.0, 0.0
+        return self.stateCounts[model.I]/N, self.stateCounts[model.Q_I]/N
+
+    #^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+    def select_transition(self, r1, r2):
+        """
+        Draws the next event from the two uniform numbers r1 (waiting time) and r2 (event choice),
+        as SEIRSNetworkModel.run_iteration does in the direct method.
+        Returns (tau, transitionNode, transitionType), or None if no transition is possible.
+        """
+        scale_I, scale_Q = self.global_rates()
+        localTotal    = self.localTree.total
+        globalTotal_I = scale_I*self.globalTree_I.total
+        globalTotal_Q = scale_Q*self.globalTree_Q.total
+        alpha         = localTotal + globalTotal_I + globalTotal_Q
+        if(alpha <= 0):
+            return None
+
+        tau = (1/alpha)*numpy.log(float(1/r1))
+
+        u = r2*alpha
+        if(u < localTotal or (globalTotal_I <= 0 and globalTotal_Q <= 0)):
+            transitionNode, u = self.localTree.find(min(u, localTotal))
+            return tau, transitionNode, self.select_type(transitionNode, u)
+
+        return tau, self.select_global(u-localTotal, scale_I, scale_Q), 'StoE'
+
+    #^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+    def select_type(self, node, u):
+        # Transition type of the node's row at the cumulative position u in [0, row sum):
+        row = self.propensities[node]
+        transitionTypeIdx = min(int(numpy.searchsorted(row.cumsum(), u, side='right')), len(row)-1)
+        while(row[transitionTypeIdx] <= 0):
+            transitionTypeIdx -= 1
+        return self.transitionTypes[transitionTypeIdx]
+
+    def select_global(self, u, scale_I, scale_Q):
+        # Susceptible node infected through the global term at position u in [0, global total):
+        globalTotal_I = scale_I*self.globalTree_I.total
+        if(u < globalTotal_I or scale_Q*self.globalTree_Q.total <= 0):
+            return self.globalTree_I.find(min(u, globalTotal_I)/scale_I)[0]
+        return self.globalTree_Q.find((u-globalTotal_I)/scale_Q)[0]
+
+
+#^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+#^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+class NextReactionEngine(IncrementalDirectEngine):
+    """
+    Gibson-Bruck next reaction method for SEIRSNetworkModel (exponential_rates mode).
+    =================================================================================
+    Every node is one reaction with the rate of its propensity row sum (the transition type is picked within
+    the row when it fires), and the two global infection terms are two more reactions. Putative firing times
+    are kept in a ReactionQueue. The fired reaction draws a new time; when a rate changes from a_old to a_new
+    the pending time is rescaled, t + (a_old/a_new)*(t_old - t), without drawing new random numbers.
+    Propensity bookkeeping is shared with IncrementalDirectEngine. Of the uniform numbers passed by run_iteration
+    r1 is not used (waiting times come from the queue), r2 picks the node/transition within the fired reaction.
+    """
+
+    def build_local(self):
+        numNodes = self.model.numNodes
+        self.reactionRates = numpy.concatenate([self.propensities.sum(axis=1), self.global_totals()])
+        self.queue = ReactionQueue(self.model.t + self.draw_waiting_times(self.reactionRates))
+        self.globalReactions = numpy.array([numNodes, numNodes+1])
+
+    def global_totals(self):
+        scale_I, scale_Q = self.global_rates()
+        return numpy.array([scale_I*self.globalTree_I.total, scale_Q*self.globalTree_Q.total])
+
+    def draw_waiting_times(self, rates):
+        with numpy.errstate(divide='ignore'):
+            return numpy.random.exponential(size=len(rates))/rates
+
+    def reschedule(self, idx, newRates):
+        t        = self.model.t
+        oldRates = self.reactionRates[idx]
+        oldTimes = self.queue.times[idx]
+        times    = numpy.full(len(idx), numpy.inf)
+        scalable = (oldRates > 0) & (newRates > 0) & numpy.isfinite(oldTimes)
+        times[scalable] = t + (oldRates[scalable]/newRates[scalable])*(oldTimes[scalable]-t)
+        fresh    = (newRates > 0) & ~scalable
+        if(numpy.any(fresh)):
+            times[fresh] = t + self.draw_waiting_times(newRates[fresh])
+        self.reactionRates[idx] = newRates
+        self.queue.update(idx, times)
+
+    def update_local(self, rows):
+        self.reschedule(rows, self.propensities[rows].sum(axis=1))
+
+    def update_global(self, nodes):
+        super(NextReactionEngine, self).update_global(nodes)
+        self.reschedule(self.globalReactions, self.global_totals())
+
+    def select_transition(self, r1, r2):
+        reaction, time = self.queue.top()
+        if(not numpy.isfinite(time)):
+            return None
+
+        tau  = max(time - self.model.t, 0.0)
+        rate = self.reactionRates[reaction]
+        # The fired reaction gets a fresh time at its current rate (rescaled later if the rate changes):
+        self.queue.update([reaction], [time + numpy.random.exponential()/rate])
+
+        if(reaction < self.model.numNodes):
+            return tau, reaction, self.select_type(reaction, r2*rate)
+        tree = self.globalTree_I if reaction == self.globalReactions[0] else self.globalTree_Q
+        return tau, tree.find(r2*tree.total)[0], 'StoE'
+
+
+#^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+#^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+class RejectionEngine(IncrementalDirectEngine):
+    """
+    Rejection-based SSA (RSSA) for SEIRSNetworkModel (exponential_rates mode).
+    ==========================================================================
+    Candidates are sampled from a PropensityTree over upper bounds of the nodes' propensity row sums,
+    [a/(1+boundWidth), a*(1+boundWidth)] around the value at the last bound update, and accepted with
+    probability a/a_upper. A node's leaf changes only when its propensity leaves these bounds, so most
+    neighbour updates (e.g. small changes of transmissionTerms) skip the tree. Every trial advances time by
+    an exponential waiting time at the total upper-bound rate. The global infection terms are sampled exactly,
+    as in IncrementalDirectEngine.
+    """
+
+    def __init__(self, model, rebuild_interval=None, bound_width=0.25):
+        self.boundWidth = bound_width
+        super(RejectionEngine, self).__init__(model, rebuild_interval)
+
+    def build_local(self):
+        rowSums          = self.propensities.sum(axis=1)
+        self.upperBounds = rowSums*(1+self.boundWidth)
+        self.lowerBounds = rowSums/(1+self.boundWidth)
+        self.upperTree   = PropensityTree(self.upperBounds)
+
+    def update_local(self, rows):
+        rowSums = self.propensities[rows].sum(axis=1)
+        outside = (rowSums > self.upperBounds[rows]) | (rowSums < self.lowerBounds[rows])
+        if(numpy.any(outside)):
+            rows, rowSums = rows[outside], rowSums[outside]
+            self.upperBounds[rows] = rowSums*(1+self.boundWidth)
+            self.lowerBounds[rows] = rowSums/(1+self.boundWidth)
+            self.upperTree.update(rows, self.upperBounds[rows])
+
+    def select_transition(self, r1, r2):
+        scale_I, scale_Q = self.global_rates()
+        upperTotal  = self.upperTree.total
+        globalTotal = scale_I*self.globalTree_I.total + scale_Q*self.globalTree_Q.total
+        alpha       = upperTotal + globalTotal
+        if(alpha <= 0):
+            return None
+
+        tau = 0.0
+        while(True):
+            tau += (1/alpha)*numpy.log(float(1/r1))
+            u = r2*alpha
+            if(u >= upperTotal and globalTotal > 0):
+                return tau, self.select_global(u-upperTotal, scale_I, scale_Q), 'StoE'
+            # u is uniform within the candidate's upper bound, so it doubles as the acceptance test:
+            transitionNode, u = self.upperTree.find(min(u, upperTotal))
+            if(u < self.propensities[transitionNode].sum()):
+                return tau, transitionNode, self.select_type(transitionNode, u)
+            r1 = numpy.random.rand()
+            r2 = numpy.random.rand()
+
+
+#^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+#^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+class TauLeapingEngine():
+    """
+    Approximate tau-leaping for SEIRSNetworkModel and ExtSEIRSNetworkModel.
+    =======================================================================
+    Every leap rebuilds the (N, K) propensity matrix with the model's own calc_propensities and advances the
+    clock by tau, firing many transitions at once. Each node fires at most one transition per leap, with
+    probability 1-exp(-a_i*tau) for its propensity row sum a_i, and the transition type is picked within
+    its row; the number of transitions out of a compartment is thus binomial, and no compartment can ever
+    be driven negative (so the critical-reaction bookkeeping of Poisson leaping is not needed).
+
+    The leap size follows Cao, Gillespie and Petzold (2006): the compartment counts x_i are the species,
+    the transition types are the reaction channels with total rates a_j (column sums of the propensity
+    matrix), and tau is the largest step for which the expected change mu_i and its variance sigma2_i keep
+    the relative change of every consumed compartment within epsilon:
+        tau = min_i( max(epsilon*x_i/g_i, 1)/|mu_i|, max(epsilon*x_i/g_i, 1)^2/sigma2_i ).
+    Infection is the only second-order channel, so g_i=2 is used for all compartments (the conservative choice).
+    When tau falls below exact_threshold/a_0 leaping would fire only a handful of events, and an exact
+    direct-method step is taken instead.
+
+    select_transition() returns (tau, transitionNodes, transitionTypes) with arrays of the fired nodes and
+    their transition types; the model applies them and records its time series once per leap.
+    """
+
+    def __init__(self, model, epsilon=0.03, exact_threshold=10):
+        self.model          = model
+        self.epsilon        = epsilon
+        self.exactThreshold = exact_threshold
+        self.g              = 2.0
+        self.columns        = None
+
+    #^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+    def build_state_changes(self, columns):
+        # State change matrix V (states x transition types): -1 at the current state, +1 at the new state.
+        # '_toS' has currentState True (any node), which counts as S here; its net change is then zero.
+        model           = self.model
+        currentStates   = [int(model.transitions[transitionType]['currentState']) for transitionType in columns]
+        newStates       = [int(model.transitions[transitionType]['newState']) for transitionType in columns]
+        numStates       = max(currentStates + newStates) + 1
+        self.columns        = list(columns)
+        self.columnNames    = numpy.array(columns)
+        self.stateChanges   = numpy.zeros((numStates, len(columns)))
+        numpy.add.at(self.stateChanges, (currentStates, numpy.arange(len(columns))), -1)
+        numpy.add.at(self.stateChanges, (newStates, numpy.arange(len(columns))), 1)
+        # Only compartments that some transition consumes bound the leap:
+        self.reactants = numpy.any(self.stateChanges < 0, axis=1)
+
+    #^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+    def leap_size(self, rates):
+        counts  = numpy.bincount(self.model.X.ravel(), minlength=self.stateChanges.shape[0])[:self.stateChanges.shape[0]]
+        mu      = numpy.abs(self.stateChanges.dot(rates))[self.reactants]
+        sigma2  = (self.stateChanges**2).dot(rates)[self.reactants]
+        bound   = numpy.maximum(self.epsilon*counts[self.reactants]/self.g, 1.0)
+        tau     = numpy.inf
+        if(numpy.any(mu > 0)):
+            tau = min(tau, numpy.min(bound[mu > 0]/mu[mu > 0]))
+        if(numpy.any(sigma2 > 0)):
+            tau = min(tau, numpy.min(bound[sigma2 > 0]**2/sigma2[sigma2 > 0]))
+        return tau
+
+    #^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+    def select_transition(self, r1, r2):
+        model = self.model
+        propensities, columns = model.calc_propensities()
+        if(columns != self.columns):
+            self.build_state_changes(columns)
+
+        rates     = propensities.sum(axis=0)
+        totalRate = rates.sum()
+        if(totalRate <= 0):
+            return None
+
+        tau = self.leap_size(rates)
+
+        if(tau*totalRate < self.exactThreshold):
+            # Too few events per leap to be worth it; take one exact direct-method step:
+            cumsum          = propensities.ravel(order='F').cumsum()
+            tau             = (1/totalRate)*numpy.log(float(1/r1))
+            transitionIdx   = min(numpy.searchsorted(cumsum, r2*totalRate), cumsum.shape[0]-1)
+            transitionNode  = transitionIdx % model.numNodes
+            transitionType  = columns[ int(transitionIdx/model.numNodes) ]
+            return tau, numpy.array([transitionNode]), numpy.array([transitionType])
+
+        # Do not leap past the end of the run:
+        if(model.tmax > model.t):
+            tau = min(tau, model.tmax - model.t)
+
+        nodeRates   = propensities.sum(axis=1)
+        firedNodes  = numpy.flatnonzero(numpy.random.rand(model.numNodes) < -numpy.expm1(-tau*nodeRates))
+        cumsum      = propensities[firedNodes].cumsum(axis=1)
+        u           = numpy.random.rand(firedNodes.shape[0])*cumsum[:,-1]
+        typeIdx     = numpy.minimum(numpy.count_nonzero(cumsum <= u[:,None], axis=1), len(columns)-1)
+
+        return tau, firedNodes, self.columnNames[typeIdx]
+
+    #^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+    def update_nodes(self, nodes):
+        # Propensities are rebuilt at every leap, there is nothing to keep up to date:
+        pass
+
+
+#^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+#^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+# Stochastic simulation engines selectable with SEIRSNetworkModel(engine=...) ('tau_leaping' also with 
+# ExtSEIRSNetworkModel(engine=...)); 'direct' is the original full-rebuild implementation in run_iteration
+SSA_ENGINES = { 'incremental':   IncrementalDirectEngine,
+                'next_reaction': NextReactionEngine,
+                'rejection':     RejectionEngine,
+                'tau_leaping':   TauLeapingEngine }
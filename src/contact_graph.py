@@ -0,0 +1,287 @@
+"""
+    В модуле описывается общий контейнер графа контактов: разреженные матрицы смежности и весов,
+    степени вершин и матрицы log(1 - beta_i * w_ij) строятся по графу networkx один раз
+    и переиспользуются всеми моделями (цепями Маркова, эпидемиями, моделями SEIRS).
+    Граф с атрибутами вершин хранится на диске в формате, который отображается в память
+"""
+import hashlib
+import os
+import networkx as nx
+import numpy as np
+import scipy.sparse as sp
+from collections import OrderedDict
+from typing import Dict
+from typing import List
+from typing import Union
+
+
+class ContactGraph:
+    """
+        Граф контактов в разреженном виде. Вершины пронумерованы от 0 до N-1: если метки вершин графа
+        networkx - это 0, ..., N-1, номер совпадает с меткой, иначе вершины нумеруются в порядке обхода графа.
+
+        adj_matrix - матрица смежности с атрибутом 'weight' (как nx.adj_matrix; по умолчанию 1),
+        weights - матрица интенсивностей контактов с атрибутом 'w' (как в моделях эпидемий),
+        node_attrs - столбцы атрибутов вершин (например, возрастная группа и номер домохозяйства).
+
+        Контейнер сохраняется на диск в виде отдельных .npy файлов (см. save) и загружается
+        с отображением в память (см. load)
+    """
+
+    def __init__(self, weights: sp.csr_matrix, adj_matrix: sp.csr_matrix = None, graph: nx.Graph = None,
+                 node_attrs: Dict[str, np.ndarray] = None):
+        """
+
+        :param weights: матрица интенсивностей 'w' (N, N) в формате CSR
+        :param adj_matrix: матрица смежности 'weight'; по умолчанию единицы на месте ненулевых весов
+        :param graph: граф networkx, по которому построены матрицы (если есть)
+        :param node_attrs: столбцы атрибутов вершин {имя -> массив длины N}
+        """
+        self.weights = sp.csr_matrix(weights)
+        if adj_matrix is None:
+            adj_matrix = sp.csr_matrix((np.ones(self.weights.nnz), self.weights.indices, self.weights.indptr),
+                                       shape=self.weights.shape)
+        self.adj_matrix = sp.csr_matrix(adj_matrix)
+        self.num_nodes = self.weights.shape[0]
+        self.node_attrs = {} if node_attrs is None else dict(node_attrs)
+
+        self._graph = graph
+        # производные массивы считаются при первом обращении
+        self._rows = None
+        self._degree = None
+        # матрицы log(1 - beta_i * w_ij) по последним значениям beta (вытесняются самые давно использованные)
+        self._log_weights: 'OrderedDict[bytes, sp.csr_matrix]' = OrderedDict()
+
+    @classmethod
+    def from_networkx(cls, G: nx.Graph) -> 'ContactGraph':
+        """
+        Строит контейнер по графу networkx за один проход по рёбрам. Результаты запоминаются по хешу
+        содержимого графа (рёбра и их атрибуты 'w' и 'weight'), поэтому повторный вызов для того же графа
+        или его копии возвращает уже построенный контейнер вместе с посчитанными матрицами.
+        Проход по рёбрам (и хеш) делается при каждом вызове: кэш экономит только сборку CSR-матриц,
+        матрицы log(1 - beta_i * w_ij) и степени вершин.
+        Сам граф G в контейнере не хранится (его атрибуты вершин меняют модели), свойство graph
+        собирает собственный граф по матрицам
+
+        :param G: граф контактов
+        :return: контейнер графа
+        """
+        num_nodes = G.number_of_nodes()
+        if set(G) == set(range(num_nodes)):
+            index = None
+        else:
+            index = {node: num for num, node in enumerate(G)}
+
+        edges = G.edges(data=True)
+        if index is None:
+            ends = np.array([(u, v) for u, v, _ in edges], dtype=np.int64).reshape(-1, 2)
+        else:
+            ends = np.array([(index[u], index[v]) for u, v, _ in edges], dtype=np.int64).reshape(-1, 2)
+        values = np.array([(attrs.get('w', 1), attrs.get('weight', 1)) for _, _, attrs in edges],
+                          dtype=float).reshape(-1, 2)
+
+        key = _content_hash(num_nodes, G.is_directed(), ends, values)
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+
+        # у неориентированного графа каждое ребро (кроме петель) входит в матрицу дважды
+        if not G.is_directed():
+            mirrored = ends[:, 0] != ends[:, 1]
+            ends = np.concatenate([ends, ends[mirrored, ::-1]])
+            values = np.concatenate([values, values[mirrored]])
+
+        def to_csr(data: np.ndarray) -> sp.csr_matrix:
+            matrix = sp.csr_matrix((data, (ends[:, 0], ends[:, 1])), shape=(num_nodes, num_nodes))
+            matrix.sort_indices()
+            return matrix
+
+        contact_graph = cls(to_csr(values[:, 0]), to_csr(values[:, 1]))
+
+        _cache[key] = contact_graph
+        if len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+
+        return contact_graph
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> 'ContactGraph':
+        """
+        Загружает контейнер, сохранённый методом save. При mmap массивы не читаются в память,
+        а отображаются с диска (только для чтения): процессы, загрузившие один и тот же граф,
+        разделяют одну копию в страничном кэше
+
+        :param path: каталог с сохранённым графом
+        :param mmap: отображать ли массивы в память вместо чтения
+        :return: контейнер графа
+        """
+        mmap_mode = 'r' if mmap else None
+
+        def load_array(name: str) -> np.ndarray:
+            return np.load(os.path.join(path, name + '.npy'), mmap_mode=mmap_mode)
+
+        indptr, indices = load_array('indptr'), load_array('indices')
+        shape = (len(indptr) - 1, len(indptr) - 1)
+        weights = sp.csr_matrix((load_array('weights'), indices, indptr), shape=shape, copy=False)
+        adj_matrix = sp.csr_matrix((load_array('adj_weights'), indices, indptr), shape=shape, copy=False)
+
+        node_attrs = {}
+        for file_name in sorted(os.listdir(path)):
+            if file_name.startswith(_NODE_ATTR_PREFIX) and file_name.endswith('.npy'):
+                name = file_name[len(_NODE_ATTR_PREFIX):-len('.npy')]
+                node_attrs[name] = load_array(_NODE_ATTR_PREFIX + name)
+
+        return cls(weights, adj_matrix, node_attrs=node_attrs)
+
+    def save(self, path: str) -> None:
+        """
+        Сохраняет граф в каталог: indptr.npy, indices.npy (общие для обеих матриц), weights.npy (атрибут 'w'),
+        adj_weights.npy (атрибут 'weight') и по файлу node_<имя>.npy на каждый столбец атрибутов вершин
+
+        :param path: каталог (создаётся, если его нет)
+        :return:
+        """
+        if not np.array_equal(self.adj_matrix.indptr, self.weights.indptr) or \
+                not np.array_equal(self.adj_matrix.indices, self.weights.indices):
+            raise ValueError("Adjacency and weight matrices must have the same sparsity structure")
+
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, 'indptr.npy'), self.weights.indptr)
+        np.save(os.path.join(path, 'indices.npy'), self.weights.indices)
+        np.save(os.path.join(path, 'weights.npy'), self.weights.data)
+        np.save(os.path.join(path, 'adj_weights.npy'), self.adj_matrix.data)
+        for name, column in self.node_attrs.items():
+            np.save(os.path.join(path, _NODE_ATTR_PREFIX + name + '.npy'), np.asarray(column))
+
+    @property
+    def rows(self) -> np.ndarray:
+        """
+        Номер строки для каждого ненулевого элемента матрицы весов
+
+        :return:
+        """
+        if self._rows is None:
+            self._rows = np.repeat(np.arange(self.num_nodes), np.diff(self.weights.indptr))
+
+        return self._rows
+
+    @property
+    def degree(self) -> np.ndarray:
+        """
+        Степени вершин - суммы столбцов матрицы смежности (как node_degrees в моделях SEIRS)
+
+        :return:
+        """
+        if self._degree is None:
+            self._degree = np.asarray(self.adj_matrix.sum(axis=0)).ravel().astype(float)
+
+        return self._degree
+
+    @property
+    def graph(self) -> nx.Graph:
+        """
+        Граф networkx (нужен для пересчёта по графу и для отрисовки). Если он не передан в конструктор,
+        граф собирается из матриц при первом обращении с атрибутами 'w' и 'weight' у рёбер.
+        Граф общий для всех пользователей контейнера: состояние модели в его атрибуты писать нельзя
+
+        :return:
+        """
+        if self._graph is None:
+            graph = nx.Graph()
+            graph.add_nodes_from(range(self.num_nodes))
+            weights = self.weights.tocoo()
+            adj_values = self.adj_matrix.tocoo().data
+            upper = weights.row <= weights.col
+            graph.add_edges_from((u, v, {'w': w, 'weight': a}) for u, v, w, a in
+                                 zip(weights.row[upper], weights.col[upper], weights.data[upper], adj_values[upper]))
+            self._graph = graph
+
+        return self._graph
+
+    def log_weights(self, beta: Union[float, np.ndarray]) -> sp.csr_matrix:
+        """
+        Матрица с элементами log(1 - beta_i * w_ij). Запоминаются матрицы для _LOG_WEIGHTS_CACHE_SIZE последних
+        значений beta: модели с меняющейся по ходу прогона beta не копят по матрице на каждое значение
+
+        :param beta: индивидуальные восприимчивости вершин (или одна на всех)
+        :return: матрица в формате CSR (общая для всех вызывающих, изменять её нельзя)
+        """
+        beta = np.broadcast_to(np.asarray(beta, dtype=float), (self.num_nodes,))
+        key = beta.tobytes()
+        if key in self._log_weights:
+            self._log_weights.move_to_end(key)
+        else:
+            # при beta * w = 1 логарифм обращается в -inf, поэтому чуть отступаем от -1
+            log_data = np.log1p(np.maximum(-beta[self.rows] * self.weights.data, np.nextafter(-1, 0)))
+            self._log_weights[key] = sp.csr_matrix((log_data, self.weights.indices, self.weights.indptr),
+                                                   shape=self.weights.shape)
+            if len(self._log_weights) > _LOG_WEIGHTS_CACHE_SIZE:
+                self._log_weights.popitem(last=False)
+
+        return self._log_weights[key]
+
+    def __len__(self) -> int:
+        return self.num_nodes
+
+    def __getitem__(self, node: int) -> Dict[int, Dict[str, float]]:
+        """
+        Соседи вершины в виде словаря {сосед -> атрибуты ребра}, как у графа networkx
+
+        :param node: номер вершины
+        :return:
+        """
+        row = slice(self.weights.indptr[node], self.weights.indptr[node + 1])
+
+        return {int(neighbour): {'w': w} for neighbour, w in
+                zip(self.weights.indices[row], self.weights.data[row])}
+
+
+def to_contact_graph(G: Union[nx.Graph, ContactGraph]) -> ContactGraph:
+    """
+    Приводит граф к контейнеру (граф networkx переводится через ContactGraph.from_networkx)
+
+    :param G: граф networkx или уже построенный контейнер
+    :return: контейнер графа
+    """
+    if isinstance(G, nx.Graph):
+        return ContactGraph.from_networkx(G)
+
+    return G
+
+
+def demographic_node_attrs(age_bracket_labels: List[str], households: List[Dict]) -> Dict[str, np.ndarray]:
+    """
+    Столбцы атрибутов вершин по результату networks.generate_demographic_contact_network
+
+    :param age_bracket_labels: возрастные группы вершин (individualAgeBracketLabels)
+    :param households: список домохозяйств с номерами вершин в household['indices']
+    :return: {'age_bracket': метки возрастных групп, 'household_id': номер домохозяйства (-1, если нет)}
+    """
+    household_id = np.full(len(age_bracket_labels), -1, dtype=np.int64)
+    for household_num, household in enumerate(households):
+        household_id[household['indices']] = household_num
+
+    return {'age_bracket': np.asarray(age_bracket_labels, dtype=str), 'household_id': household_id}
+
+
+def _content_hash(num_nodes: int, directed: bool, ends: np.ndarray, values: np.ndarray) -> str:
+    """
+    Хеш содержимого графа: число вершин, ориентированность, концы рёбер и их атрибуты
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(np.array([num_nodes, directed], dtype=np.int64).tobytes())
+    digest.update(np.ascontiguousarray(ends).tobytes())
+    digest.update(np.ascontiguousarray(values).tobytes())
+
+    return digest.hexdigest()
+
+
+# префикс файлов со столбцами атрибутов вершин
+_NODE_ATTR_PREFIX = 'node_'
+
+# построенные контейнеры по хешу содержимого графа (вытесняются самые давно использованные)
+_CACHE_SIZE = 16
+_cache: 'OrderedDict[str, ContactGraph]' = OrderedDict()
+
+# число матриц log(1 - beta_i * w_ij), запоминаемых в одном контейнере
+_LOG_WEIGHTS_CACHE_SIZE = 4
@@ -0,0 +1,283 @@
+"""
+    В модуле описывается многократный запуск эпидемии с локдауном (ансамбль реализаций) с
+     распараллеливанием по процессам и агрегированием траекторий в квантильные полосы.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable
+from typing import Optional
+from typing import Sequence
+from epidemic_sampling import *
+
+
+# эпидемия-шаблон процесса-исполнителя: создаётся один раз на процесс,
+# для каждой реализации берётся её копия (графы и матрицы весов у копий общие)
+_worker_template: Optional[EpidemicWithLockdown] = None
+
+
+def _init_worker(epidemic_factory: Callable[[], EpidemicWithLockdown]) -> None:
+    """
+    Инициализация процесса-исполнителя. Фабрика передаётся в процесс один раз,
+    а не вместе с каждой задачей
+
+    :param epidemic_factory: функция без аргументов, создающая эпидемию
+    :return:
+    """
+    global _worker_template
+    _worker_template = epidemic_factory()
+
+
+def _vectorized_mode(template: EpidemicWithLockdown, vectorized: Optional[bool]) -> bool:
+    """
+    Режим шага: заданный явно или, по умолчанию, векторизованный для ArrayEpidemicWithLockdown
+
+    :param template: эпидемия-шаблон
+    :param vectorized: векторизованный шаг или None
+    :return:
+    """
+    if vectorized is None:
+        return isinstance(template, ArrayEpidemicWithLockdown)
+
+    return vectorized
+
+
+def _run_replica(task: Tuple[np.random.SeedSequence, Tuple[int, int], int, Optional[bool]],
+                 template: Optional[EpidemicWithLockdown] = None) -> np.ndarray:
+    """
+    Одна реализация эпидемии
+
+    :param task: (поток случайных чисел, дни локдауна, кол-во итераций, векторизованный шаг)
+    :param template: эпидемия-шаблон; по умолчанию шаблон процесса-исполнителя
+    :return: матрица (t, 3) с числом вершин S, I, R на каждой итерации
+    """
+    seed_seq, lockdown_days, t, vectorized = task
+    template = _worker_template if template is None else template
+    np.random.seed(seed_seq.generate_state(4))
+
+    sampler = SamplerWithLockdown(template.copy(), lockdown_days, _vectorized_mode(template, vectorized))
+    sampler.run_epidemic(t)
+
+    return sampler.node_states.counts
+
+
+class EnsembleResult:
+    """
+    Результат ансамбля реализаций для одного окна локдауна
+    """
+
+    def __init__(self, lockdown_days: Tuple[int, int], counts: np.ndarray, quantiles: Sequence[float]):
+        """
+
+        :param lockdown_days: дни начала и конца локдауна (как в SamplerWithLockdown)
+        :param counts: тензор (R, T, 3) числа вершин S, I, R по реализациям и итерациям
+        :param quantiles: уровни квантилей для полос
+        """
+        self.lockdown_days = lockdown_days
+        self.counts = counts
+        self.quantiles = np.asarray(quantiles, dtype=float)
+        # тензор (Q, T, 3) квантилей по реализациям
+        self.bands = np.quantile(counts, self.quantiles, axis=0)
+
+    def band(self, state: NodeStates) -> np.ndarray:
+        """
+        :param state: класс вершин
+        :return: матрица (Q, T) квантилей числа вершин данного класса
+        """
+        return self.bands[:, :, state.value - 1]
+
+    def mean(self, state: NodeStates) -> np.ndarray:
+        """
+        :param state: класс вершин
+        :return: среднее по реализациям число вершин данного класса на каждой итерации
+        """
+        return self.counts[:, :, state.value - 1].mean(axis=0)
+
+
+def run_ensemble(epidemic_factory: Callable[[], EpidemicWithLockdown],
+                 lockdown_windows: Sequence[Tuple[int, int]], num_replicas: int, num_workers: int = 1,
+                 t: int = 50, seed: Optional[int] = None, quantiles: Sequence[float] = (0.05, 0.5, 0.95),
+                 vectorized: Optional[bool] = None) -> List[EnsembleResult]:
+    """
+    Запускает num_replicas реализаций эпидемии для каждого окна локдауна.
+    Реализации распределяются по пулу из num_workers процессов, у каждой реализации свой
+    независимый поток случайных чисел (SeedSequence.spawn). Для разных окон используются одни и те же
+    потоки, поэтому окна сравниваются на общих случайных числах
+
+    :param epidemic_factory: функция без аргументов, создающая эпидемию. Вызывается один раз в каждом
+                             процессе, поэтому графы передаются в процесс один раз, а не с каждой задачей.
+                             Должна сериализоваться pickle (функция модуля или functools.partial)
+    :param lockdown_windows: окна локдауна (начало, конец) в формате SamplerWithLockdown
+    :param num_replicas: кол-во реализаций на одно окно
+    :param num_workers: кол-во процессов; при 1 всё считается в текущем процессе
+    :param t: кол-во итераций в одной реализации
+    :param seed: зерно для порождения потоков случайных чисел
+    :param quantiles: уровни квантилей для полос
+    :param vectorized: использовать векторизованный шаг (нужна ArrayEpidemicWithLockdown);
+                       по умолчанию выбирается по типу эпидемии, которую создаёт фабрика
+    :return: результаты по окнам в том же порядке
+    """
+    seeds = np.random.SeedSequence(seed).spawn(num_replicas)
+    tasks = [(seed_seq, tuple(window), t, vectorized) for window in lockdown_windows for seed_seq in seeds]
+
+    if num_workers == 1:
+        template = epidemic_factory()
+        counts = [_run_replica(task, template) for task in tasks]
+    else:
+        chunk_size = max(1, len(tasks) // (4 * num_workers))
+        with ProcessPoolExecutor(max_workers=num_workers, initializer=_init_worker,
+                                 initargs=(epidemic_factory,)) as executor:
+            counts = list(executor.map(_run_replica, tasks, chunksize=chunk_size))
+
+    results = []
+    for window_num, window in enumerate(lockdown_windows):
+        window_counts = np.stack(counts[window_num * num_replicas:(window_num + 1) * num_replicas])
+        results.append(EnsembleResult(tuple(window), window_counts, quantiles))
+
+    return results
+
+
+def _branch_outcome(sampler: SamplerWithLockdown) -> Tuple[float, float, float]:
+    """
+    Итоги одной ветви
+
+    :param sampler: сэмплер, доведённый до конца горизонта
+    :return: (пик числа больных, кол-во заражений, день исчезновения больных или nan)
+    """
+    infected = sampler.node_states.num_of_nodes(NodeStates.Infected)
+    extinct_days = np.flatnonzero(infected == 0)
+    extinction_time = extinct_days[0] + 1 if len(extinct_days) > 0 else np.nan
+
+    return infected.max(), sampler.num_infections, extinction_time
+
+
+def _run_to(sampler: SamplerWithLockdown, num_steps: int) -> None:
+    """
+    Доводит сэмплер до num_steps сохранённых итераций
+
+    :param sampler: сэмплер
+    :param num_steps: требуемая длина траектории
+    :return:
+    """
+    sampler.run_epidemic(max(0, num_steps - len(sampler.node_states)))
+
+
+def _run_sweep_replica(task: Tuple[np.random.SeedSequence, List[int], List[int], int, Optional[bool]],
+                       template: Optional[EpidemicWithLockdown] = None) -> np.ndarray:
+    """
+    Все ячейки сетки (начало, длительность) для одной реализации.
+
+    Основная ветвь без локдауна считается один раз; в каждый день начала d от неё отделяется ветвь
+    с локдауном до конца горизонта, а от неё в каждый день окончания d + L ветвь (d, L).
+    Потоки случайных чисел: один на основную ветвь, один на ветвь локдауна для каждого d
+    (общий для всех L) и по одному на продолжение после окончания локдауна.
+    Для d, начинающихся после горизонта, все ячейки - итог основной ветви без локдауна
+
+    :param task: (поток случайных чисел, дни начала, длительности, горизонт, векторизованный шаг)
+    :param template: эпидемия-шаблон; по умолчанию шаблон процесса-исполнителя
+    :return: тензор (D, L, 3) итогов ветвей (см. _branch_outcome)
+    """
+    seed_seq, start_days, durations, t, vectorized = task
+    template = _worker_template if template is None else template
+    day_seqs = seed_seq.spawn(len(start_days) + 1)
+    ans = np.empty((len(start_days), len(durations), 3))
+
+    np.random.seed(day_seqs[-1].generate_state(4))
+    trunk = SamplerWithLockdown(template.copy(), vectorized=_vectorized_mode(template, vectorized))
+
+    for start_num in np.argsort(start_days):
+        start_day = start_days[start_num]
+        if start_day - 1 > t:
+            # локдаун начинается после горизонта: итог - основная ветвь, обрезанная по горизонту
+            _run_to(trunk, t)
+            ans[start_num] = _branch_outcome(trunk)
+            continue
+        _run_to(trunk, start_day - 1)
+        trunk_rng = np.random.get_state()
+
+        # ветвь с локдауном, не заканчивающимся в пределах горизонта
+        np.random.seed(day_seqs[start_num].generate_state(4))
+        lockdown = trunk.fork((start_day, t + 2))
+        end_seqs = day_seqs[start_num].spawn(len(durations))
+
+        for duration_num in np.argsort(durations):
+            end_day = start_day + durations[duration_num]
+            if end_day - 1 >= t:
+                continue
+            _run_to(lockdown, end_day - 1)
+            lockdown_rng = np.random.get_state()
+
+            np.random.seed(end_seqs[duration_num].generate_state(4))
+            branch = lockdown.fork((start_day, end_day))
+            _run_to(branch, t)
+            ans[start_num, duration_num] = _branch_outcome(branch)
+
+            np.random.set_state(lockdown_rng)
+
+        # локдауны, выходящие за горизонт, совпадают с ветвью локдауна
+        _run_to(lockdown, t)
+        for duration_num in range(len(durations)):
+            if start_day + durations[duration_num] - 1 >= t:
+                ans[start_num, duration_num] = _branch_outcome(lockdown)
+
+        np.random.set_state(trunk_rng)
+
+    return ans
+
+
+class LockdownSweepResult:
+    """
+    Итоги перебора расписаний локдауна: тензоры, индексированные (день начала, длительность, реализация)
+    """
+
+    def __init__(self, start_days: Sequence[int], durations: Sequence[int], outcomes: np.ndarray):
+        """
+
+        :param start_days: дни начала локдауна
+        :param durations: длительности локдауна
+        :param outcomes: тензор (R, D, L, 3) итогов ветвей
+        """
+        self.start_days = list(start_days)
+        self.durations = list(durations)
+        # пик числа больных
+        self.peak_infected = np.moveaxis(outcomes[..., 0], 0, -1)
+        # кол-во заражений за горизонт
+        self.cumulative_infections = np.moveaxis(outcomes[..., 1], 0, -1)
+        # первый день без больных (nan, если эпидемия не закончилась)
+        self.extinction_time = np.moveaxis(outcomes[..., 2], 0, -1)
+
+
+def sweep_lockdown_schedules(epidemic_factory: Callable[[], EpidemicWithLockdown], start_days: Sequence[int],
+                             durations: Sequence[int], num_replicas: int, num_workers: int = 1, t: int = 50,
+                             seed: Optional[int] = None, vectorized: Optional[bool] = None) -> LockdownSweepResult:
+    """
+    Контрфактический перебор локдаунов "начало в день d, длительность L" по сетке (d, L).
+    Общая часть траектории моделируется один раз и ответвляется в дни начала и окончания локдаунов
+    (см. _run_sweep_replica); реализации распределяются по процессам как в run_ensemble
+
+    :param epidemic_factory: функция без аргументов, создающая эпидемию (см. run_ensemble)
+    :param start_days: дни начала локдауна (нумерация от единицы, как в SamplerWithLockdown);
+                       локдауны, начинающиеся после горизонта, дают итог без локдауна
+    :param durations: длительности локдауна в днях (положительные)
+    :param num_replicas: кол-во реализаций
+    :param num_workers: кол-во процессов; при 1 всё считается в текущем процессе
+    :param t: горизонт моделирования в итерациях
+    :param seed: зерно для порождения потоков случайных чисел
+    :param vectorized: использовать векторизованный шаг (см. run_ensemble)
+    :return: тензоры итогов размера (D, L, R)
+    """
+    if min(start_days) < 1 or min(durations) < 1:
+        raise ValueError("Lockdown start days and durations must be positive")
+
+    seeds = np.random.SeedSequence(seed).spawn(num_replicas)
+    tasks = [(seed_seq, list(start_days), list(durations), t, vectorized) for seed_seq in seeds]
+
+    if num_workers == 1:
+        template = epidemic_factory()
+        outcomes = [_run_sweep_replica(task, template) for task in tasks]
+    else:
+        chunk_size = max(1, len(tasks) // (4 * num_workers))
+        with ProcessPoolExecutor(max_workers=num_workers, initializer=_init_worker,
+                                 initargs=(epidemic_factory,)) as executor:
+            outcomes = list(executor.map(_run_sweep_replica, tasks, chunksize=chunk_size))
+
+    return LockdownSweepResult(start_days, durations, np.stack(outcomes))
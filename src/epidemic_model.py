@@ -3,11 +3,17 @@
     с возможностью введения локдауна
 """
 import networkx as nx
+import numpy as np
+import scipy.sparse as sp
+from copy import copy
+from typing import Dict
 from typing import List
 from typing import Tuple
 from typing import Union
 from abc import abstractmethod
 from enum import Enum
+from contact_graph import ContactGraph
+from contact_graph import to_contact_graph
 
 
 class NodeStates(Enum):
@@ -21,7 +27,9 @@ class NodeStates(Enum):
 
 class BasicEpidemic:
     """
-    Базовый класс эпидемии. Хранит основной граф контактов и начальное распределение больных/здоровых
+    Базовый класс эпидемии. Хранит основной граф контактов и начальное распределение больных/здоровых.
+    Состояния и вероятности перехода вершин хранятся в самой эпидемии (node_info), граф контактов
+    только читается и не изменяется
     """
 
     def __init__(self, G: nx.Graph, init_distr: List[int]):
@@ -33,9 +41,9 @@ class BasicEpidemic:
         self.contact_graph = G
         self._ini_distr = init_distr
 
-        # инициализируем граф переданными начальными условиями
-        for node in self.contact_graph.nodes:
-            self.contact_graph.nodes[node]['state'] = init_distr[node]
+        # атрибуты вершин {вершина -> {'state': ..., 'prob': ...}} в порядке вершин графа,
+        # инициализируем переданными начальными условиями
+        self.node_info: Dict[int, Dict] = {node: {'state': init_distr[node]} for node in G.nodes}
 
     @abstractmethod
     def _eval_individ_prob(self, n: int) -> None:
@@ -58,10 +66,10 @@ class BasicEpidemic:
             self._eval_individ_prob(vertex)
 
     def copy(self):
-        new_G = self.contact_graph.copy()
         new_distr = self._ini_distr.copy()
 
-        return BasicEpidemic(new_G, new_distr)
+        # граф не изменяется эпидемией, поэтому у копий он общий
+        return BasicEpidemic(self.contact_graph, new_distr)
 
 
 class EpidemicWithLockdown(BasicEpidemic):
@@ -69,8 +77,8 @@ class EpidemicWithLockdown(BasicEpidemic):
         Эпидемия с локдауном и простым пересчётом вероятностей
     """
 
-    def __init__(self, G: nx.Graph, ini_distr: List[int],
-                 G_home: nx.Graph, sigma: float, xi: float, beta: Union[float, List[float]]):
+    def __init__(self, G: Union[nx.Graph, ContactGraph], ini_distr: List[int],
+                 G_home: Union[nx.Graph, ContactGraph], sigma: float, xi: float, beta: Union[float, List[float]]):
         """
         :param G:
         :param ini_distr:
@@ -79,6 +87,12 @@ class EpidemicWithLockdown(BasicEpidemic):
         :param xi: вероятность R -> S
         :param beta: коэффициенты восприимчивости к болезни вершин, в простейшем случае у всех одинковы
         """
+        # пересчёт идёт по графам networkx
+        if isinstance(G, ContactGraph):
+            G = G.graph
+        if isinstance(G_home, ContactGraph):
+            G_home = G_home.graph
+
         super().__init__(G, ini_distr)
         self.lockdown_contact_graph = G_home
         self.ordinary_contact_graph = G
@@ -89,103 +103,228 @@ class EpidemicWithLockdown(BasicEpidemic):
         else:
             self.personal_suceptabilities = [beta for i in range(len(G.nodes))]
 
-        # техническая копия текущего графа для корректного пересчёта вероятностей
-        self._G_copy = G.copy()
-
     def _eval_individ_prob(self, n: int) -> None:
         """
                 рассчитывает вероятность перехода в следующее состояние для данной вершины
             """
-        if self.contact_graph.nodes[n]['state'] == NodeStates.Infected:
-            self._G_copy.nodes[n]['prob'] = self.I_to_R_prob
-            self._G_copy.nodes[n]['state'] = NodeStates.Infected
-        elif self.contact_graph.nodes[n]['state'] == NodeStates.Recovered:
-            self._G_copy.nodes[n]['prob'] = self.R_to_S_prob
-            self._G_copy.nodes[n]['state'] = NodeStates.Recovered
-        elif self.contact_graph.nodes[n]['state'] == NodeStates.Sucept:
+        # состояния вершин общие для обоих слоёв, из текущего графа берутся только рёбра
+        node_info = self.node_info[n]
+        if node_info['state'] == NodeStates.Infected:
+            node_info['prob'] = self.I_to_R_prob
+        elif node_info['state'] == NodeStates.Recovered:
+            node_info['prob'] = self.R_to_S_prob
+        elif node_info['state'] == NodeStates.Sucept:
             # берём индивидуальную восприимчивость
             personal_sucept = self.personal_suceptabilities[n]
 
-            # берём номера всех больных соседей
-            infected_neighbours = list(filter(lambda x: self.contact_graph.nodes[x]['state'] ==
-                                                        NodeStates.Infected, self.contact_graph.adj[n]))
-
             # считаем вероятность заразиться
             # все больные соседи могут заразить независимо друг от друга
             cur_prob = 1
-            for neigb in infected_neighbours:
-                cur_prob *= 1 - personal_sucept * self.contact_graph.edges[n, neigb]['w']
+            for neigb, edge_attrs in self.contact_graph.adj[n].items():
+                if self.node_info[neigb]['state'] == NodeStates.Infected:
+                    cur_prob *= 1 - personal_sucept * edge_attrs['w']
             cur_prob = 1 - cur_prob
 
-            self._G_copy.nodes[n]['prob'] = cur_prob
-            self._G_copy.nodes[n]['state'] = NodeStates.Sucept
+            node_info['prob'] = cur_prob
 
     def copy(self):
-        new_G = self.ordinary_contact_graph.copy()
-        new_G_home = self.lockdown_contact_graph.copy()
+        """
+        Копия эпидемии с текущими состояниями вершин и текущим режимом
+
+        :return:
+        """
         new_distr = self._ini_distr.copy()
-        new_contact_graph = self.contact_graph.copy()
         new_beta = self.personal_suceptabilities.copy()
 
-        return EpidemicWithLockdown(new_contact_graph, new_distr, new_G_home, self.I_to_R_prob,
-                                    self.I_to_R_prob, new_beta)
+        # графы эпидемией не изменяются, поэтому у копий они общие
+        new_obj = EpidemicWithLockdown(self.ordinary_contact_graph, new_distr, self.lockdown_contact_graph,
+                                       self.I_to_R_prob, self.R_to_S_prob, new_beta)
 
-    def eval_probs(self) -> None:
-        super().eval_probs()
+        # переносим текущие состояния
+        new_obj.node_info = {node: node_info.copy() for node, node_info in self.node_info.items()}
+        if self.contact_graph is self.lockdown_contact_graph:
+            new_obj.contact_graph = new_obj.lockdown_contact_graph
 
-        # обновляем наш граф
-        self.contact_graph = self._G_copy.copy()
+        return new_obj
 
     def set_quarantine(self) -> None:
         """
-        Метод переводит граф в режим карантина и пересчитывает вероятности
-        Вызывать только после set_ordinary или после инициализации!
+        Метод переводит граф в режим карантина и пересчитывает вероятности.
+        Графы не копируются: состояния вершин хранятся в node_info, меняется только ссылка на текущий граф
+
+        :return:
+        """
+        self.contact_graph = self.lockdown_contact_graph
+        self.eval_probs()
+
+    def set_ordinary(self) -> None:
+        """
+        Метод переводит граф в стандартный режим и пересчитывает вероятности
 
         :return:
         """
-        # сохраняем текущее состояние
-        self.ordinary_contact_graph = self.contact_graph.copy()
+        self.contact_graph = self.ordinary_contact_graph
+        self.eval_probs()
 
-        self.contact_graph = self.lockdown_contact_graph.copy()
-        # переносим состояния вершин в новый граф
-        for node_num, node in self.ordinary_contact_graph.nodes.data():
-            node_state = node['state']
 
-            self.contact_graph.nodes[node_num]['state'] = node_state
+class ArrayEpidemicWithLockdown(EpidemicWithLockdown):
+    """
+        Эпидемия с локдауном, хранящая состояния вершин в массиве numpy (int8, значения NodeStates),
+        а веса рёбер обоих режимов в разреженных матрицах. Вероятности заражения пересчитываются
+        сразу для всех вершин одним умножением матрицы на вектор:
 
-        # вычищаем старые вероятности
-        for node_num, node in self.contact_graph.nodes.data():
-            if 'prob' in node.keys():
-                del self.contact_graph.nodes[node_num]['prob']
+        p_i = 1 - exp(sum_j log(1 - beta_i * w_ij) * I_j)
 
-        # пересчитываем вероятности для согласованности
-        self._G_copy = self.contact_graph.copy()
-        self.eval_probs()
+        Матрицы берутся из ContactGraph (графы networkx переводятся в него один раз, см. from_networkx).
+        Графы networkx не копируются и не используются при пересчёте, атрибуты вершин в виде node_info
+        собираются из массивов только при обращении (например, для отрисовки)
+    """
 
-    def set_ordinary(self) -> None:
+    def __init__(self, G: Union[nx.Graph, ContactGraph], ini_distr: List[NodeStates],
+                 G_home: Union[nx.Graph, ContactGraph], sigma: float, xi: float, beta: Union[float, List[float]]):
+        """
+        :param G: граф обычного режима (networkx или ContactGraph)
+        :param ini_distr: начальное распределение больных
+        :param G_home: граф режима карантин (networkx или ContactGraph)
+        :param sigma: вероятность I -> R
+        :param xi: вероятность R -> S
+        :param beta: коэффициенты восприимчивости к болезни вершин, в простейшем случае у всех одинковы
+        """
+        self._ini_distr = ini_distr
+        self._ordinary_contacts = to_contact_graph(G)
+        self._lockdown_contacts = to_contact_graph(G_home)
+        self.I_to_R_prob = sigma
+        self.R_to_S_prob = xi
+        if type(beta) is list:
+            self.personal_suceptabilities = beta
+        else:
+            self.personal_suceptabilities = [beta for i in range(self._ordinary_contacts.num_nodes)]
+
+        # матрицы log(1 - beta_i * w_ij) для обоих режимов (общие для всех эпидемий на этих графах)
+        beta_array = np.asarray(self.personal_suceptabilities, dtype=float)
+        self._log_weights_ordinary = self._ordinary_contacts.log_weights(beta_array)
+        self._log_weights_lockdown = self._lockdown_contacts.log_weights(beta_array)
+
+        # текущий режим: матрица и граф, на которые он указывает
+        self._log_weights = self._log_weights_ordinary
+        self._cur_contacts = self._ordinary_contacts
+
+        # состояния и вероятности перехода всех вершин
+        self.states = np.array([state.value for state in ini_distr], dtype=np.int8)
+        self.probs = np.zeros(len(self.states))
+
+    @property
+    def ordinary_contact_graph(self) -> nx.Graph:
+        """
+        Граф обычного режима (для графа, заданного только матрицами, строится при первом обращении)
+
+        :return:
+        """
+        return self._ordinary_contacts.graph
+
+    @property
+    def lockdown_contact_graph(self) -> nx.Graph:
+        """
+        Граф режима карантин
+
+        :return:
+        """
+        return self._lockdown_contacts.graph
+
+    @property
+    def log_weights_ordinary(self) -> sp.csr_matrix:
+        """
+        Матрица log(1 - beta_i * w_ij) обычного режима (общая для эпидемий на этих графах, изменять её нельзя)
+
+        :return:
+        """
+        return self._log_weights_ordinary
+
+    @property
+    def log_weights_lockdown(self) -> sp.csr_matrix:
+        """
+        Матрица log(1 - beta_i * w_ij) режима карантин
+
+        :return:
+        """
+        return self._log_weights_lockdown
+
+    @property
+    def contact_graph(self) -> nx.Graph:
         """
-                Метод переводит граф в стандартный режим и пересчитывает вероятности
-                Вызывать только после set_quarantine!
+        Граф текущего режима (общий для всех эпидемий на этих графах, изменять его нельзя)
 
-                :return:
-                """
-        # сохраняем текущее состояние
-        self.lockdown_contact_graph = self.contact_graph.copy()
+        :return:
+        """
+        return self._cur_contacts.graph
 
-        self.contact_graph = self.ordinary_contact_graph.copy()
-        # переносим состояния вершин в новый граф
-        for node_num, node in self.lockdown_contact_graph.nodes.data():
-            node_state = node['state']
+    @property
+    def node_info(self) -> Dict[int, Dict]:
+        """
+        Атрибуты вершин {вершина -> {'state': ..., 'prob': ...}}, как у EpidemicWithLockdown.
+        Собираются из массивов при каждом обращении, поэтому в циклах лучше использовать states и probs
 
-            self.contact_graph.nodes[node_num]['state'] = node_state
+        :return:
+        """
+        return {node: {'state': NodeStates(state), 'prob': prob}
+                for node, (state, prob) in enumerate(zip(self.states, self.probs))}
 
-        # вычищаем старые вероятности
-        for node_num, node in self.contact_graph.nodes.data():
-            if 'prob' in node.keys():
-                del self.contact_graph.nodes[node_num]['prob']
+    def _eval_individ_prob(self, n: int) -> None:
+        """
+            рассчитывает вероятность перехода в следующее состояние для данной вершины
+        """
+        if self.states[n] == NodeStates.Infected.value:
+            self.probs[n] = self.I_to_R_prob
+        elif self.states[n] == NodeStates.Recovered.value:
+            self.probs[n] = self.R_to_S_prob
+        else:
+            row = slice(self._log_weights.indptr[n], self._log_weights.indptr[n + 1])
+            neighbours = self._log_weights.indices[row]
+            infected = self.states[neighbours] == NodeStates.Infected.value
+            self.probs[n] = -np.expm1(np.sum(self._log_weights.data[row][infected]))
+
+    def eval_probs(self) -> None:
+        infected = self.states == NodeStates.Infected.value
+        recovered = self.states == NodeStates.Recovered.value
 
-        # пересчитываем вероятности для согласованности
-        self._G_copy = self.contact_graph.copy()
+        # вероятность заразиться для всех вершин сразу
+        probs = -np.expm1(self._log_weights @ infected.astype(float))
+        probs[infected] = self.I_to_R_prob
+        probs[recovered] = self.R_to_S_prob
+
+        self.probs = probs
+
+    def copy(self):
+        """
+        Копия эпидемии. Матрицы весов и графы не изменяются при моделировании, поэтому
+        разделяются между копиями, копируются только состояния и вероятности
+
+        :return:
+        """
+        new_obj = copy(self)
+        new_obj.states = self.states.copy()
+        new_obj.probs = self.probs.copy()
+
+        return new_obj
+
+    def set_quarantine(self) -> None:
+        """
+        Метод переводит эпидемию в режим карантина и пересчитывает вероятности
+
+        :return:
+        """
+        self._log_weights = self._log_weights_lockdown
+        self._cur_contacts = self._lockdown_contacts
+        self.eval_probs()
+
+    def set_ordinary(self) -> None:
+        """
+        Метод переводит эпидемию в стандартный режим и пересчитывает вероятности
+
+        :return:
+        """
+        self._log_weights = self._log_weights_ordinary
+        self._cur_contacts = self._ordinary_contacts
         self.eval_probs()
 
 
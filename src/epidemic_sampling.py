@@ -4,23 +4,148 @@
 """
 
 import numpy as np
+from copy import copy
 from epidemic_model import *
 
 
+class TrajectoryBuffer:
+    """
+    Хранилище состояний вершин по итерациям: матрица (T, N) значений NodeStates типа int8,
+    растущая блоками фиксированного размера (старые блоки при росте не копируются).
+    Вместе с состояниями ведётся число вершин каждого класса на каждой итерации,
+    поэтому для графиков и сводок не нужно просматривать всю историю
+    """
+
+    def __init__(self, num_nodes: int, chunk_size: int = 256):
+        """
+
+        :param num_nodes: число вершин
+        :param chunk_size: число итераций в одном блоке
+        """
+        self.num_nodes = num_nodes
+        self.chunk_size = chunk_size
+        # блоки состояний (chunk_size, N) и кол-в вершин по классам (chunk_size, 3)
+        self._chunks = []
+        self._count_chunks = []
+        self._len = 0
+        # последний блок может быть общим с копией буфера, тогда перед записью его нужно скопировать
+        self._owns_tail = True
+
+    def __len__(self) -> int:
+        return self._len
+
+    def append(self, states: np.ndarray) -> None:
+        """
+        Добавляет состояния вершин на очередной итерации
+
+        :param states: массив значений NodeStates длины N
+        :return:
+        """
+        row = self._len % self.chunk_size
+        if row == 0:
+            self._chunks.append(np.empty((self.chunk_size, self.num_nodes), dtype=np.int8))
+            self._count_chunks.append(np.empty((self.chunk_size, 3), dtype=np.int64))
+            self._owns_tail = True
+        elif not self._owns_tail:
+            self._chunks[-1] = self._chunks[-1].copy()
+            self._count_chunks[-1] = self._count_chunks[-1].copy()
+            self._owns_tail = True
+
+        self._chunks[-1][row] = states
+        self._count_chunks[-1][row] = np.bincount(self._chunks[-1][row], minlength=4)[1:4]
+        self._len += 1
+
+    def to_array(self) -> np.ndarray:
+        """
+        :return: все сохранённые состояния одной матрицей (T, N)
+        """
+        if self._len == 0:
+            return np.empty((0, self.num_nodes), dtype=np.int8)
+
+        return np.concatenate(self._chunks)[:self._len]
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        ans = self.to_array()
+        if dtype is not None:
+            ans = ans.astype(dtype)
+
+        return ans
+
+    def __getitem__(self, idx):
+        if isinstance(idx, (int, np.integer)):
+            if idx < 0:
+                idx += self._len
+            if not 0 <= idx < self._len:
+                raise IndexError("trajectory index out of range")
+
+            return self._chunks[idx // self.chunk_size][idx % self.chunk_size]
+
+        return self.to_array()[idx]
+
+    def __iter__(self):
+        for i in range(self._len):
+            yield self[i]
+
+    @property
+    def counts(self) -> np.ndarray:
+        """
+        :return: матрица (T, 3) с числом вершин S, I, R на каждой итерации
+        """
+        if self._len == 0:
+            return np.empty((0, 3), dtype=np.int64)
+
+        return np.concatenate(self._count_chunks)[:self._len]
+
+    def num_of_nodes(self, state: NodeStates) -> np.ndarray:
+        """
+        :param state: класс вершин
+        :return: число вершин данного класса на каждой итерации
+        """
+        return self.counts[:, state.value - 1]
+
+    def copy(self) -> 'TrajectoryBuffer':
+        """
+        Копия буфера. Заполненные блоки больше не изменяются и разделяются между копиями,
+        последний блок копируется при первой записи в него
+
+        :return:
+        """
+        new_obj = TrajectoryBuffer(self.num_nodes, self.chunk_size)
+        new_obj._chunks = self._chunks.copy()
+        new_obj._count_chunks = self._count_chunks.copy()
+        new_obj._len = self._len
+        new_obj._owns_tail = False
+        self._owns_tail = False
+
+        return new_obj
+
+
 class BasicSampler:
     """
     Базовый класс сэмплирования эпидемии. Умеет делать одну итерацию
     моделирования эпидемии. Сохраняет картину распределения вершин по болезни после каждой итерации
     """
 
-    def __init__(self, epidemic: BasicEpidemic):
+    def __init__(self, epidemic: BasicEpidemic, vectorized: bool = False):
         """
 
         :param epidemic: эпидемия для сэмплирования
+        :param vectorized: сэмплировать все вершины за одну операцию над массивами
+                           (только для ArrayEpidemicWithLockdown)
         """
+        if vectorized and not isinstance(epidemic, ArrayEpidemicWithLockdown):
+            raise ValueError("Vectorized sampling requires ArrayEpidemicWithLockdown")
+
         self.epidemic = epidemic
-        # массив для хранения состояния вершин на каждой итерации
-        self.node_states = []
+        self.vectorized = vectorized
+        # хранилище состояний вершин на каждой итерации
+        if isinstance(epidemic, ArrayEpidemicWithLockdown):
+            num_nodes = len(epidemic.states)
+        else:
+            num_nodes = epidemic.contact_graph.number_of_nodes()
+        self.node_states = TrajectoryBuffer(num_nodes)
+        # кол-во заражений (переходов S -> I) за всё время сэмплирования
+        self.num_infections = 0
 
         # оцениваем вероятности для начального распределения
         # корректно инициализируем эпидемию для сэмплирования
@@ -49,10 +174,28 @@ class BasicSampler:
         :return:
         """
         # сэмплируем
-        for node in self.epidemic.contact_graph.nodes.data():
-            node_info = node[1]
-            if np.random.rand(1)[0] < node_info['prob']:
-                node_info['state'] = self._next_state(node_info['state'])
+        if self.vectorized:
+            # все равномерные величины разом (та же последовательность, что и при поочерёдных вызовах)
+            states = self.epidemic.states
+            advance = np.random.rand(len(states)) < self.epidemic.probs
+            self.num_infections += np.count_nonzero(advance & (states == NodeStates.Sucept.value))
+            # цикл S -> I -> R -> S на значениях NodeStates (1, 2, 3)
+            states[advance] = states[advance] % 3 + 1
+        elif isinstance(self.epidemic, ArrayEpidemicWithLockdown):
+            # состояния и вероятности хранятся в массивах эпидемии
+            states = self.epidemic.states
+            probs = self.epidemic.probs
+            for node in range(len(states)):
+                if np.random.rand(1)[0] < probs[node]:
+                    if states[node] == NodeStates.Sucept.value:
+                        self.num_infections += 1
+                    states[node] = self._next_state(NodeStates(states[node])).value
+        else:
+            for node_info in self.epidemic.node_info.values():
+                if np.random.rand(1)[0] < node_info['prob']:
+                    if node_info['state'] == NodeStates.Sucept:
+                        self.num_infections += 1
+                    node_info['state'] = self._next_state(node_info['state'])
 
         # пересчитываем вероятности
         self.epidemic.eval_probs()
@@ -64,22 +207,39 @@ class BasicSampler:
 
         :return:
         """
-        # выделяю память под текущюю итерацию
-        self.node_states.append(np.empty(self.epidemic.contact_graph.number_of_nodes()))
-        cur_stage = len(self.node_states) - 1
+        if isinstance(self.epidemic, ArrayEpidemicWithLockdown):
+            self.node_states.append(self.epidemic.states)
+            return
 
-        for node in self.epidemic.contact_graph.nodes.data():
+        cur_states = np.empty(self.node_states.num_nodes, dtype=np.int8)
+        for node_number, node_info in self.epidemic.node_info.items():
             # сохраняю состояние
-            node_info = node[1]
-            node_number = node[0]
-            self.node_states[cur_stage][node_number] = node_info['state'].value
+            cur_states[node_number] = node_info['state'].value
+
+        self.node_states.append(cur_states)
 
     def copy(self):
         new_epidemic = self.epidemic.copy()
         node_states = self.node_states.copy()
 
-        new_obj = BasicSampler(new_epidemic)
+        new_obj = BasicSampler(new_epidemic, self.vectorized)
         new_obj.node_states = node_states
+        new_obj.num_infections = self.num_infections
+
+        return new_obj
+
+    def fork(self) -> 'BasicSampler':
+        """
+        Ответвление сэмплера для независимого продолжения эпидемии.
+        Ветвь разделяет с исходным сэмплером уже сохранённую траекторию (блоки буфера копируются
+        только при записи) и неизменяемые структуры эпидемии; для ArrayEpidemicWithLockdown копируются
+        только массивы состояний и вероятностей
+
+        :return:
+        """
+        new_obj = copy(self)
+        new_obj.epidemic = self.epidemic.copy()
+        new_obj.node_states = self.node_states.copy()
 
         return new_obj
 
@@ -108,12 +268,14 @@ class SamplerWithLockdown(BasicSampler):
     Каждая итерация в обычном режиме: одно сэмплирование ordinary, одно home
     Каждая итерация в lockdown режиме: два сэмплирования home
     """
-    def __init__(self, epidemic: EpidemicWithLockdown, lockdown_days: Tuple[int, int] = (-1, -1)):
+    def __init__(self, epidemic: EpidemicWithLockdown, lockdown_days: Tuple[int, int] = (-1, -1),
+                 vectorized: bool = False):
         """
         :param epidemic:
         :param lockdown_days: номер итерации для начала и конца эпидемии (невключительно; нумерация от единицы)
+        :param vectorized: см. BasicSampler
         """
-        super().__init__(epidemic)
+        super().__init__(epidemic, vectorized)
 
         self.lockdown_days = list(lockdown_days)
         # переводим время начала и конца в интервал от 0 до N
@@ -163,11 +325,126 @@ class SamplerWithLockdown(BasicSampler):
         lockdown_days = list(map(lambda x: x + 1, lockdown_days))
         node_states = self.node_states.copy()
 
-        new_obj = SamplerWithLockdown(new_epidemic, lockdown_days)
+        new_obj = SamplerWithLockdown(new_epidemic, lockdown_days, self.vectorized)
         new_obj.node_states = node_states
+        new_obj.num_infections = self.num_infections
 
         return new_obj
 
+    def fork(self, lockdown_days: Tuple[int, int] = None) -> 'SamplerWithLockdown':
+        """
+        Ответвление сэмплера (см. BasicSampler.fork), возможно с другими днями локдауна
+
+        :param lockdown_days: дни локдауна ветви в формате конструктора; по умолчанию как у исходного
+        :return:
+        """
+        new_obj = super().fork()
+        if lockdown_days is None:
+            new_obj.lockdown_days = self.lockdown_days.copy()
+        else:
+            new_obj.lockdown_days = [day - 1 for day in lockdown_days]
+
+        return new_obj
+
+
+class BatchSamplerWithLockdown:
+    """
+    Сэмплер R независимых реализаций эпидемии с локдауном, хранящий их состояния одной матрицей (R, N).
+    Расписание дней такое же, как у SamplerWithLockdown; на каждом полушаге вероятности заражения
+    для всех реализаций считаются одним произведением разреженной матрицы на плотную (N, R)
+    """
+
+    def __init__(self, epidemic: ArrayEpidemicWithLockdown, num_replicas: int,
+                 lockdown_days: Tuple[int, int] = (-1, -1), init_states: np.ndarray = None):
+        """
+
+        :param epidemic: эпидемия, из которой берутся матрицы весов и параметры (сама не изменяется)
+        :param num_replicas: кол-во реализаций
+        :param lockdown_days: номер итерации для начала и конца эпидемии (невключительно; нумерация от единицы)
+        :param init_states: начальные состояния (R, N); по умолчанию у всех реализаций состояния эпидемии
+        """
+        self.epidemic = epidemic
+        self.num_replicas = num_replicas
+
+        if init_states is None:
+            self.states = np.tile(epidemic.states, (num_replicas, 1))
+        else:
+            self.states = np.array(init_states, dtype=np.int8)
+
+        self.lockdown_days = list(lockdown_days)
+        # переводим время начала и конца в интервал от 0 до N
+        self.lockdown_days[0] -= 1
+        self.lockdown_days[1] -= 1
+
+        # число вершин S, I, R в каждой реализации после каждой итерации
+        self._counts = []
+
+    def _probs(self, log_weights: sp.csr_matrix) -> np.ndarray:
+        """
+        Вероятности перехода для всех реализаций
+
+        :param log_weights: матрица log(1 - beta_i * w_ij) текущего режима
+        :return: матрица (R, N)
+        """
+        infected = self.states == NodeStates.Infected.value
+        recovered = self.states == NodeStates.Recovered.value
+
+        probs = -np.expm1(log_weights @ infected.T.astype(float)).T
+
+        return np.where(infected, self.epidemic.I_to_R_prob, np.where(recovered, self.epidemic.R_to_S_prob, probs))
+
+    def _half_step(self, log_weights: sp.csr_matrix) -> None:
+        """
+        Одно сэмплирование всех реализаций на графе заданного режима
+
+        :param log_weights: матрица log(1 - beta_i * w_ij) режима
+        :return:
+        """
+        advance = np.random.rand(*self.states.shape) < self._probs(log_weights)
+        # цикл S -> I -> R -> S на значениях NodeStates (1, 2, 3) без выборки по маске
+        self.states += advance
+        self.states -= 3 * (self.states > NodeStates.Recovered.value)
+
+    def make_one_step(self) -> None:
+        """
+        Делает одну итерацию (два сэмплирования) для всех реализаций и сохраняет кол-ва вершин по классам
+
+        :return:
+        """
+        cur_step = len(self._counts)
+        ordinary = self.epidemic.log_weights_ordinary
+        lockdown = self.epidemic.log_weights_lockdown
+
+        if self.lockdown_days[0] <= cur_step < self.lockdown_days[1]:
+            self._half_step(lockdown)
+            self._half_step(lockdown)
+        else:
+            self._half_step(ordinary)
+            self._half_step(lockdown)
+
+        counts = np.stack([np.count_nonzero(self.states == state.value, axis=1) for state in NodeStates], axis=1)
+        self._counts.append(counts)
+
+    def run_epidemic(self, t: int = 50) -> None:
+        """
+        Запускает t итераций
+
+        :param t: кол-во итераций
+        :return:
+        """
+        for i in range(t):
+            self.make_one_step()
+
+    @property
+    def counts(self) -> np.ndarray:
+        """
+        :return: тензор (T, R, 3) числа вершин S, I, R по итерациям и реализациям
+        """
+        if len(self._counts) == 0:
+            return np.empty((0, self.num_replicas, 3), dtype=np.int64)
+
+        return np.stack(self._counts)
+
 
 class ComparasionSampler:
     """
@@ -192,7 +469,7 @@ class ComparasionSampler:
         """
         # момент разделения
         if self.cur_day == self._independance_day:
-            self.no_lockdown_sampler = self.lockdown_sampler.copy()
+            self.no_lockdown_sampler = self.lockdown_sampler.fork()
             # снимаем эпидемию для no_lockdown
             self.no_lockdown_sampler.lockdown_days = [-1, -1]
 
@@ -215,6 +492,77 @@ class ComparasionSampler:
             self.make_one_step()
 
 
+class MultiComparasionSampler:
+    """
+    Сэмплер, сравнивающий несколько сценариев локдауна с общей предысторией.
+    Основная ветвь моделирует эпидемию без локдауна; в день начала очередного локдауна от неё
+    отделяется ветвь с этим локдауном (SamplerWithLockdown.fork), так что общая часть траектории
+    не пересчитывается и не копируется.
+    Каждая ветвь получает состояние генератора случайных чисел основной ветви на момент отделения и дальше
+    продолжает его сама, поэтому ветвь совпадает с отдельным SamplerWithLockdown, запущенным с тем же
+    состоянием генератора, а основная ветвь - с сэмплером без локдауна
+    """
+    def __init__(self, sampler: SamplerWithLockdown, lockdown_windows: List[Tuple[int, int]]):
+        """
+
+        :param sampler: сэмплер, продолжением которого служит основная ветвь (сам не изменяется);
+                        его собственные дни локдауна не используются
+        :param lockdown_windows: окна локдауна ветвей в формате конструктора SamplerWithLockdown;
+                                 локдаун не может начинаться раньше следующей итерации сэмплера
+        """
+        if any(window[0] - 1 < len(sampler.node_states) for window in lockdown_windows):
+            raise ValueError("Lockdown windows must start after the sampler's current day")
+
+        self.no_lockdown_sampler = sampler.fork()
+        self.no_lockdown_sampler.lockdown_days = [-1, -1]
+        self.no_lockdown_sampler.epidemic.set_ordinary()
+        self.lockdown_windows = [tuple(window) for window in lockdown_windows]
+        # ветви с локдауном; None, пока ветвь не отделилась
+        self.lockdown_samplers: List[Union[SamplerWithLockdown, None]] = [None for window in lockdown_windows]
+        # состояния генератора случайных чисел ветвей
+        self._rng_states = [None for window in lockdown_windows]
+
+    @property
+    def cur_day(self) -> int:
+        """
+        Счётчик дней: кол-во итераций в траектории основной ветви (вместе с предысторией сэмплера)
+
+        :return:
+        """
+        return len(self.no_lockdown_sampler.node_states)
+
+    def make_one_step(self):
+        """
+        Отделяет ветви, у которых сегодня начинается локдаун, и делает один шаг для всех активных ветвей
+
+        :return:
+        """
+        trunk_rng = np.random.get_state()
+        for branch_num, window in enumerate(self.lockdown_windows):
+            if self.lockdown_samplers[branch_num] is None and self.cur_day >= window[0] - 1:
+                self.lockdown_samplers[branch_num] = self.no_lockdown_sampler.fork(window)
+                self._rng_states[branch_num] = trunk_rng
+
+        for branch_num, branch in enumerate(self.lockdown_samplers):
+            if branch is not None:
+                np.random.set_state(self._rng_states[branch_num])
+                branch.make_one_step()
+                self._rng_states[branch_num] = np.random.get_state()
+
+        np.random.set_state(trunk_rng)
+        self.no_lockdown_sampler.make_one_step()
+
+    def run(self, t: int):
+        """
+        Итерируеся t раз
+
+        :param t: кол-во итераций
+        :return:
+        """
+        for i in range(t):
+            self.make_one_step()
+
+
 
 # # Tests
 # import graphs_generators as gr_gen
@@ -3,6 +3,70 @@
 """
 import networkx as nx
 import numpy as np
+import scipy.sparse as sp
+from typing import Tuple
+from typing import Union
+
+def _sample_pair_indices(num_pairs: int, E_num: int) -> np.ndarray:
+    """
+    Выбирает E_num различных чисел из 0, ..., num_pairs - 1 без построения всего множества:
+    числа досэмплируются, пока после удаления повторов их не станет E_num
+
+    :param num_pairs: размер множества
+    :param E_num: сколько чисел выбрать
+    :return: отсортированный массив выбранных чисел
+    """
+    if E_num > num_pairs:
+        raise ValueError("Cannot take a larger sample than population")
+
+    # при плотном графе проще выбрать пары, которых не будет
+    if E_num > num_pairs // 2:
+        excluded = _sample_pair_indices(num_pairs, num_pairs - E_num)
+        return np.setdiff1d(np.arange(num_pairs, dtype=np.int64), excluded, assume_unique=True)
+
+    chosen = np.empty(0, dtype=np.int64)
+    while len(chosen) < E_num:
+        new_indices = np.random.randint(0, num_pairs, size=E_num - len(chosen), dtype=np.int64)
+        # повторы удаляются сортировкой (np.unique для больших массивов заметно медленнее)
+        chosen = np.sort(np.concatenate([chosen, new_indices]))
+        chosen = chosen[np.concatenate([[True], chosen[1:] != chosen[:-1]])]
+
+    return chosen
+
+
+def _decode_pair_indices(N: int, pair_indices: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Переводит номера пар в концы рёбер (i, j), i < j. Пары занумерованы построчно:
+    (0, 1), ..., (0, N-1), (1, 2), ..., (N-2, N-1); строка i начинается с номера i * (2N - i - 1) / 2
+
+    :param N: число вершин
+    :param pair_indices: номера пар
+    :return: массивы i и j
+    """
+    # строка находится из квадратного уравнения, затем поправляется на ошибку округления
+    b = 2 * N - 1
+    i = np.floor((b - np.sqrt(b * b - 8.0 * pair_indices)) / 2).astype(np.int64)
+    i -= (i * (b - i) // 2) > pair_indices
+    i += ((i + 1) * (b - i - 1) // 2) <= pair_indices
+    j = pair_indices - i * (b - i) // 2 + i + 1
+
+    return i, j
+
+
+def _random_working_edges(N: int, E_num: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Случайные E_num рёбер на N вершинах с весами интенсивностей [0, 1] за O(E_num)
+
+    :param N: число вершин
+    :param E_num: число рёбер
+    :return: массивы концов рёбер i < j и весов
+    """
+    pair_indices = _sample_pair_indices(N * (N - 1) // 2, E_num)
+    i, j = _decode_pair_indices(N, pair_indices)
+    weights = np.round(np.random.rand(E_num), 3)
+
+    return i, j, weights
+
 
 def random_working_graph(N: int, E_num: int) -> nx.Graph:
     """
@@ -14,27 +78,76 @@ def random_working_graph(N: int, E_num: int) -> nx.Graph:
     """
     G = nx.Graph()
     # узлы с номерами от 0 до N-1
-    G.add_nodes_from([num for num in range(N)])
+    G.add_nodes_from(range(N))
 
-    # создаём все возможные рёбра
-    all_edge_set = []
-    for i in range(N):
-        for j in range(i+1, N):
-            all_edge_set.append((i, j))
+    # добавляем рёбра со случайными весами интенсивностей [0, 1]
+    i, j, weights = _random_working_edges(N, E_num)
+    G.add_edges_from(zip(i.tolist(), j.tolist(), ({'w': w} for w in weights.tolist())))
 
-    all_edge_set = np.array(all_edge_set)
-    # выбираем E_num из них
-    edge_list = np.random.choice(np.arange(all_edge_set.shape[0]), E_num, replace=False)
-    edge_list = all_edge_set[edge_list]
-    G.add_edges_from(edge_list)
+    return G
 
-    # добавляем рандомные веса интенсивностей [0, 1]
-    for edge in G.edges:
-        G.edges[edge]['w'] = np.round(np.random.rand(1)[0], 3)
 
-    return G
+def random_working_csr(N: int, E_num: int) -> sp.csr_matrix:
+    """
+    То же, что random_working_graph, но без графа networkx: симметричная матрица весов в формате CSR
+    (подходит для ContactGraph и графов с миллионами вершин)
 
-def random_home_graph(N: int, max_click_size = 5) -> nx.Graph:
+    :param N: число вершин
+    :param E_num: число ребёр
+    :return: матрица весов (N, N)
+    """
+    i, j, weights = _random_working_edges(N, E_num)
+
+    return _symmetric_csr(N, i, j, weights)
+
+def _household_sizes(N: int, max_click_size: int) -> np.ndarray:
+    """
+    Размеры клик (домохозяйств): равновероятно от 1 до max_click_size, последняя клика
+    получает оставшиеся вершины. Все размеры вытягиваются сразу, а не по одному
+
+    :param N: число вершин
+    :param max_click_size: максимально допустимый размер клики
+    :return: массив размеров с суммой N
+    """
+    sizes = np.empty(0, dtype=np.int64)
+    while sizes.sum() < N:
+        # с запасом относительно среднего размера (1 + max_click_size) / 2
+        num_new = 2 * (N - sizes.sum()) // (max_click_size + 1) + 1
+        sizes = np.concatenate([sizes, np.random.randint(1, max_click_size + 1, size=num_new)])
+
+    ends = np.cumsum(sizes)
+    num_households = np.searchsorted(ends, N) + 1 if N > 0 else 0
+    sizes = sizes[:num_households]
+    if num_households > 0:
+        sizes[-1] = N - (ends[num_households - 2] if num_households > 1 else 0)
+
+    return sizes
+
+
+def _random_home_edges(N: int, max_click_size: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Рёбра графа из последовательных клик со случайными весами интенсивностей [0, 1]
+
+    :param N: число вершин
+    :param max_click_size: максимально допустимый размер клики
+    :return: массивы концов рёбер i < j, весов и номеров домохозяйств вершин
+    """
+    sizes = _household_sizes(N, max_click_size)
+    households = np.repeat(np.arange(len(sizes)), sizes)
+    # первая вершина после клики каждой вершины
+    ends = np.cumsum(sizes)[households]
+
+    # вершина v соединена с v + 1, ..., end_v - 1
+    num_higher = ends - np.arange(N) - 1
+    i = np.repeat(np.arange(N), num_higher)
+    j = i + 1 + np.arange(len(i)) - np.repeat(np.cumsum(num_higher) - num_higher, num_higher)
+    weights = np.round(np.random.rand(len(i)), 3)
+
+    return i, j, weights, households
+
+
+def random_home_graph(N: int, max_click_size=5,
+                      return_households: bool = False) -> Union[nx.Graph, Tuple[nx.Graph, np.ndarray]]:
     """
     Генерирует случайный граф, состоящий из клик размера не более max_click_size
 
@@ -43,32 +156,56 @@ def random_home_graph(N: int, max_click_size = 5) -> nx.Graph:
 
     :param N: число вершин
     :param max_click_size: максимально допустимый размер клики
-    :return: сам граф
+    :param return_households: вернуть ли также номера клик (домохозяйств) вершин
+    :return: сам граф (и массив номеров клик)
     """
     G = nx.Graph()
-    G.add_nodes_from([num for num in range(N)])
+    G.add_nodes_from(range(N))
 
-    # размер следующей клики
-    next_size = np.random.random_integers(low=1, high=max_click_size)
-    # номер вершины, с которой будет начинаться следующая клика
-    next_num = 0
-    total_number = N
-    while total_number - next_size > 0:
-        click = nx.complete_graph(range(next_num, next_num + next_size))
-        G = nx.compose(G, click)
+    # добавляем рёбра клик со случайными весами интенсивностей [0, 1]
+    i, j, weights, households = _random_home_edges(N, max_click_size)
+    G.add_edges_from(zip(i.tolist(), j.tolist(), ({'w': w} for w in weights.tolist())))
 
-        next_num += next_size
-        total_number -= next_size
-        next_size = np.random.random_integers(1, max_click_size)
+    if return_households:
+        return G, households
 
-    click = nx.complete_graph(range(next_num, N))
-    G = nx.compose(G, click)
+    return G
 
-    # добавляем рандомные веса интенсивностей [0, 1]
-    for edge in G.edges:
-        G.edges[edge]['w'] = np.round(np.random.rand(1)[0], 3)
 
-    return G
+def random_home_csr(N: int, max_click_size=5,
+                    return_households: bool = False) -> Union[sp.csr_matrix, Tuple[sp.csr_matrix, np.ndarray]]:
+    """
+    То же, что random_home_graph, но без графа networkx: блочно-диагональная матрица весов в формате CSR
+
+    :param N: число вершин
+    :param max_click_size: максимально допустимый размер клики
+    :param return_households: вернуть ли также номера клик (домохозяйств) вершин
+    :return: матрица весов (N, N) (и массив номеров клик)
+    """
+    i, j, weights, households = _random_home_edges(N, max_click_size)
+    matrix = _symmetric_csr(N, i, j, weights)
+
+    if return_households:
+        return matrix, households
+
+    return matrix
+
+
+def _symmetric_csr(N: int, i: np.ndarray, j: np.ndarray, weights: np.ndarray) -> sp.csr_matrix:
+    """
+    Симметричная матрица весов по рёбрам (i, j)
+
+    :param N: число вершин
+    :param i: первые концы рёбер
+    :param j: вторые концы рёбер
+    :param weights: веса рёбер
+    :return: матрица (N, N) в формате CSR
+    """
+    matrix = sp.csr_matrix((np.concatenate([weights, weights]), (np.concatenate([i, j]), np.concatenate([j, i]))),
+                           shape=(N, N))
+    matrix.sort_indices()
+
+    return matrix
 
 
 # Tests
@@ -56,6 +56,9 @@ class ChainVisualizer:
         node_size = 600
         line_width_node = 3
 
+        # переносим текущие распределения цепи в граф
+        self.chain.sync_graph()
+
         # формуируем массив цветов для вершин и их границ, а также прозрачность
         node_colors = []
         node_edge_colors = []
@@ -1,9 +1,19 @@
 from copy import copy
 import networkx as nx
 import numpy as np
+import scipy.sparse as sp
+import scipy.optimize
 from typing import Dict
 from typing import List
+from typing import Union
+from typing import Tuple
 from enum import Enum
+try:
+    from ..contact_graph import ContactGraph
+    from ..contact_graph import to_contact_graph
+except ImportError:
+    from contact_graph import ContactGraph
+    from contact_graph import to_contact_graph
 
 
 class NodeStates(Enum):
@@ -17,62 +27,99 @@ class NodeStates(Enum):
 
 class MarkovChain:
     """
-        Класс-реализация цепи Маркова в контексте решаемой задачи
+        Класс-реализация цепи Маркова в контексте решаемой задачи.
+        Распределения вершин хранятся в массиве distr (N, 3) (строка - номер вершины); шаг пишет новые
+        распределения во второй заранее выделенный буфер, после чего буферы меняются местами.
+        Здесь пересчёт идёт по графу networkx, а распределения после каждого шага переписываются
+        в атрибуты вершин графа (для отрисовки)
     """
 
-    def __init__(self, graph: nx.Graph, init_distr: Dict, epidemic_par: List):
+    # хранятся ли распределения ещё и в атрибутах вершин графа (тогда они обновляются после каждого шага)
+    _distr_in_graph = True
+
+    def __init__(self, graph: Union[nx.Graph, ContactGraph], init_distr: Dict, epidemic_par: List):
         """
 
-        :param graph: граф эпидемии (взвешенный, параметр 'w' для рёбер)
+        :param graph: граф эпидемии (взвешенный, параметр 'w' для рёбер) или ContactGraph,
+                      вершины пронумерованы от 0 до N-1
         :param init_distr: начальное распределение для всех вершин в виде словаря {node_num -> [S, I, R]}
         :param epidemic_par: парметры эпидемии в виде [\\gamma, \\sigma, \\beta]
         """
+        # пересчёт идёт по графу networkx; общий граф контейнера не меняем - распределения
+        # пишутся в атрибуты вершин собственной копии
+        if not isinstance(graph, nx.Graph):
+            graph = graph.graph.copy()
         self.chain = graph
         self.init_distr = init_distr
         self.params = epidemic_par
 
+        num_nodes = self.chain.number_of_nodes()
+        self.distr = np.empty((num_nodes, 3))
+        # второй буфер: шаг пишет в него, после чего буферы меняются местами
+        self._next_distr = np.empty((num_nodes, 3))
+
         # инициализируем все вершины нач. распределениями
-        for node_num in self.chain.nodes.keys():
-            self.chain.nodes[node_num][0] = init_distr[node_num][0]
-            self.chain.nodes[node_num][1] = init_distr[node_num][1]
-            self.chain.nodes[node_num][2] = init_distr[node_num][2]
+        self.set_init()
 
-    def time_step(self):
+    def _step(self, distr: np.ndarray, out: np.ndarray) -> np.ndarray:
         """
-        пересчитываем вероятности по правилам из статьи, т.е. по сути делаем один верменной шаг
+        Один шаг по времени из распределения distr в массив out по правилам из статьи
 
-        :return:
+        :param distr: текущие распределения (N, 3)
+        :param out: массив (N, 3) для новых распределений
+        :return: out
         """
-        # сохраняем все данные по вершинам
-        verts = {}
-        for node, node_attrs in self.chain.nodes.data():
-            verts[node] = node_attrs.copy()
         # параметры эпидемии
         beta = self.params[2]
         gamma = self.params[0]
         sigma = self.params[1]
 
-        for node_num, node_attrs in self.chain.nodes.data():
+        for node_num in self.chain.nodes:
             # считаем A_v (см. статью)
             A_v = 1
-            # соседи
-            neigb_nums = list(self.chain.adj[node_num])
-
-            for neigb_num in neigb_nums:
-                # вес ребра 
-                cur_weight = self.chain[node_num][neigb_num]['w']
-                # P(neigb_num) in I
-                cur_prob_I = verts[neigb_num][1]
-                A_v *= (1 - beta * cur_weight * cur_prob_I)
+            for neigb_num, edge_attrs in self.chain.adj[node_num].items():
+                # вес ребра и P(neigb_num) in I
+                A_v *= (1 - beta * edge_attrs['w'] * distr[neigb_num, 1])
 
             # собственно пересчёт
             # для вероятности быть в S
-            self.chain.nodes[node_num][0] = gamma * verts[node_num][2] + verts[node_num][0] * A_v
+            out[node_num, 0] = gamma * distr[node_num, 2] + distr[node_num, 0] * A_v
             # для вероятности быть в I
-            self.chain.nodes[node_num][1] = (1 - sigma) * verts[node_num][1] + verts[node_num][0] * (1 - A_v)
+            out[node_num, 1] = (1 - sigma) * distr[node_num, 1] + distr[node_num, 0] * (1 - A_v)
             # для вероятности быть в R
-            self.chain.nodes[node_num][2] = sigma * verts[node_num][1] + (1 - gamma) * verts[node_num][2]
+            out[node_num, 2] = sigma * distr[node_num, 1] + (1 - gamma) * distr[node_num, 2]
+
+        return out
 
+    def _advance(self):
+        """
+        Один шаг по времени между буферами (без записи в граф)
+
+        :return:
+        """
+        self._step(self.distr, self._next_distr)
+        self.distr, self._next_distr = self._next_distr, self.distr
+
+    def time_step(self):
+        """
+        пересчитываем вероятности по правилам из статьи, т.е. по сути делаем один верменной шаг
+
+        :return:
+        """
+        self._advance()
+        if self._distr_in_graph:
+            self.sync_graph()
+
+    def sync_graph(self):
+        """
+        Записывает текущие распределения в атрибуты вершин графа (для визуализации)
+
+        :return:
+        """
+        for node_num in range(len(self.distr)):
+            self.chain.nodes[node_num][0] = self.distr[node_num, 0]
+            self.chain.nodes[node_num][1] = self.distr[node_num, 1]
+            self.chain.nodes[node_num][2] = self.distr[node_num, 2]
 
     def set_init(self):
         """
@@ -80,10 +127,9 @@ class MarkovChain:
 
         :return:
         """
-        for node_num in self.chain.nodes.keys():
-            self.chain.nodes[node_num][0] = self.init_distr[node_num][0]
-            self.chain.nodes[node_num][1] = self.init_distr[node_num][1]
-            self.chain.nodes[node_num][2] = self.init_distr[node_num][2]
+        self.distr[:] = [self.init_distr[node_num] for node_num in range(len(self.distr))]
+        if self._distr_in_graph:
+            self.sync_graph()
 
     def expected_value(self, state: NodeStates) -> float:
         """
@@ -92,13 +138,405 @@ class MarkovChain:
         :param state: для какого состояние считать матожидание
         :return: матожидание выбранного состояния
         """
-        # переводим enum в int
-        node_state: int = state.value
-        ans: float = 0
-        for node_data in self.chain.nodes.data():
-            # вытаскиваем аттрибуты вершины
-            node_attrs = node_data[1]
-            ans += 1 * node_attrs[node_state]
+        return float(self.distr[:, state.value].sum())
+
+    def run(self, T: int, per_node: bool = False,
+            per_node_path: str = None) -> Union[np.ndarray, Tuple[np.ndarray, np.ndarray]]:
+        """
+        Делает T шагов по времени, переключаясь между двумя заранее выделенными буферами.
+        Атрибуты вершин графа обновляются один раз, в конце
+
+        :param T: кол-во шагов
+        :param per_node: сохранять ли распределения всех вершин на каждом шаге
+        :param per_node_path: путь к .npy файлу; если задан, тензор по вершинам отображается в память с диска
+        :return: массив (T, 3) матожиданий S, I, R после каждого шага; при per_node ещё и тензор (T, N, 3)
+        """
+        expected = np.empty((T, 3))
+        node_distrs = self._alloc_per_node(T, len(self.distr), per_node, per_node_path)
+
+        for t in range(T):
+            self._advance()
+            expected[t] = self.distr.sum(axis=0)
+            if node_distrs is not None:
+                node_distrs[t] = self.distr
+
+        if self._distr_in_graph:
+            self.sync_graph()
+
+        if node_distrs is None:
+            return expected
+
+        return expected, node_distrs
+
+    @staticmethod
+    def _alloc_per_node(T: int, num_nodes: int, per_node: bool, per_node_path: str) -> Union[np.ndarray, None]:
+        """
+        Выделяет тензор (T, N, 3) под распределения вершин: в памяти или в файле .npy через memmap
+
+        :return: тензор или None, если он не нужен
+        """
+        if per_node_path is not None:
+            return np.lib.format.open_memmap(per_node_path, mode='w+', dtype=float, shape=(T, num_nodes, 3))
+        if per_node:
+            return np.empty((T, num_nodes, 3))
+
+        return None
+
+
+class SteadyStateResult:
+    """
+        Результат поиска неподвижной точки цепи
+    """
+
+    def __init__(self, distr: np.ndarray, residuals: List[float], tol: float):
+        """
+
+        :param distr: найденные распределения вершин (N, 3)
+        :param residuals: история невязок max |F(x) - x| по итерациям
+        :param tol: требуемая точность
+        """
+        self.distr = distr
+        self.residuals = np.array(residuals)
+        self.num_iter = len(residuals)
+        self.converged = len(residuals) > 0 and residuals[-1] < tol
+
+
+class SparseMarkovChain(MarkovChain):
+    """
+        Цепь Маркова с векторным пересчётом: распределения вершин хранятся в массиве (N, 3),
+        веса рёбер - в CSR-матрице. Правило пересчёта то же, что у MarkovChain:
+        A_v = prod_u (1 - beta * w_vu * P_I(u)) считается для всех вершин сразу как
+        exp(sum_u log(1 - beta * w_vu * P_I(u))) по ненулевым элементам матрицы.
+        Распределения в атрибуты вершин графа записываются только по sync_graph
+    """
+
+    _distr_in_graph = False
+
+    def __init__(self, graph: Union[nx.Graph, ContactGraph], init_distr: Dict, epidemic_par: List):
+        """
+
+        :param graph: граф эпидемии (взвешенный, параметр 'w' для рёбер), вершины пронумерованы от 0 до N-1,
+                      или ContactGraph; граф networkx переводится в разреженный вид один раз (см. from_networkx)
+        :param init_distr: начальное распределение для всех вершин в виде словаря {node_num -> [S, I, R]}
+                           или массива (N, 3)
+        :param epidemic_par: парметры эпидемии в виде [\\gamma, \\sigma, \\beta]
+        """
+        self._graph = graph
+        # собственная копия графа контейнера для sync_graph (строится при первом обращении)
+        self._chain = None
+        self.init_distr = init_distr
+        self.params = epidemic_par
+
+        self.contacts = to_contact_graph(graph)
+        self.weights = self.contacts.weights
+        # номер строки для каждого ненулевого элемента матрицы весов
+        self._rows = self.contacts.rows
+
+        num_nodes = self.contacts.num_nodes
+        self.distr = np.empty((num_nodes, 3))
+        # второй буфер: шаг пишет в него, после чего буферы меняются местами
+        self._next_distr = np.empty((num_nodes, 3))
+        self.set_init()
+
+    @property
+    def chain(self) -> nx.Graph:
+        """
+        Граф networkx цепи (нужен только для sync_graph и отрисовки)
+
+        :return:
+        """
+        if isinstance(self._graph, nx.Graph):
+            return self._graph
+
+        if self._chain is None:
+            self._chain = self._graph.graph.copy()
+
+        return self._chain
+
+    def _eval_A(self, prob_I: np.ndarray) -> np.ndarray:
+        """
+        Считает A_v (см. статью) для всех вершин
+
+        :param prob_I: вероятности вершин быть в I
+        :return: массив A_v
+        """
+        beta = self.params[2]
+        with np.errstate(divide='ignore'):
+            log_terms = np.log1p(-beta * self.weights.data * prob_I[self.weights.indices])
+
+        return np.exp(np.bincount(self._rows, weights=log_terms, minlength=len(prob_I)))
+
+    def _step(self, distr: np.ndarray, out: np.ndarray) -> np.ndarray:
+        """
+        Один шаг по времени из распределения distr в массив out
+
+        :param distr: текущие распределения (N, 3)
+        :param out: массив (N, 3) для новых распределений
+        :return: out
+        """
+        gamma = self.params[0]
+        sigma = self.params[1]
+
+        A_v = self._eval_A(distr[:, 1])
+        out[:, 0] = gamma * distr[:, 2] + distr[:, 0] * A_v
+        out[:, 1] = (1 - sigma) * distr[:, 1] + distr[:, 0] * (1 - A_v)
+        out[:, 2] = sigma * distr[:, 1] + (1 - gamma) * distr[:, 2]
+
+        return out
+
+    def _residual(self, distr_SI: np.ndarray) -> np.ndarray:
+        """
+        Невязка шага цепи в переменных (S, I); R = 1 - S - I, так что сумма по вершине сохраняется
+
+        :param distr_SI: вероятности S и I всех вершин, вытянутые в вектор длины 2N
+        :return: F(x) - x в тех же переменных
+        """
+        distr = self._from_SI(distr_SI)
+
+        return (self._step(distr, np.empty_like(distr))[:, :2] - distr[:, :2]).ravel()
+
+    @staticmethod
+    def _from_SI(distr_SI: np.ndarray) -> np.ndarray:
+        """
+        :param distr_SI: вероятности S и I всех вершин, вытянутые в вектор длины 2N
+        :return: распределения вершин (N, 3)
+        """
+        distr_SI = distr_SI.reshape(-1, 2)
+
+        return np.column_stack([distr_SI, 1 - distr_SI.sum(axis=1)])
+
+    def solve_steady_state(self, tol: float = 1e-10, max_iter: int = 10000, method: str = 'picard',
+                           anderson_m: int = 5, warmup: int = 20) -> SteadyStateResult:
+        """
+        Ищет неподвижную точку цепи (при gamma > 0 цепь сходится к эндемическому состоянию), итерируя,
+        пока максимальное изменение распределения вершины за шаг не станет меньше tol.
+        Найденное распределение становится текущим состоянием цепи
+
+        :param tol: допустимая невязка max |F(x) - x|
+        :param max_iter: максимальное кол-во итераций
+        :param method: 'picard' - обычные шаги цепи, 'anderson' - шаги с ускорением Андерсона,
+                       'newton_krylov' - метод Ньютона-Крылова из scipy.optimize
+        :param anderson_m: кол-во предыдущих итераций, используемых в ускорении Андерсона
+        :param warmup: кол-во обычных шагов перед методом Ньютона-Крылова. Метод сходится к ближайшему корню,
+                       и без разгона из состояния с малым числом больных может найти состояние без болезни
+        :return: распределения, кол-во итераций и история невязок
+        """
+        residuals = []
+        x = self.distr[:, :2].ravel().copy()
+
+        if method == 'picard':
+            for i in range(max_iter):
+                f = self._residual(x)
+                residuals.append(np.max(np.abs(f)))
+                x = x + f
+                if residuals[-1] < tol:
+                    break
+        elif method == 'anderson':
+            # последние значения x и невязок f(x) = F(x) - x
+            xs = []
+            fs = []
+            for i in range(max_iter):
+                f = self._residual(x)
+                residuals.append(np.max(np.abs(f)))
+                if residuals[-1] < tol:
+                    break
+                xs = (xs + [x])[-(anderson_m + 1):]
+                fs = (fs + [f])[-(anderson_m + 1):]
+
+                new_x = x + f
+                if len(fs) > 1:
+                    # коэффициенты смешивания из задачи наименьших квадратов по разностям невязок
+                    dF = np.diff(np.array(fs), axis=0).T
+                    dX = np.diff(np.array(xs), axis=0).T
+                    coeffs = np.linalg.lstsq(dF, f, rcond=None)[0]
+                    mixed_x = new_x - (dX + dF) @ coeffs
+                    # ускоренный шаг принимается, только если остаётся распределением вероятностей
+                    if np.all(self._from_SI(mixed_x) >= 0):
+                        new_x = mixed_x
+                x = new_x
+        elif method == 'newton_krylov':
+            for i in range(min(warmup, max_iter)):
+                f = self._residual(x)
+                residuals.append(np.max(np.abs(f)))
+                x = x + f
+
+            def callback(cur_x, cur_f):
+                residuals.append(np.max(np.abs(cur_f)))
+
+            try:
+                x = scipy.optimize.newton_krylov(self._residual, x, f_tol=tol, maxiter=max_iter, callback=callback)
+            except scipy.optimize.NoConvergence as err:
+                x = err.args[0]
+            residuals.append(np.max(np.abs(self._residual(x))))
+        else:
+            raise ValueError(f"Unknown steady state method: {method}")
+
+        self.distr[:] = self._from_SI(x)
+
+        return SteadyStateResult(self.distr.copy(), residuals, tol)
+
+
+class LockdownMarkovChain(SparseMarkovChain):
+    """
+        Цепь Маркова с двумя слоями контактов и тем же расписанием дней, что у SamplerWithLockdown:
+        вне локдауна за день делается шаг на обычном графе и шаг на домашнем, во время локдауна - два шага
+        на домашнем. Один вызов time_step соответствует одному дню.
+        solve_steady_state ищет неподвижную точку дня вне локдауна (обычный шаг, затем домашний):
+        локдаун длится конечное число дней, и после него цепь сходится именно к ней
+    """
+
+    def __init__(self, graph: Union[nx.Graph, ContactGraph], home_graph: Union[nx.Graph, ContactGraph],
+                 init_distr: Dict, epidemic_par: List, lockdown_days: Tuple[int, int] = (-1, -1)):
+        """
+
+        :param graph: граф обычного режима (взвешенный, параметр 'w' для рёбер)
+        :param home_graph: граф режима карантин на тех же вершинах
+        :param init_distr: начальное распределение для всех вершин (см. SparseMarkovChain)
+        :param epidemic_par: парметры эпидемии в виде [\\gamma, \\sigma, \\beta]
+        :param lockdown_days: номер дня для начала и конца локдауна (невключительно; нумерация от единицы)
+        """
+        super().__init__(graph, init_distr, epidemic_par)
+        self.home_graph = home_graph
+
+        # матрицы и номера строк ненулевых элементов для обоих слоёв
+        home_contacts = to_contact_graph(home_graph)
+        self._ordinary_layer = (self.weights, self._rows)
+        self._home_layer = (home_contacts.weights, home_contacts.rows)
+
+        self.lockdown_days = list(lockdown_days)
+        # переводим время начала и конца в интервал от 0 до N
+        self.lockdown_days[0] -= 1
+        self.lockdown_days[1] -= 1
+
+    def _advance(self):
+        """
+        Один день: два шага цепи на графах согласно расписанию
+
+        :return:
+        """
+        if self.lockdown_days[0] <= self.cur_day < self.lockdown_days[1]:
+            layers = [self._home_layer, self._home_layer]
+        else:
+            layers = [self._ordinary_layer, self._home_layer]
+
+        for weights, rows in layers:
+            self.weights, self._rows = weights, rows
+            super()._advance()
+        self.weights, self._rows = self._ordinary_layer
+
+        self.cur_day += 1
+
+    def _residual(self, distr_SI: np.ndarray) -> np.ndarray:
+        """
+        Невязка дня вне локдауна (шаг на обычном графе, затем на домашнем) в переменных (S, I)
+
+        :param distr_SI: вероятности S и I всех вершин, вытянутые в вектор длины 2N
+        :return: F(x) - x в тех же переменных, F - отображение за день
+        """
+        distr = self._from_SI(distr_SI)
+
+        day_distr = distr
+        try:
+            for weights, rows in [self._ordinary_layer, self._home_layer]:
+                self.weights, self._rows = weights, rows
+                day_distr = self._step(day_distr, np.empty_like(day_distr))
+        finally:
+            self.weights, self._rows = self._ordinary_layer
+
+        return (day_distr[:, :2] - distr[:, :2]).ravel()
+
+    def set_init(self):
+        """
+        Переводит цепь в начальное состояние (в том числе на первый день)
+
+        :return:
+        """
+        super().set_init()
+        self.cur_day = 0
+
+
+class ParameterSweepResult:
+    """
+        Итоги перебора параметров эпидемии: массивы по сетке (\\gamma, \\sigma, \\beta)
+    """
+
+    def __init__(self, gammas: np.ndarray, sigmas: np.ndarray, betas: np.ndarray, attack_rate: np.ndarray,
+                 peak_infected: np.ndarray):
+        """
+
+        :param gammas: значения \\gamma (ось 0 сетки)
+        :param sigmas: значения \\sigma (ось 1 сетки)
+        :param betas: значения \\beta (ось 2 сетки)
+        :param attack_rate: матожидание числа заражений за всё время, делённое на число вершин
+        :param peak_infected: максимум по времени матожидания числа больных
+        """
+        self.gammas = gammas
+        self.sigmas = sigmas
+        self.betas = betas
+        self.attack_rate = attack_rate
+        self.peak_infected = peak_infected
+
+
+def sweep_parameters(graph: Union[nx.Graph, ContactGraph], init_distr: Dict, gammas: List[float],
+                     sigmas: List[float], betas: List[float], T: int, batch_size: int = None) -> ParameterSweepResult:
+    """
+    Прогоняет SparseMarkovChain сразу для всей сетки параметров. Распределения всех точек сетки хранятся
+    в тензоре (3, N, P) (по матрице (N, P) на каждое состояние); на каждом шаге суммы
+    log(1 - beta * w_vu * P_I(u)) по строкам для всех точек считаются одним произведением разреженной
+    матрицы-индикатора строк (N, nnz) на матрицу (nnz, P)
+
+    :param graph: граф эпидемии (взвешенный, параметр 'w' для рёбер), вершины пронумерованы от 0 до N-1
+    :param init_distr: начальное распределение для всех вершин (см. SparseMarkovChain)
+    :param gammas: значения \\gamma
+    :param sigmas: значения \\sigma
+    :param betas: значения \\beta
+    :param T: кол-во шагов
+    :param batch_size: сколько точек сетки считать одновременно; по умолчанию столько, чтобы матрица
+                       (nnz, P) занимала порядка 32 Мб
+    :return: итоги в виде массивов размера (len(gammas), len(sigmas), len(betas))
+    """
+    gammas, sigmas, betas = np.atleast_1d(gammas, sigmas, betas)
+    grid = np.meshgrid(gammas, sigmas, betas, indexing='ij')
+    gamma, sigma, beta = [axis.ravel() for axis in grid]
+    num_points = len(gamma)
+
+    # матрица весов и начальные распределения - как у одиночной цепи
+    chain = SparseMarkovChain(graph, init_distr, [0, 0, 0])
+    weights = chain.weights
+    num_nodes, nnz = weights.shape[0], weights.nnz
+    rows_indicator = sp.csr_matrix((np.ones(nnz), np.arange(nnz), weights.indptr), shape=(num_nodes, nnz))
+    if batch_size is None:
+        batch_size = max(1, 2 ** 22 // max(nnz, 1))
+
+    attack_rate = np.empty(num_points)
+    peak_infected = np.empty(num_points)
+    for start in range(0, num_points, batch_size):
+        batch = slice(start, min(start + batch_size, num_points))
+        g, s = gamma[batch], sigma[batch]
+        weighted_beta = weights.data[:, None] * beta[None, batch]
+
+        distr = np.repeat(chain.distr.T[:, :, None], len(g), axis=2)
+        infections = np.zeros(len(g))
+        peak = np.zeros(len(g))
+        for t in range(T):
+            S, I, R = distr
+            with np.errstate(divide='ignore'):
+                log_terms = np.log1p(-weighted_beta * I[weights.indices])
+            A_v = np.exp(rows_indicator @ log_terms)
+
+            new_infected = S * (1 - A_v)
+            recovered = s * I
+            infections += new_infected.sum(axis=0)
+            S *= A_v
+            S += g * R
+            R *= 1 - g
+            R += recovered
+            I -= recovered
+            I += new_infected
+            peak = np.maximum(peak, I.sum(axis=0))
 
-        return ans
+        attack_rate[batch] = infections / num_nodes
+        peak_infected[batch] = peak
 
+    return ParameterSweepResult(gammas, sigmas, betas, attack_rate.reshape(grid[0].shape),
+                                peak_infected.reshape(grid[0].shape))
@@ -4,6 +4,9 @@ import pytest
 from pytest import FixtureRequest
 from src.markov_chain.markov_chain import MarkovChain
 from src.markov_chain.markov_chain import NodeStates
+from src.markov_chain.markov_chain import SparseMarkovChain
+from src.markov_chain.markov_chain import LockdownMarkovChain
+from src.markov_chain.markov_chain import sweep_parameters
 from src.graphs_generators import *
 
 
@@ -110,4 +113,144 @@ def test_expected_value(chain_creation: MarkovChain):
     assert abs(all_nodes - len(chain.chain.nodes)) < 1e-2
 
 
+def test_sparse_chain_matches_graph_chain():
+    """
+    Векторная цепь должна совпадать с исходной при пересчёте по тем же правилам
+    """
+    T = 30
+    # граф эпидемии
+    graph = random_working_graph(20, 60)
+    # делаем начальное распределение
+    init_distr = np.random.rand(20, 3)
+    init_distr = init_distr / np.sum(init_distr, axis=1).reshape(20, 1)
+
+    chain = MarkovChain(graph.copy(), init_distr, epidemic_par=[0.3, 0.2, 0.7])
+    sparse_chain = SparseMarkovChain(graph.copy(), init_distr, epidemic_par=[0.3, 0.2, 0.7])
+
+    for i in range(T):
+        chain.time_step()
+        sparse_chain.time_step()
+
+    for node_num in list(chain.chain.nodes):
+        for state in range(3):
+            assert abs(chain.chain.nodes[node_num][state] - sparse_chain.distr[node_num][state]) < 1e-12
+
+    for state in range(3):
+        assert abs(chain.expected_value(NodeStates(state)) - sparse_chain.expected_value(NodeStates(state))) < 1e-9
+
+
+def test_run_trajectory(tmp_path):
+    """
+    Траектория run совпадает с поочерёдными шагами, тензор по вершинам пишется в файл
+    """
+    T = 20
+    # граф эпидемии
+    graph = random_working_graph(10, 20)
+    # делаем начальное распределение
+    init_distr = np.random.rand(10, 3)
+    init_distr = init_distr / np.sum(init_distr, axis=1).reshape(10, 1)
+
+    chain = MarkovChain(graph.copy(), init_distr, epidemic_par=[0.3, 0.2, 0.7])
+    sparse_chain = SparseMarkovChain(graph.copy(), init_distr, epidemic_par=[0.3, 0.2, 0.7])
+
+    expected = chain.run(T)
+    sparse_expected, node_distrs = sparse_chain.run(T, per_node_path=str(tmp_path / 'distr.npy'))
+
+    assert expected.shape == (T, 3)
+    assert np.allclose(expected, sparse_expected)
+    assert np.allclose(np.load(tmp_path / 'distr.npy')[-1], sparse_chain.distr)
+    assert np.allclose(node_distrs.sum(axis=1), sparse_expected)
+
+
+
+def test_steady_state_methods_agree():
+    """
+    Неподвижная точка, найденная с ускорением, совпадает с найденной обычными шагами
+    """
+    # граф эпидемии
+    graph = random_working_graph(50, 200)
+    # делаем начальное распределение
+    init_distr = np.ones((50, 3)) * np.array([0.9, 0.1, 0.0])
+
+    results = {}
+    for method in ['picard', 'anderson', 'newton_krylov']:
+        chain = SparseMarkovChain(graph, init_distr, epidemic_par=[0.01, 0.05, 0.6])
+        results[method] = chain.solve_steady_state(tol=1e-11, method=method)
+        assert results[method].converged
+
+    assert results['anderson'].num_iter < results['picard'].num_iter
+    assert np.allclose(results['anderson'].distr, results['picard'].distr, atol=1e-7)
+    assert np.allclose(results['newton_krylov'].distr, results['picard'].distr, atol=1e-7)
+    assert np.allclose(results['picard'].distr.sum(axis=1), 1)
+
+
+def test_lockdown_chain_schedule():
+    """
+    Если домашний граф совпадает с обычным, день цепи с локдауном - это два шага обычной цепи.
+    Во время локдауна на графе без рёбер больные только выздоравливают
+    """
+    T = 10
+    # граф эпидемии
+    graph = random_working_graph(15, 40)
+    empty_graph = nx.empty_graph(15)
+    # делаем начальное распределение
+    init_distr = np.random.rand(15, 3)
+    init_distr = init_distr / np.sum(init_distr, axis=1).reshape(15, 1)
+
+    chain = SparseMarkovChain(graph, init_distr, epidemic_par=[0.3, 0.2, 0.7])
+    lockdown_chain = LockdownMarkovChain(graph, graph, init_distr, epidemic_par=[0.3, 0.2, 0.7])
+    assert np.allclose(chain.run(2 * T)[1::2], lockdown_chain.run(T))
+
+    lockdown_chain = LockdownMarkovChain(graph, empty_graph, init_distr, epidemic_par=[0.0, 0.2, 0.7],
+                                         lockdown_days=(1, T + 1))
+    expected = lockdown_chain.run(T)
+    assert np.allclose(expected[:, 1], init_distr[:, 1].sum() * 0.8 ** (2 * np.arange(1, T + 1)))
+
+
+def test_lockdown_chain_steady_state():
+    """
+    Неподвижная точка цепи с локдауном не меняется за день вне локдауна (обычный и домашний шаги)
+    и отличается от неподвижной точки одного обычного графа
+    """
+    # граф эпидемии
+    graph = random_working_graph(40, 120)
+    home_graph = random_home_graph(40, 4)
+    # делаем начальное распределение
+    init_distr = np.ones((40, 3)) * np.array([0.9, 0.1, 0.0])
+
+    lockdown_chain = LockdownMarkovChain(graph, home_graph, init_distr, epidemic_par=[0.02, 0.1, 0.5])
+    result = lockdown_chain.solve_steady_state(tol=1e-11, method='anderson')
+    assert result.converged
+
+    lockdown_chain.time_step()
+    assert np.allclose(lockdown_chain.distr, result.distr, atol=1e-9)
+
+    chain = SparseMarkovChain(graph, init_distr, epidemic_par=[0.02, 0.1, 0.5])
+    assert not np.allclose(chain.solve_steady_state(tol=1e-11).distr, result.distr, atol=1e-4)
+
+
+def test_sweep_parameters():
+    """
+    Перебор по сетке совпадает с отдельными цепями для каждой точки
+    """
+    T = 15
+    # граф эпидемии
+    graph = random_working_graph(20, 50)
+    # делаем начальное распределение
+    init_distr = np.random.rand(20, 3)
+    init_distr = init_distr / np.sum(init_distr, axis=1).reshape(20, 1)
+
+    gammas, sigmas, betas = [0.1, 0.3], [0.2, 0.5, 0.7], [0.4, 0.9]
+    result = sweep_parameters(graph, init_distr, gammas, sigmas, betas, T, batch_size=5)
+    assert result.attack_rate.shape == (2, 3, 2)
 
+    for i, gamma in enumerate(gammas):
+        for j, sigma in enumerate(sigmas):
+            for k, beta in enumerate(betas):
+                chain = SparseMarkovChain(graph, init_distr, epidemic_par=[gamma, sigma, beta])
+                expected = chain.run(T)
+                assert np.isclose(result.peak_infected[i, j, k], expected[:, 1].max())
+                # новые заражения: прирост I плюс выздоровевшие за шаг
+                prev_I = np.concatenate([[init_distr[:, 1].sum()], expected[:-1, 1]])
+                infections = np.sum(expected[:, 1] - (1 - sigma) * prev_I)
+                assert np.isclose(result.attack_rate[i, j, k], infections / 20)
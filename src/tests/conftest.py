@@ -0,0 +1,5 @@
+import os
+import sys
+
+# модули эпидемий импортируют друг друга по имени (как при запуске из src), поэтому src добавляется в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
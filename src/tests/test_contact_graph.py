@@ -0,0 +1,112 @@
+# Tests
+import networkx as nx
+import numpy as np
+from contact_graph import ContactGraph
+from contact_graph import demographic_node_attrs
+from contact_graph import _LOG_WEIGHTS_CACHE_SIZE
+from markov_chain.markov_chain import SparseMarkovChain
+from graphs_generators import random_working_graph
+from SEIRS_lib.models import SEIRSNetworkModel
+
+
+def test_contact_graph():
+    """
+    Контейнер графа строится один раз для одинаковых графов и даёт те же цепи, что и граф networkx
+    """
+    T = 10
+    # граф эпидемии
+    graph = random_working_graph(20, 50)
+    contacts = ContactGraph.from_networkx(graph)
+    assert ContactGraph.from_networkx(graph.copy()) is contacts
+    assert np.allclose(contacts.degree, [graph.degree(node) for node in range(20)])
+    # делаем начальное распределение
+    init_distr = np.random.rand(20, 3)
+    init_distr = init_distr / np.sum(init_distr, axis=1).reshape(20, 1)
+
+    chain = SparseMarkovChain(graph, init_distr, epidemic_par=[0.3, 0.2, 0.7])
+    contacts_chain = SparseMarkovChain(ContactGraph(contacts.weights), init_distr, epidemic_par=[0.3, 0.2, 0.7])
+    assert np.allclose(chain.run(T), contacts_chain.run(T))
+    assert contacts_chain.chain.number_of_edges() == 50
+
+
+def test_contact_graph_keeps_no_caller_graph():
+    """
+    В кэше не хранится граф вызывающего: модели, построенные по копиям графа, не видят атрибутов вершин друг друга
+    """
+    # граф эпидемии
+    graph = random_working_graph(20, 50)
+    copied_graph = graph.copy()
+    contacts = ContactGraph.from_networkx(graph)
+    assert contacts.graph is not graph
+
+    # делаем начальное распределение
+    init_distr = np.random.rand(20, 3)
+    init_distr = init_distr / np.sum(init_distr, axis=1).reshape(20, 1)
+
+    chain = SparseMarkovChain(graph, init_distr, epidemic_par=[0.3, 0.2, 0.7])
+    chain.run(5)
+    chain.sync_graph()
+    assert chain.chain is graph and np.isclose(graph.nodes[0][1], chain.distr[0, 1])
+    # у копии, построенной из того же кэша, своя цепь и свой граф
+    copied_chain = SparseMarkovChain(ContactGraph.from_networkx(copied_graph), init_distr, epidemic_par=[0.3, 0.2, 0.7])
+    copied_chain.sync_graph()
+    assert copied_chain.chain is not contacts.graph
+    assert 1 not in contacts.graph.nodes[0] and 1 not in copied_graph.nodes[0]
+    assert np.isclose(graph.nodes[0][1], chain.distr[0, 1])
+
+
+def test_contact_graph_on_disk(tmp_path):
+    """
+    Граф, сохранённый на диск и отображённый в память, даёт те же матрицы, атрибуты вершин и цепи
+    """
+    T = 10
+    # граф эпидемии
+    graph = random_working_graph(20, 50)
+    contacts = ContactGraph(ContactGraph.from_networkx(graph).weights,
+                            node_attrs=demographic_node_attrs(['0-9'] * 10 + ['20-29'] * 10,
+                                                              [{'indices': [0, 1, 2]}, {'indices': [7, 15]}]))
+    contacts.save(str(tmp_path))
+    loaded = ContactGraph.load(str(tmp_path))
+
+    assert not loaded.weights.data.flags.owndata
+    assert (loaded.weights != contacts.weights).nnz == 0
+    assert list(loaded.node_attrs['household_id'][[0, 3, 7, 15]]) == [0, -1, 1, 1]
+    assert loaded.node_attrs['age_bracket'][19] == '20-29'
+
+    # делаем начальное распределение
+    init_distr = np.random.rand(20, 3)
+    init_distr = init_distr / np.sum(init_distr, axis=1).reshape(20, 1)
+
+    chain = SparseMarkovChain(graph, init_distr, epidemic_par=[0.3, 0.2, 0.7])
+    loaded_chain = SparseMarkovChain(loaded, init_distr, epidemic_par=[0.3, 0.2, 0.7])
+    assert np.allclose(chain.run(T), loaded_chain.run(T))
+
+
+def test_seirs_model_uses_contact_graph():
+    """
+    Модель SEIRS переводит граф networkx через кэш контейнеров и получает ту же матрицу смежности и степени
+    """
+    graph = nx.barabasi_albert_graph(100, 3, seed=1)
+    model = SEIRSNetworkModel(graph, beta=0.2, sigma=0.3, gamma=0.1, initI=5, seed=2)
+    contacts = ContactGraph.from_networkx(graph)
+
+    assert model.A is contacts.adj_matrix
+    assert (model.A != nx.to_scipy_sparse_array(graph, format='csr')).nnz == 0
+    assert np.allclose(model.degree.ravel(), [graph.degree(node) for node in range(100)])
+
+
+def test_log_weights_cache_is_bounded():
+    """
+    Матрицы log(1 - beta_i * w_ij) запоминаются только для последних значений beta, повторный вызов отдаёт ту же матрицу
+    """
+    contacts = ContactGraph(ContactGraph.from_networkx(random_working_graph(20, 50)).weights)
+    first = contacts.log_weights(0.1)
+    assert contacts.log_weights(0.1) is first
+    assert np.allclose(first.data, np.log1p(-0.1 * contacts.weights.data))
+
+    for beta in np.linspace(0.2, 0.9, 50):
+        contacts.log_weights(beta)
+        # недавно использованная матрица не вытесняется
+        assert contacts.log_weights(0.1) is first
+    assert len(contacts._log_weights) <= _LOG_WEIGHTS_CACHE_SIZE
+    assert np.allclose(contacts.log_weights(np.full(20, 0.2)).data, np.log1p(-0.2 * contacts.weights.data))
@@ -0,0 +1,256 @@
+# Tests
+import functools
+import numpy as np
+import pytest
+from epidemic_sampling import *
+from epidemic_ensemble import run_ensemble
+from epidemic_ensemble import sweep_lockdown_schedules
+from graphs_generators import random_working_graph
+from graphs_generators import random_home_graph
+
+
+N = 40
+
+
+@pytest.fixture()
+def graphs():
+    # графы обычного режима и режима карантин
+    np.random.seed(7)
+    G = random_working_graph(N, 120)
+    G_home = random_home_graph(N, 4)
+    # делаем начальное распределение
+    init_distr = [NodeStates(np.random.randint(1, 3)) for i in range(N)]
+
+    return G, G_home, init_distr
+
+
+def run_sampler(epidemic: EpidemicWithLockdown, seed: int, t: int = 20, lockdown_days=(5, 12),
+                vectorized: bool = False) -> SamplerWithLockdown:
+    np.random.seed(seed)
+    sampler = SamplerWithLockdown(epidemic, lockdown_days, vectorized)
+    sampler.run_epidemic(t)
+
+    return sampler
+
+
+def test_array_epidemic_matches_graph_epidemic(graphs):
+    """
+    Эпидемия на массивах даёт те же вероятности и ту же траекторию, что и эпидемия на графах networkx
+    """
+    G, G_home, init_distr = graphs
+
+    epidemic = EpidemicWithLockdown(G, init_distr, G_home, 0.3, 0.1, 0.4)
+    array_epidemic = ArrayEpidemicWithLockdown(G, init_distr, G_home, 0.3, 0.1, 0.4)
+    for set_mode in ['set_quarantine', 'set_ordinary']:
+        getattr(epidemic, set_mode)()
+        getattr(array_epidemic, set_mode)()
+        probs = [epidemic.node_info[node]['prob'] for node in range(N)]
+        assert np.allclose(probs, array_epidemic.probs, rtol=0, atol=1e-12)
+
+    sampler = run_sampler(EpidemicWithLockdown(G, init_distr, G_home, 0.3, 0.1, 0.4), seed=1)
+    array_sampler = run_sampler(ArrayEpidemicWithLockdown(G, init_distr, G_home, 0.3, 0.1, 0.4), seed=1)
+
+    assert np.array_equal(np.asarray(sampler.node_states), np.asarray(array_sampler.node_states))
+    assert sampler.num_infections == array_sampler.num_infections
+
+    # графы вызывающего не изменяются
+    assert all('state' not in node_info for _, node_info in G.nodes(data=True))
+    assert all('state' not in node_info for _, node_info in G_home.nodes(data=True))
+
+
+def test_vectorized_step_matches_loop_step(graphs):
+    """
+    Векторизованный шаг тратит те же случайные числа в том же порядке, что и поочерёдный
+    """
+    G, G_home, init_distr = graphs
+
+    loop_sampler = run_sampler(ArrayEpidemicWithLockdown(G, init_distr, G_home, 0.3, 0.1, 0.4), seed=2)
+    vectorized_sampler = run_sampler(ArrayEpidemicWithLockdown(G, init_distr, G_home, 0.3, 0.1, 0.4), seed=2,
+                                     vectorized=True)
+
+    assert np.array_equal(np.asarray(loop_sampler.node_states), np.asarray(vectorized_sampler.node_states))
+    assert loop_sampler.num_infections == vectorized_sampler.num_infections
+
+    with pytest.raises(ValueError):
+        BasicSampler(EpidemicWithLockdown(G, init_distr, G_home, 0.3, 0.1, 0.4), vectorized=True)
+
+
+def test_trajectory_buffer():
+    """
+    Буфер траектории на границах блоков и его копия с копированием последнего блока при записи
+    """
+    states = np.random.randint(1, 4, size=(11, 6)).astype(np.int8)
+
+    buffer = TrajectoryBuffer(6, chunk_size=4)
+    for row in states[:7]:
+        buffer.append(row)
+
+    assert len(buffer) == 7
+    assert np.array_equal(buffer.to_array(), states[:7])
+    assert np.array_equal(np.asarray(buffer), states[:7])
+    for idx in [0, 3, 4, 6, -1]:
+        assert np.array_equal(buffer[idx], states[:7][idx])
+    with pytest.raises(IndexError):
+        buffer[7]
+    assert np.array_equal(buffer.counts, [np.bincount(row, minlength=4)[1:] for row in states[:7]])
+    assert np.array_equal(buffer.num_of_nodes(NodeStates.Infected), np.count_nonzero(states[:7] == 2, axis=1))
+
+    # копия разделяет заполненные блоки, но дописывается независимо
+    buffer_copy = buffer.copy()
+    for row in states[7:]:
+        buffer_copy.append(row)
+    buffer.append(states[0])
+
+    assert np.array_equal(buffer_copy.to_array(), states)
+    assert np.array_equal(buffer.to_array(), np.concatenate([states[:7], states[:1]]))
+    assert np.array_equal(buffer_copy.counts[-1], np.bincount(states[-1], minlength=4)[1:])
+
+
+def test_run_ensemble_reproducible(graphs):
+    """
+    Ансамбль воспроизводится по зерну и не зависит от числа процессов
+    """
+    G, G_home, init_distr = graphs
+    windows = [(5, 10), (-1, -1)]
+
+    for epidemic_class in [EpidemicWithLockdown, ArrayEpidemicWithLockdown]:
+        factory = functools.partial(epidemic_class, G, init_distr, G_home, 0.3, 0.1, 0.4)
+        results = run_ensemble(factory, windows, num_replicas=3, t=12, seed=11)
+        assert [result.lockdown_days for result in results] == windows
+        assert results[0].counts.shape == (3, 12, 3)
+        assert np.all(results[0].counts.sum(axis=2) == N)
+
+        same_seed = run_ensemble(factory, windows, num_replicas=3, t=12, seed=11, num_workers=2)
+        for result, same_result in zip(results, same_seed):
+            assert np.array_equal(result.counts, same_result.counts)
+
+    # реализация совпадает с отдельным запуском сэмплера с тем же потоком случайных чисел
+    seed_seq = np.random.SeedSequence(11).spawn(3)[1]
+    np.random.seed(seed_seq.generate_state(4))
+    sampler = SamplerWithLockdown(ArrayEpidemicWithLockdown(G, init_distr, G_home, 0.3, 0.1, 0.4), (5, 10),
+                                  vectorized=True)
+    sampler.run_epidemic(12)
+    assert np.array_equal(results[0].counts[1], sampler.node_states.counts)
+
+
+def test_batch_sampler_single_replica_matches_sampler(graphs):
+    """
+    Пакетный сэмплер с одной реализацией повторяет SamplerWithLockdown при тех же случайных числах
+    """
+    G, G_home, init_distr = graphs
+    epidemic = ArrayEpidemicWithLockdown(G, init_distr, G_home, 0.3, 0.1, 0.4)
+
+    sampler = run_sampler(epidemic.copy(), seed=3, vectorized=True)
+
+    np.random.seed(3)
+    batch_sampler = BatchSamplerWithLockdown(epidemic, 1, lockdown_days=(5, 12))
+    batch_sampler.run_epidemic(20)
+
+    assert batch_sampler.counts.shape == (20, 1, 3)
+    assert np.array_equal(batch_sampler.counts[:, 0], sampler.node_states.counts)
+    assert np.array_equal(batch_sampler.states[0], sampler.epidemic.states)
+
+
+def test_fork_is_independent(graphs):
+    """
+    Ветвь продолжается независимо от исходного сэмплера и не меняет его траекторию и состояния
+    """
+    G, G_home, init_distr = graphs
+
+    for epidemic_class in [EpidemicWithLockdown, ArrayEpidemicWithLockdown]:
+        sampler = run_sampler(epidemic_class(G, init_distr, G_home, 0.3, 0.1, 0.4), seed=4, t=6)
+        history = np.asarray(sampler.node_states).copy()
+        states = sampler.node_states[-1].copy()
+
+        branch = sampler.fork((7, 12))
+        assert branch.lockdown_days == [6, 11]
+        branch.run_epidemic(10)
+
+        # у исходного сэмплера ничего не изменилось
+        assert np.array_equal(np.asarray(sampler.node_states), history)
+        assert np.array_equal([info['state'].value for info in sampler.epidemic.node_info.values()], states)
+        # ветвь продолжает общую предысторию
+        assert np.array_equal(np.asarray(branch.node_states)[:6], history)
+        assert len(branch.node_states) == 16
+
+        sampler.run_epidemic(3)
+        assert np.array_equal(np.asarray(branch.node_states)[:6], history)
+        assert len(branch.node_states) == 16
+        assert len(sampler.node_states) == 9
+
+
+def test_multi_comparasion_sampler(graphs):
+    """
+    Ветви с разными окнами локдауна разделяют общую предысторию до начала своего локдауна и совпадают
+    с отдельными сэмплерами, запущенными с тем же состоянием генератора; сэмплер вызывающего не меняется
+    """
+    G, G_home, init_distr = graphs
+    windows, t = [(5, 9), (7, 12), (6, 20)], 12
+
+    for epidemic_class in [EpidemicWithLockdown, ArrayEpidemicWithLockdown]:
+        sampler = run_sampler(epidemic_class(G, init_distr, G_home, 0.3, 0.1, 0.4), seed=4, t=3)
+        history = np.asarray(sampler.node_states).copy()
+        lockdown_days = sampler.lockdown_days.copy()
+
+        np.random.seed(11)
+        multi = MultiComparasionSampler(sampler, windows)
+        assert multi.cur_day == 3
+        multi.run(t)
+        trunk = np.asarray(multi.no_lockdown_sampler.node_states)
+        assert multi.cur_day == 3 + t
+
+        # отдельные сэмплеры с той же предысторией и тем же зерном
+        np.random.seed(11)
+        no_lockdown = sampler.fork((-1, -1))
+        no_lockdown.run_epidemic(t)
+        assert np.array_equal(np.asarray(no_lockdown.node_states), trunk)
+        for window, branch in zip(windows, multi.lockdown_samplers):
+            branch_states = np.asarray(branch.node_states)
+            assert branch.lockdown_days == [window[0] - 1, window[1] - 1]
+            assert np.array_equal(branch_states[:window[0] - 1], trunk[:window[0] - 1])
+
+            np.random.seed(11)
+            independent = sampler.fork(window)
+            independent.run_epidemic(t)
+            assert np.array_equal(np.asarray(independent.node_states), branch_states)
+            assert independent.num_infections == branch.num_infections
+
+        # сэмплер вызывающего не изменился
+        assert sampler.lockdown_days == lockdown_days
+        assert np.array_equal(np.asarray(sampler.node_states), history)
+
+        with pytest.raises(ValueError):
+            MultiComparasionSampler(sampler, [(3, 6)])
+
+
+def test_sweep_lockdown_schedules(graphs):
+    """
+    Размеры и значения итогов перебора расписаний локдауна
+    """
+    G, G_home, init_distr = graphs
+    start_days, durations, t = [3, 6], [2, 4, 30], 10
+
+    factory = functools.partial(ArrayEpidemicWithLockdown, G, init_distr, G_home, 0.3, 0.1, 0.4)
+    result = sweep_lockdown_schedules(factory, start_days, durations, num_replicas=3, t=t, seed=5)
+    for outcome in [result.peak_infected, result.cumulative_infections, result.extinction_time]:
+        assert outcome.shape == (2, 3, 3)
+    assert np.all((result.peak_infected >= 0) & (result.peak_infected <= N))
+    assert np.all(result.cumulative_infections >= 0)
+
+    same_seed = sweep_lockdown_schedules(factory, start_days, durations, num_replicas=3, t=t, seed=5)
+    assert np.array_equal(result.peak_infected, same_seed.peak_infected)
+    assert np.array_equal(result.cumulative_infections, same_seed.cumulative_infections)
+
+    # локдаун после горизонта не меняет траекторию: итог тот же, что у локдауна со дня t + 1,
+    # и основная ветвь не моделируется дальше горизонта
+    late = sweep_lockdown_schedules(factory, [3, t + 1, 40], durations, num_replicas=3, t=t, seed=5)
+    for outcome in [late.peak_infected, late.cumulative_infections, late.extinction_time]:
+        assert np.array_equal(outcome[2], outcome[1], equal_nan=True)
+        assert np.array_equal(outcome[2], outcome[2][[0]].repeat(len(durations), axis=0), equal_nan=True)
+
+    # без заражений (beta = 0) и с выздоровлением за один полушаг больных нет уже после первой итерации
+    factory = functools.partial(ArrayEpidemicWithLockdown, G, init_distr, G_home, 1.0, 0.0, 0.0)
+    result = sweep_lockdown_schedules(factory, start_days, durations, num_replicas=2, t=t, seed=5)
+    assert np.all(result.peak_infected == 0)
+    assert np.all(result.cumulative_infections == 0)
+    assert np.all(result.extinction_time == 1)
@@ -0,0 +1,37 @@
+# Tests
+import networkx as nx
+import numpy as np
+from graphs_generators import random_working_graph
+from graphs_generators import random_working_csr
+from graphs_generators import random_home_graph
+from graphs_generators import random_home_csr
+
+
+def test_random_working_generators():
+    """
+    Генераторы случайного графа дают нужное число различных рёбер без петель
+    """
+    graph = random_working_graph(30, 400)
+    assert graph.number_of_nodes() == 30 and graph.number_of_edges() == 400
+    assert nx.number_of_selfloops(graph) == 0
+
+    weights = random_working_csr(1000, 5000)
+    assert weights.nnz == 10000
+    assert (weights != weights.T).nnz == 0 and weights.diagonal().sum() == 0
+
+
+def test_random_home_generators():
+    """
+    Домашний граф состоит из полных клик размера не более max_click_size, совпадающих с домохозяйствами
+    """
+    graph, households = random_home_graph(40, 4, return_households=True)
+    assert graph.number_of_nodes() == 40
+    for component in nx.connected_components(graph):
+        component = sorted(component)
+        assert len(component) <= 4 and len(set(households[component])) == 1
+        assert graph.subgraph(component).number_of_edges() == len(component) * (len(component) - 1) // 2
+
+    weights, households = random_home_csr(1000, 5, return_households=True)
+    rows, cols = weights.nonzero()
+    assert np.all(households[rows] == households[cols]) and np.all(rows != cols)
+    assert weights.nnz == np.sum(np.bincount(households) * (np.bincount(households) - 1))
@@ -0,0 +1,329 @@
+# Tests
+import networkx as nx
+import numpy as np
+import pytest
+import scipy.sparse as sp
+from SEIRS_lib.models import SEIRSNetworkModel
+from SEIRS_lib.models import ExtSEIRSNetworkModel
+from SEIRS_lib.recorders import TimeSeriesRecorder
+from SEIRS_lib.sim_loops import benchmark_engines
+from SEIRS_lib.ssa_engines import TransmissionTerms
+
+
+def build_tested_model(model_class, graph, seed, **kwargs):
+    """
+    Модель с тестированием, изоляцией (и выходом из неё), повторным заражением и смертями,
+    так что вершины переходят между состояниями в обе стороны
+    """
+    if model_class is SEIRSNetworkModel:
+        return SEIRSNetworkModel(graph, beta=0.6, sigma=0.5, gamma=0.2, xi=0.05, mu_I=0.02, initI=10, seed=seed,
+                                 theta_E=0.05, theta_I=0.1, phi_E=0.2, phi_I=0.2, isolation_time=2, **kwargs)
+
+    return ExtSEIRSNetworkModel(graph, beta=0.6, sigma=0.5, lamda=0.5, gamma=0.2, a=0.3, xi=0.05, eta=0.1, h=0.2,
+                                mu_H=0.02, initE=10, initI_sym=10, seed=seed, theta_E=0.05, theta_pre=0.05,
+                                theta_sym=0.1, theta_asym=0.05, phi_E=0.2, phi_pre=0.2, phi_sym=0.2, phi_asym=0.2,
+                                isolation_time=2, **kwargs)
+
+
+@pytest.mark.parametrize('engine', ['incremental', 'next_reaction', 'rejection'])
+def test_ssa_engine_propensities(engine: str):
+    """
+    Пропенсивности, которые движки моделирования обновляют после каждого события,
+    совпадают с полным пересчётом calc_propensities
+    """
+    graph = nx.barabasi_albert_graph(200, 3, seed=1)
+    model = SEIRSNetworkModel(graph, beta=0.6, sigma=0.5, gamma=0.2, mu_I=0.02, f=0.1, p=0.2, initI=10, seed=2,
+                              theta_E=0.02, theta_I=0.05, phi_E=0.2, phi_I=0.2, engine=engine)
+    model.tmax = 100
+    for _ in range(300):
+        if not model.run_iteration():
+            break
+        ssa_engine = model.ssaEngine
+        propensities, _ = model.calc_propensities()
+        scale_I, scale_Q = ssa_engine.global_rates()
+        incremental = ssa_engine.propensities.copy()
+        incremental[:, 0] += (scale_I * ssa_engine.globalWeight_I + scale_Q * ssa_engine.globalWeight_Q) * (ssa_engine.X == model.S)
+        assert np.allclose(propensities, incremental)
+
+        row_sums = ssa_engine.propensities.sum(axis=1)
+        if engine == 'incremental':
+            assert np.isclose(ssa_engine.localTree.total, row_sums.sum())
+        elif engine == 'next_reaction':
+            assert np.allclose(ssa_engine.reactionRates[:model.numNodes], row_sums)
+            assert np.all(ssa_engine.queue.times[:model.numNodes][row_sums > 0] >= model.t)
+        else:
+            assert np.all(ssa_engine.lowerBounds <= row_sums + 1e-12) and np.all(row_sums <= ssa_engine.upperBounds + 1e-12)
+
+
+def test_benchmark_engines():
+    """
+    Замер скорости возвращает положительное число событий в секунду для каждого движка (по умолчанию - для всех)
+    """
+    graph = nx.barabasi_albert_graph(200, 3, seed=1)
+    events_per_second = benchmark_engines(SEIRSNetworkModel, num_events=50, seed=2, G=graph, beta=0.6, sigma=0.5,
+                                          gamma=0.2, initI=50)
+
+    assert set(events_per_second) == {'direct', 'incremental', 'next_reaction', 'rejection', 'tau_leaping'}
+    assert all(rate > 0 for rate in events_per_second.values())
+
+
+@pytest.mark.parametrize('model_class', [SEIRSNetworkModel, ExtSEIRSNetworkModel])
+def test_tau_leaping_engine(model_class):
+    """
+    При большом числе вершин во всех расходуемых состояниях движок tau-leaping делает шаги, на которых срабатывает
+    много переходов сразу (пустое состояние ограничивает шаг одним событием, см. leap_size);
+    численности остаются неотрицательными и в сумме дают число вершин, а время не выходит за tmax
+    """
+    num_nodes = 3000
+    graph = nx.barabasi_albert_graph(num_nodes, 3, seed=1)
+    if model_class is SEIRSNetworkModel:
+        model = SEIRSNetworkModel(graph, beta=0.3, sigma=0.5, gamma=0.2, initE=500, initI=500, initR=500, seed=3,
+                                  engine='tau_leaping')
+    else:
+        model = ExtSEIRSNetworkModel(graph, beta=0.3, sigma=0.5, lamda=0.5, gamma=0.2, a=0.3, initE=400, initI_pre=400,
+                                     initI_sym=400, initI_asym=400, initR=400, seed=3, engine='tau_leaping')
+    model.tmax = 5
+
+    num_iter, num_changes, max_changes = 0, 0, 0
+    while True:
+        prev_X = model.X.copy()
+        running = model.run_iteration()
+        changes = np.count_nonzero(model.X != prev_X)
+        num_iter += 1
+        num_changes += changes
+        max_changes = max(max_changes, changes)
+
+        counts = np.bincount(model.X.ravel())
+        assert np.all(counts >= 0) and counts.sum() == num_nodes
+        if not running:
+            break
+
+    assert max_changes > 10
+    assert num_changes > 10 * num_iter
+    assert model.t <= model.tmax + 1e-9
+
+
+def test_node_state_index():
+    """
+    Численности и множества вершин индекса состояний совпадают с пересчётом по X после каждого события
+    (в том числе при уходе в изоляцию и выходе из неё, когда состояние вершины уменьшается)
+    """
+    graph = nx.barabasi_albert_graph(300, 3, seed=1)
+    model = SEIRSNetworkModel(graph, beta=0.6, sigma=0.5, gamma=0.2, xi=0.05, mu_I=0.02, initI=20, seed=4,
+                              theta_E=0.05, theta_I=0.1, phi_E=0.2, phi_I=0.2, isolation_time=2)
+    model.tmax = 100
+    num_states = model.Q_I + 1
+    for _ in range(1500):
+        running = model.run_iteration()
+        X = model.X.ravel()
+        assert np.array_equal(model.stateIndex.counts, np.bincount(X, minlength=num_states))
+        for state in range(num_states):
+            assert np.array_equal(np.sort(model.stateIndex.nodes(state)), np.flatnonzero(X == state))
+        if not running:
+            break
+
+
+def test_time_series_recorder_thinning():
+    """
+    С record_every записывается каждое k-е событие, с record_dt - первое событие после каждого кратного dt;
+    строки из разных блоков собираются в один массив только для чтения
+    """
+    recorder = TimeSeriesRecorder([('t', float)], chunk_size=4, record_every=3)
+    for i in range(1, 21):
+        if recorder.due(i):
+            recorder.record({'t': i})
+    assert list(recorder.to_array()['t']) == [3, 6, 9, 12, 15, 18]
+    with pytest.raises(ValueError):
+        recorder.to_array()['t'][0] = 0
+
+    recorder = TimeSeriesRecorder([('t', float)], chunk_size=4, record_dt=1.0)
+    for t in [0.3, 0.9, 1.2, 1.5, 3.7, 3.9, 4.0, 6.5]:
+        if recorder.due(t):
+            recorder.record({'t': t})
+    assert list(recorder.to_array()['t']) == [1.2, 3.7, 4.0, 6.5]
+
+
+@pytest.mark.parametrize('thinning', [{'record_every': 10}, {'record_dt': 0.7}])
+def test_finalize_data_series(thinning):
+    """
+    При прореживании записей последнее состояние всё равно попадает в ряды (finalize_data_series),
+    а ряды групп вершин заполняются в конце прогона и согласованы с общими рядами
+    """
+    graph = nx.barabasi_albert_graph(300, 3, seed=1)
+    node_groups = {'first': list(range(100)), 'second': list(range(100, 300))}
+    model = SEIRSNetworkModel(graph, beta=0.6, sigma=0.5, gamma=0.2, initI=20, seed=5, node_groups=node_groups,
+                              **thinning)
+    model.run(T=30, verbose=False)
+
+    # последнее событие прореживание пропустило, его строку добавил finalize_data_series
+    if 'record_every' in thinning:
+        assert model.timeSeries.numEvents % 10 != 0
+        assert len(model.tseries) == 2 + model.timeSeries.numEvents // 10
+    else:
+        steps = np.floor(model.tseries / 0.7)
+        assert np.all(np.diff(steps[:-1]) > 0) and steps[-1] == steps[-2]
+
+    X = model.X.ravel()
+    assert model.tseries[-1] == model.t
+    assert model.numS[-1] == np.count_nonzero(X == model.S) and model.numI[-1] == np.count_nonzero(X == model.I)
+    assert model.numR[-1] == np.count_nonzero(X == model.R)
+
+    for name in ['numS', 'numE', 'numI', 'numR']:
+        group_sum = model.nodeGroupData['first'][name] + model.nodeGroupData['second'][name]
+        assert len(group_sum) == len(model.tseries) and np.array_equal(group_sum, getattr(model, name))
+
+
+def test_data_series_attributes():
+    """
+    Во время прогона ряды модели - представления записанных строк только для чтения, которые дописываются
+    без пересборки; после прогона - обычные массивы, которые можно менять и переприсваивать
+    """
+    graph = nx.barabasi_albert_graph(200, 3, seed=1)
+    model = SEIRSNetworkModel(graph, beta=0.6, sigma=0.5, gamma=0.2, initI=10, seed=5, series_chunk_size=16)
+    model.tmax = 100
+    num_infected = [model.numI[model.tidx]]
+    for _ in range(100):
+        model.run_iteration()
+        num_infected.append(model.numI[model.tidx])
+        assert model.numI[model.tidx] == model.stateIndex.count(model.I)
+    assert np.array_equal(model.numI, num_infected)
+    with pytest.raises(ValueError):
+        model.numI[0] = 0
+    # выгрузка растёт удвоением, без копирования всех строк на каждом чтении
+    assert model.timeSeries.exported.shape[0] < 2 * len(model.timeSeries)
+
+    model.run(T=20, verbose=False)
+    assert 'numI' in model.__dict__ and model.numI.flags.writeable
+    assert np.array_equal(model.numI, model.data_series()['numI'])
+    model.numI[0] = -1
+    model.numS = model.numS / model.numNodes
+    assert model.numI[0] == -1 and np.all(model.numS <= 1)
+
+    # следующий прогон снова читает записанные ряды
+    model.run(T=5, verbose=False)
+    assert len(model.numI) == len(model.tseries) == len(model.timeSeries) and model.numI[0] == num_infected[0]
+
+
+@pytest.mark.parametrize('model_class', [SEIRSNetworkModel, ExtSEIRSNetworkModel])
+def test_xseries_log(model_class):
+    """
+    Журнал изменений Xseries восстанавливает те же состояния, что и полная запись X после каждого события:
+    по номеру записи, срезом, целиком и по моменту времени
+    """
+    graph = nx.barabasi_albert_graph(100, 3, seed=1)
+    model = build_tested_model(model_class, graph, seed=6, store_Xseries=True)
+    model.tmax = 100
+    dense_X, times = [model.X.ravel().copy()], [model.t]
+    for _ in range(800):
+        running = model.run_iteration()
+        dense_X.append(model.X.ravel().copy())
+        times.append(model.t)
+        if not running:
+            break
+    dense_X = np.array(dense_X)
+
+    # хватает изменений на несколько опорных кадров
+    assert len(model.Xseries.keyframes) > 3
+    assert model.Xseries.shape == dense_X.shape
+    assert np.array_equal(np.array(model.Xseries), dense_X)
+    assert np.array_equal(model.Xseries[::-7], dense_X[::-7])
+    for i in [0, 1, len(dense_X) // 2, len(dense_X) - 1]:
+        assert np.array_equal(model.Xseries[i], dense_X[i])
+        assert np.array_equal(model.Xseries.state_at(times[i]), dense_X[i])
+
+
+@pytest.mark.parametrize('model_class', [SEIRSNetworkModel, ExtSEIRSNetworkModel])
+def test_node_group_counts(model_class):
+    """
+    Численности групп вершин по состояниям, а также числа протестированных и положительных в группах
+    совпадают с пересчётом по X и флагам вершин после каждого события
+    """
+    graph = nx.barabasi_albert_graph(300, 3, seed=1)
+    rng = np.random.RandomState(8)
+    groups = np.array_split(rng.permutation(300)[:250], 3)
+    node_groups = {'group_' + str(i): list(group) for i, group in enumerate(groups)}
+    model = build_tested_model(model_class, graph, seed=7, node_groups=node_groups)
+    model.tmax = 100
+    counts = model.nodeGroupCounts
+    num_states = counts.stateCounts.shape[1]
+    for _ in range(800):
+        running = model.run_iteration()
+        node = rng.randint(300)
+        model.set_tested(node, not model.tested[node, 0])
+        model.set_positive(node, rng.rand() < 0.5)
+
+        X = model.X.ravel()
+        for group_idx, group in enumerate(groups):
+            assert np.array_equal(counts.stateCounts[group_idx], np.bincount(X[group], minlength=num_states))
+            assert counts.numTested[group_idx] == np.count_nonzero(model.tested[group])
+            assert counts.numPositive[group_idx] == np.count_nonzero(model.positive[group])
+        if not running:
+            break
+
+
+def test_transmission_terms():
+    """
+    Слагаемые передачи, которые обновляются при каждой смене состояния (без периодического пересчёта),
+    совпадают со свежим произведением A @ (X in states) после многих смен, а без заразных соседей равны нулю точно
+    """
+    num_nodes, num_states = 400, 5
+    rng = np.random.RandomState(9)
+    matrix = sp.random(num_nodes, num_nodes, density=0.02, random_state=rng, format='csr')
+    X = rng.randint(num_states, size=num_nodes)
+    states = {'odd': [1, 3], 'last': [4]}
+    terms = TransmissionTerms(X, {name: (matrix, infectious) for name, infectious in states.items()}, num_states,
+                              rebuild_interval=10 ** 9)
+
+    for move in range(1, 20001):
+        node, new_state = rng.randint(num_nodes), rng.randint(num_states)
+        old_state, X[node] = X[node], new_state
+        terms.move(node, old_state, new_state, X)
+        if move % 1000 == 0:
+            for name, infectious in states.items():
+                fresh = matrix.dot(np.isin(X, infectious).astype(float)).reshape(num_nodes, 1)
+                assert np.allclose(terms[name], fresh, rtol=0, atol=1e-10)
+                assert np.all(terms[name][fresh == 0] == 0)
+    assert terms.numUpdates > 10000
+
+
+def expected_transmission_terms(model):
+    """
+    Слагаемые передачи, посчитанные заново по X: {имя -> A @ (X in states)}
+    """
+    X = model.X.ravel()
+    if isinstance(model, SEIRSNetworkModel):
+        terms = {'I': (model.A_deltabeta, [model.I]), 'Q': (model.A_Q_deltabeta_Q, [model.Q_I])}
+    else:
+        terms = {'Q': (model.A_Q_deltabeta_Q, [model.Q_pre, model.Q_sym, model.Q_asym]),
+                 'IQ': (model.A_Q_deltabeta_Q, [model.I_pre, model.I_sym, model.I_asym])}
+        if model.A_deltabeta_asym is not None:
+            terms['sym'] = (model.A_deltabeta, [model.I_sym])
+            terms['asym'] = (model.A_deltabeta_asym, [model.I_pre, model.I_asym])
+        else:
+            terms['I'] = (model.A_deltabeta, [model.I_pre, model.I_sym, model.I_asym])
+
+    return {name: matrix.dot(np.isin(X, states).astype(float)).reshape(-1, 1) for name, (matrix, states) in terms.items()}
+
+
+@pytest.mark.parametrize('model_class, params', [(SEIRSNetworkModel, {}), (ExtSEIRSNetworkModel, {}),
+                                                 (ExtSEIRSNetworkModel, {'beta_asym_local': 0.3})])
+def test_model_transmission_terms(model_class, params):
+    """
+    Слагаемые передачи модели (у расширенной модели - для изолированных, для контактов с изолированными
+    и отдельно для симптоматических и бессимптомных) совпадают со свежим произведением после каждого события;
+    периодический пересчёт отключён, так что проверяются только обновления при сменах состояний
+    """
+    graph = nx.barabasi_albert_graph(300, 3, seed=1)
+    model = build_tested_model(model_class, graph, seed=10, **params)
+    model.tmax = 100
+    model.run_iteration()
+    model.transmissionTerms.rebuildInterval = 10 ** 9
+    for _ in range(1500):
+        running = model.run_iteration()
+        expected = expected_transmission_terms(model)
+        assert set(model.transmissionTerms.matrices) == set(expected)
+        for name, fresh in expected.items():
+            assert np.allclose(model.transmissionTerms[name], fresh, rtol=0, atol=1e-10)
+        if not running:
+            break
+    assert model.transmissionTerms.numUpdates > 200
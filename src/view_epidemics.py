@@ -34,15 +34,8 @@ class ViewEpidemic:
         :param node_type: тип искомых вершин (S, I, R)
         :return:
         """
-        ans_ar = np.array(self.sampler.node_states, dtype=int)
-        for i in range(len(self.sampler.node_states)):
-            flag_func = np.vectorize(lambda x: x if x == node_type.value else 0)
-            ans_ar[i] = flag_func(ans_ar[i])
-
-        # вычисляем кол-во вершин искомого класса на каждой итерации
-        ans = ans_ar.sum(axis=1) / node_type.value
-
-        return ans
+        # кол-ва вершин по классам ведутся сэмплером на каждой итерации
+        return self.sampler.node_states.num_of_nodes(node_type)
 
     def plot_numerical_dynamics(self) -> plt.Figure:
         """
@@ -101,11 +94,12 @@ class ViewEpidemic:
 
     def visualize_current_state(self):
         cur_graph = self.sampler.epidemic.contact_graph
+        node_info = self.sampler.epidemic.node_info
         # массив цветов для раскраски вершин
         color_states = []
 
-        for node_num, node_info in cur_graph.nodes.data():
-            color_states.append(self._get_node_color(node_info['state']))
+        for node_num in cur_graph.nodes:
+            color_states.append(self._get_node_color(node_info[node_num]['state']))
 
         # заголовок рисунка
         cur_step = len(self.sampler.node_states) - 1
@@ -151,11 +145,12 @@ class ViewComparasion:
         :return:
         """
         cur_graph = sampler_from.epidemic.contact_graph
+        node_info = sampler_from.epidemic.node_info
         # массив цветов для раскраски вершин
         color_states = []
 
-        for node_num, node_info in cur_graph.nodes.data():
-            color_states.append(self._get_node_color(node_info['state']))
+        for node_num in cur_graph.nodes:
+            color_states.append(self._get_node_color(node_info[node_num]['state']))
 
         # заголовок рисунка
         cur_step = len(sampler_from.node_states) - 1